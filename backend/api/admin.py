@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Dataset, EquipmentRecord
+from .models import Dataset, EquipmentRecord, IngestJob, RetentionPolicy
+from .search import MIN_QUERY_LENGTH, matching_entries
 
 
 @admin.register(Dataset)
@@ -14,3 +15,23 @@ class EquipmentRecordAdmin(admin.ModelAdmin):
     list_display = ['equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature', 'dataset']
     list_filter = ['equipment_type', 'dataset']
     search_fields = ['equipment_name', 'equipment_type']
+
+    def get_search_results(self, request, queryset, search_term):
+        """Look names and types up in the search index instead of scanning the table"""
+        if len(search_term.strip()) < MIN_QUERY_LENGTH:
+            return super().get_search_results(request, queryset, search_term)
+        entries = matching_entries(search_term.strip()).filter(dataset__storage='database')
+        return queryset.filter(id__in=entries.values('record_id')), False
+
+
+@admin.register(IngestJob)
+class IngestJobAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'user', 'state', 'rows_processed', 'created_at', 'finished_at']
+    list_filter = ['state']
+    search_fields = ['filename', 'user__username']
+
+
+@admin.register(RetentionPolicy)
+class RetentionPolicyAdmin(admin.ModelAdmin):
+    list_display = ['user', 'max_datasets', 'max_age_days', 'max_rows']
+    search_fields = ['user__username']
@@ -0,0 +1,252 @@
+"""
+Group-by aggregation of dataset records.
+
+Records of datasets stored in the database are aggregated by a single
+values().annotate() query, which asks only for the SQL aggregates the
+requested metrics need. Columnar datasets are aggregated with a pandas
+groupby over the columns involved. Partial results for the same group
+(one group spanning datasets of both kinds) are merged exactly: counts,
+sums, minima and maxima directly, means and sums of squared deviations
+(m2) with the parallel form of Welford's algorithm, as in api.stats.
+
+SQLite has no native variance (Django evaluates it in Python, row by
+row), so there m2 comes from a second aggregate query summing the
+squared deviations from each group's mean. A sum of squares minus
+n * mean**2 would take one query, but cancels catastrophically when the
+spread is small next to the mean.
+
+The result is nested one level per group-by key, in the order given,
+with JSON-safe (string) keys:
+
+    {'Pump': {'count': 4, 'flowrate': {'avg': ..., 'stddev': ...}, ...}}
+"""
+import math
+
+from django.db import connection
+from django.db.models import Avg, Case, Count, F, FloatField, Max, Min, Q, Sum, Value, Variance, When
+import pandas as pd
+
+from .models import EquipmentRecord
+from .parsing import NUMERIC_FIELDS
+from .storage import get_store
+
+# group-by key -> EquipmentRecord field
+GROUP_BY_FIELDS = {
+    'equipment_type': 'equipment_type',
+    'dataset': 'dataset_id',
+}
+
+METRICS = ['count', 'avg', 'min', 'max', 'stddev', 'sum']
+
+# Partial values each metric needs to be computed and merged
+METRIC_PARTS = {
+    'avg': ['n', 'mean'],
+    'min': ['min'],
+    'max': ['max'],
+    'stddev': ['n', 'mean', 'm2'],
+    'sum': ['sum'],
+}
+
+# Partial value -> pandas aggregation (m2 is derived from the sample variance)
+FRAME_AGGREGATES = {'n': 'count', 'mean': 'mean', 'm2': 'var', 'min': 'min', 'max': 'max', 'sum': 'sum'}
+
+
+def _parts(metrics):
+    return sorted({part for metric in metrics for part in METRIC_PARTS.get(metric, [])})
+
+
+def _database_partials(dataset_ids, keys, metrics, fields):
+    """{group tuple: partial} from one aggregate query over the EquipmentRecord table"""
+    parts = _parts(metrics)
+    annotations = {'count': Count('id')}
+    for field in fields:
+        if 'n' in parts:
+            annotations[f'{field}__n'] = Count(field)
+        if 'mean' in parts:
+            annotations[f'{field}__mean'] = Avg(field)
+        if 'm2' in parts and connection.vendor != 'sqlite':
+            annotations[f'{field}__var'] = Variance(field, sample=True)
+        if 'min' in parts:
+            annotations[f'{field}__min'] = Min(field)
+        if 'max' in parts:
+            annotations[f'{field}__max'] = Max(field)
+        if 'sum' in parts:
+            annotations[f'{field}__sum'] = Sum(field)
+
+    records = EquipmentRecord.objects.filter(dataset_id__in=dataset_ids)
+    columns = [GROUP_BY_FIELDS[key] for key in keys]
+    if columns:
+        rows = records.values(*columns).annotate(**annotations).order_by()
+    else:
+        rows = [records.aggregate(**annotations)]
+
+    partials = {}
+    for row in rows:
+        partial = {'count': row['count']}
+        for field in fields:
+            values = {part: row.get(f'{field}__{part}') for part in parts if part != 'm2'}
+            if 'm2' in parts and f'{field}__var' in row:
+                var = row[f'{field}__var']
+                values['m2'] = var * (values['n'] - 1) if var is not None else 0.0
+            partial[field] = values
+        partials[tuple(row[column] for column in columns)] = partial
+
+    if 'm2' in parts and connection.vendor == 'sqlite':
+        _add_deviations(records, columns, fields, partials)
+    return partials
+
+
+def _add_deviations(records, columns, fields, partials):
+    """Set m2 in `partials` from a second query summing squared deviations from each group's mean"""
+    annotations = {}
+    for field in fields:
+        means = {group: partial[field]['mean'] for group, partial in partials.items()
+                 if partial[field]['mean'] is not None}
+        if not means:
+            continue
+        if columns:
+            mean = Case(*[When(Q(**dict(zip(columns, group))), then=Value(value)) for group, value in means.items()],
+                        output_field=FloatField())
+        else:
+            mean = Value(means[()], output_field=FloatField())
+        # A product rather than **2: SQLite's POWER is a Python function called per row
+        annotations[f'{field}__m2'] = Sum((F(field) - mean) * (F(field) - mean))
+
+    if columns:
+        rows = records.values(*columns).annotate(**annotations).order_by() if annotations else []
+    else:
+        rows = [records.aggregate(**annotations)] if annotations else []
+    for row in rows:
+        partial = partials[tuple(row[column] for column in columns)]
+        for field in fields:
+            partial[field]['m2'] = row.get(f'{field}__m2') or 0.0
+    for partial in partials.values():
+        for field in fields:
+            partial[field].setdefault('m2', 0.0)
+
+
+def _frame_partials(frame, keys, metrics, fields):
+    """{group tuple: partial} of a record frame, with the same parts as _database_partials"""
+    parts = _parts(metrics)
+    if frame.empty:
+        return {}
+    columns = [GROUP_BY_FIELDS[key] for key in keys]
+    grouped = frame.groupby(columns, sort=False, observed=True) if columns else None
+
+    def agg(how):
+        return grouped[fields].agg(how) if grouped is not None else frame[fields].agg(how).to_frame().T
+
+    stats = {part: agg(FRAME_AGGREGATES[part]) for part in parts}
+    counts = grouped.size() if grouped is not None else pd.Series([len(frame)])
+
+    partials = {}
+    for position, group in enumerate(counts.index):
+        partial = {'count': int(counts.iloc[position])}
+        for field in fields:
+            values = {}
+            for part in parts:
+                value = stats[part][field].iloc[position]
+                if part == 'n':
+                    value = int(value)
+                elif part == 'm2':
+                    # var is NaN for fewer than two values; their m2 is 0
+                    n = int(stats['n'][field].iloc[position])
+                    value = float(value) * (n - 1) if n > 1 else 0.0
+                else:
+                    value = None if pd.isna(value) else float(value)
+                values[part] = value
+            partial[field] = values
+        key = group if isinstance(group, tuple) else (group,)
+        partials[key if columns else ()] = partial
+    return partials
+
+
+def _merge_values(a, b):
+    merged = {}
+    if 'n' in a:
+        merged['n'] = a['n'] + b['n']
+    if 'sum' in a:
+        merged['sum'] = a['sum'] if b['sum'] is None else (b['sum'] if a['sum'] is None else a['sum'] + b['sum'])
+    if 'min' in a:
+        merged['min'] = min((v for v in (a['min'], b['min']) if v is not None), default=None)
+    if 'max' in a:
+        merged['max'] = max((v for v in (a['max'], b['max']) if v is not None), default=None)
+    if 'mean' in a:
+        if not b['n']:
+            merged['mean'], m2 = a['mean'], a.get('m2')
+        elif not a['n']:
+            merged['mean'], m2 = b['mean'], b.get('m2')
+        else:
+            delta = b['mean'] - a['mean']
+            merged['mean'] = a['mean'] + delta * b['n'] / merged['n']
+            m2 = a.get('m2', 0.0) + b.get('m2', 0.0) + delta * delta * a['n'] * b['n'] / merged['n']
+        if 'm2' in a:
+            merged['m2'] = m2
+    return merged
+
+
+def _merge(partials, more):
+    for group, partial in more.items():
+        if group not in partials:
+            partials[group] = partial
+            continue
+        current = partials[group]
+        current['count'] += partial['count']
+        for field, values in partial.items():
+            if field != 'count':
+                current[field] = _merge_values(current[field], values)
+
+
+def _finish(partial, metrics, fields):
+    result = {}
+    if 'count' in metrics:
+        result['count'] = partial['count']
+    for field in fields:
+        values = partial[field]
+        out = {}
+        for metric in metrics:
+            if metric == 'avg':
+                out['avg'] = values['mean'] if values['n'] else None
+            elif metric == 'stddev':
+                out['stddev'] = math.sqrt(values['m2'] / (values['n'] - 1)) if values['n'] > 1 else None
+            elif metric != 'count':
+                out[metric] = values[metric]
+        if out:
+            result[field] = out
+    return result
+
+
+def aggregate_datasets(datasets, group_by=(), metrics=METRICS, fields=NUMERIC_FIELDS):
+    """
+    Aggregate the records of `datasets` grouped by the `group_by` keys
+    (see GROUP_BY_FIELDS), computing `metrics` (see METRICS) of the numeric
+    `fields`. Returns the nested dict described in the module docstring;
+    with no group-by keys, the metrics of all the records.
+    """
+    group_by, metrics, fields = list(group_by), list(metrics), list(fields)
+    partials = {}
+
+    database_ids = [dataset.id for dataset in datasets if dataset.storage == 'database']
+    if database_ids:
+        _merge(partials, _database_partials(database_ids, group_by, metrics, fields))
+
+    columns = ['equipment_type'] + fields if 'equipment_type' in group_by else fields
+    for dataset in datasets:
+        if dataset.storage == 'database':
+            continue
+        frame = get_store(dataset).read_frame(dataset, columns)
+        frame['dataset_id'] = dataset.id
+        _merge(partials, _frame_partials(frame, group_by, metrics, fields))
+
+    if not group_by:
+        empty = {'count': 0, **{field: {'n': 0, 'mean': None, 'm2': 0.0, 'min': None, 'max': None, 'sum': None}
+                                for field in fields}}
+        return _finish(partials.get((), empty), metrics, fields)
+
+    groups = {}
+    for group in sorted(partials, key=lambda g: tuple(map(str, g))):
+        level = groups
+        for value in group[:-1]:
+            level = level.setdefault(str(value), {})
+        level[str(group[-1])] = _finish(partials[group], metrics, fields)
+    return groups
@@ -0,0 +1,247 @@
+"""
+Batch ingestion of several CSV files, or of .zip / .tar.gz archives of them.
+
+Batches run as background ingest jobs (see api.jobs). Members are
+unpacked to a scratch directory, hashed while they are copied, then
+parsed and validated in parallel on a process pool. The record frames
+are inserted by the job, each as its own Dataset or all merged into one.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import hashlib
+import multiprocessing
+import os
+import tarfile
+import threading
+import zipfile
+
+from django.conf import settings
+from django.db import transaction
+
+from .ingest import RunningStats, SUMMARY_FIELDS
+from .models import Dataset
+from .parsing import IngestError, parse_engine
+from .storage import get_store
+from .validation import ValidationFailed, ValidationReport, parse_and_validate, validation_mode
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar.gz', '.tgz', '.tar')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the web process runs ingest threads.
+            # Tasks only use api.parsing and api.validation, so workers never need django.setup().
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.BATCH_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _discard_pool(pool):
+    """Drop a broken pool so that the next _get_pool() starts a new one"""
+    global _pool
+    with _pool_lock:
+        # Another thread may already have replaced it
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _pool_results(fn, arg_lists):
+    """
+    Call fn(*args) for each of `arg_lists` on the process pool and yield
+    (result, exception) pairs in order. A pool broken by a dead worker
+    process is replaced once and the calls not yet answered are resubmitted.
+    """
+    pending = list(arg_lists)
+    retried = False
+    while pending:
+        pool = _get_pool()
+        try:
+            futures = [pool.submit(fn, *args) for args in pending]
+            for future in futures:
+                try:
+                    outcome = future.result(), None
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    outcome = None, e
+                pending.pop(0)
+                yield outcome
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            if retried:
+                raise
+            retried = True
+
+
+class Member:
+    """One CSV file of a batch, unpacked to disk"""
+
+    def __init__(self, name, path, content_hash):
+        self.name = name
+        self.path = path
+        self.content_hash = content_hash
+
+
+def _copy_hashed(src, dest_path, max_bytes):
+    """Copy `src` to `dest_path` and return (SHA-256, size); None past `max_bytes`"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(dest_path, 'wb') as dest:
+        # Sizes declared in archive headers can lie: count what is actually read
+        for block in iter(lambda: src.read(min(1 << 20, max_bytes - size + 1)), b''):
+            size += len(block)
+            if size > max_bytes:
+                return None
+            digest.update(block)
+            dest.write(block)
+    return digest.hexdigest(), size
+
+
+def _is_csv_member(name):
+    base = os.path.basename(name)
+    return name.endswith('.csv') and not base.startswith('.') and '__MACOSX' not in name
+
+
+def _too_many_entries(uploaded_file):
+    return IngestError(f'{uploaded_file.name} has more than {settings.BATCH_UPLOAD_MAX_ENTRIES} entries')
+
+
+def _archive_entries(uploaded_file):
+    """Yield (name, declared size, file object) for the CSV members of an archive"""
+    if uploaded_file.name.endswith('.zip'):
+        with zipfile.ZipFile(uploaded_file) as archive:
+            infos = archive.infolist()
+            if len(infos) > settings.BATCH_UPLOAD_MAX_ENTRIES:
+                raise _too_many_entries(uploaded_file)
+            for info in infos:
+                if not info.is_dir() and _is_csv_member(info.filename):
+                    with archive.open(info) as member:
+                        yield info.filename, info.file_size, member
+    else:
+        with tarfile.open(fileobj=uploaded_file, mode='r:*') as archive:
+            for count, info in enumerate(archive, 1):
+                if count > settings.BATCH_UPLOAD_MAX_ENTRIES:
+                    raise _too_many_entries(uploaded_file)
+                if info.isfile() and _is_csv_member(info.name):
+                    yield info.name, info.size, archive.extractfile(info)
+
+
+def extract_members(uploaded_files, workdir):
+    """
+    Unpack every CSV in `uploaded_files` (plain files or archives) into
+    `workdir`. Member paths are never used on disk, so archive entries
+    cannot escape the directory. The BATCH_UPLOAD_MAX_* limits are checked
+    against the sizes archives declare and again while copying.
+    """
+    max_file_bytes = settings.BATCH_UPLOAD_MAX_FILE_BYTES
+    total_left = settings.BATCH_UPLOAD_MAX_TOTAL_BYTES
+    members = []
+    for uploaded_file in uploaded_files:
+        if uploaded_file.name.endswith(ARCHIVE_SUFFIXES):
+            entries = _archive_entries(uploaded_file)
+        elif uploaded_file.name.endswith('.csv'):
+            entries = [(uploaded_file.name, uploaded_file.size, uploaded_file)]
+        else:
+            raise IngestError(f'Unsupported file type: {uploaded_file.name}')
+
+        for name, declared_size, src in entries:
+            if len(members) >= settings.BATCH_UPLOAD_MAX_FILES:
+                raise IngestError(f'A batch may contain at most {settings.BATCH_UPLOAD_MAX_FILES} CSV files')
+            if declared_size > max_file_bytes:
+                raise IngestError(f'{name} is larger than {max_file_bytes} bytes uncompressed')
+            if declared_size > total_left:
+                raise IngestError(f'The batch is larger than {settings.BATCH_UPLOAD_MAX_TOTAL_BYTES} bytes uncompressed')
+            path = os.path.join(workdir, f'{len(members)}.csv')
+            copied = _copy_hashed(src, path, min(max_file_bytes, total_left))
+            if copied is None:
+                raise IngestError(f'{name} exceeds the uncompressed size limits of a batch')
+            content_hash, size = copied
+            total_left -= size
+            members.append(Member(name, path, content_hash))
+    return members
+
+
+def ingest_batch(user, members, merged=None, mode=None, progress=None):
+    """
+    Parse and validate `members` on the process pool and insert them.
+
+    Each member becomes its own dataset, or with `merged` (a dataset that
+    is not ready yet) they are all loaded into that one, which is made
+    ready at the end or deleted if nothing could be loaded. `progress`, if
+    given, is called with the number of rows inserted so far.
+
+    Returns (datasets, report) where report has one entry per member with
+    its status: 'created', 'merged', 'duplicate' or 'error' (the job marks
+    the files whose datasets retention removed 'pruned'), and the
+    validation report of any rows rejected or dropped.
+    """
+    report = []
+    datasets = []
+    merged_stats = RunningStats()
+    mode = validation_mode(mode)
+
+    # Identical files the user already has (validated the same way) are neither parsed nor stored
+    to_parse = []
+    for member in members:
+        existing = None if merged is not None else Dataset.objects.filter(
+            user=user, content_hash=member.content_hash, validation_mode=mode).first()
+        if existing is not None:
+            report.append({'filename': member.name, 'status': 'duplicate', 'dataset_id': existing.id,
+                           'rows': existing.total_count})
+        else:
+            to_parse.append(member)
+
+    engine = parse_engine()
+    tasks = [(member.path, engine, mode, settings.INGEST_VALUE_BOUNDS, settings.INGEST_MAX_REPORTED_ERRORS)
+             for member in to_parse]
+    rows = 0
+    for member, (result, error) in zip(to_parse, _pool_results(parse_and_validate, tasks)):
+        validation = ValidationReport()
+        try:
+            if error is not None:
+                raise error
+            frame, validation = result
+            if frame is None or (validation and frame.empty):
+                raise ValidationFailed(validation)
+            with transaction.atomic():
+                if merged is not None:
+                    dataset, stats = merged, merged_stats
+                else:
+                    dataset = Dataset.objects.create(user=user, filename=os.path.basename(member.name),
+                                                     content_hash=member.content_hash, validation_mode=mode)
+                    stats = RunningStats()
+                get_store(dataset).append(dataset, frame)
+                stats.update(frame)
+                stats.apply(dataset)
+                dataset.save(update_fields=SUMMARY_FIELDS)
+        except Exception as e:
+            message = str(e) if isinstance(e, IngestError) else f'Error processing file: {str(e)}'
+            entry = {'filename': member.name, 'status': 'error', 'error': message}
+        else:
+            if merged is None:
+                datasets.append(dataset)
+            entry = {'filename': member.name, 'status': 'merged' if merged is not None else 'created',
+                     'dataset_id': dataset.id, 'rows': len(frame)}
+            rows += len(frame)
+            if progress is not None:
+                progress(rows)
+        if validation:
+            entry['validation'] = validation.to_json()
+        report.append(entry)
+
+    if merged is not None:
+        if merged_stats.count:
+            merged.ready = True
+            merged.save(update_fields=['ready'])
+            datasets.append(merged)
+        else:
+            merged.delete()
+    return datasets, report
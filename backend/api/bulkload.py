@@ -0,0 +1,115 @@
+"""
+Bulk loading of equipment records straight from DataFrame columns.
+
+No EquipmentRecord instances are created. On PostgreSQL rows are streamed
+with COPY FROM STDIN; on SQLite they are inserted with batched
+executemany. Any other backend falls back to the ORM's bulk_create.
+"""
+import io
+
+from django.conf import settings
+from django.db import connection
+
+from .models import EquipmentRecord
+
+
+# Order of the columns in the frames handed to load_records()
+RECORD_FIELDS = ['equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature']
+
+
+def _columns():
+    """Database table and column names for EquipmentRecord"""
+    meta = EquipmentRecord._meta
+    columns = [meta.get_field('dataset').column] + [meta.get_field(f).column for f in RECORD_FIELDS]
+    return meta.db_table, columns
+
+
+def _raw_cursor(cursor):
+    """Unwrap Django's (debug) cursor wrapper to get the DB-API cursor"""
+    while hasattr(cursor, 'cursor'):
+        cursor = cursor.cursor
+    return cursor
+
+
+def _supports_copy():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        raw = _raw_cursor(cursor)
+        # psycopg2 exposes copy_expert(), psycopg 3 exposes copy()
+        return hasattr(raw, 'copy_expert') or hasattr(raw, 'copy')
+
+
+def _copy_from_stdin(dataset_id, frame):
+    table, columns = _columns()
+    quoted = [connection.ops.quote_name(c) for c in columns]
+    out = frame[RECORD_FIELDS].copy()
+    out.insert(0, 'dataset_id', dataset_id)
+    buffer = io.StringIO()
+    out.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    # FORCE_NOT_NULL keeps empty names as '' instead of NULL
+    sql = (
+        f"COPY {connection.ops.quote_name(table)} ({', '.join(quoted)}) FROM STDIN "
+        f"WITH (FORMAT csv, FORCE_NOT_NULL ({quoted[1]}, {quoted[2]}))"
+    )
+
+    with connection.cursor() as cursor:
+        raw = _raw_cursor(cursor)
+        if hasattr(raw, 'copy_expert'):
+            raw.copy_expert(sql, buffer)
+        else:
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def _executemany(dataset_id, frame, batch_size):
+    table, columns = _columns()
+    placeholders = ', '.join(['%s'] * len(columns))
+    sql = (
+        f"INSERT INTO {connection.ops.quote_name(table)} "
+        f"({', '.join(connection.ops.quote_name(c) for c in columns)}) VALUES ({placeholders})"
+    )
+    values = [frame[field].tolist() for field in RECORD_FIELDS]
+    rows = list(zip([dataset_id] * len(frame), *values))
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+
+
+def _bulk_create(dataset_id, frame, batch_size):
+    values = [frame[field].tolist() for field in RECORD_FIELDS]
+    records = [
+        EquipmentRecord(dataset_id=dataset_id, **dict(zip(RECORD_FIELDS, row)))
+        for row in zip(*values)
+    ]
+    EquipmentRecord.objects.bulk_create(records, batch_size=batch_size)
+
+
+def load_method():
+    """Name of the load path used for the current database connection"""
+    if _supports_copy():
+        return 'copy'
+    if connection.vendor == 'sqlite':
+        return 'executemany'
+    return 'bulk_create'
+
+
+def load_records(dataset_id, frame, method=None):
+    """
+    Insert every row of `frame` as an EquipmentRecord of `dataset_id`.
+
+    `frame` must have the RECORD_FIELDS columns with their final types
+    (strings for name and type, floats for the measurements).
+    """
+    if frame.empty:
+        return
+    method = method or load_method()
+    batch_size = settings.BULK_LOAD_BATCH_SIZE
+    if method == 'copy':
+        _copy_from_stdin(dataset_id, frame)
+    elif method == 'executemany':
+        _executemany(dataset_id, frame, batch_size)
+    else:
+        _bulk_create(dataset_id, frame, batch_size)
@@ -0,0 +1,150 @@
+"""
+Comparison of two datasets, a (before) and b (after).
+
+Deltas are always b - a. Type counts and parameter means and standard
+deviations come from the aggregates stored on each dataset, so they read
+no records.
+
+Records are paired on equipment_name: each record of a with the first
+record of b (lowest id) of the same name. When both datasets are stored
+in the database, a page of pairs is one query: the records of a in id
+order, each joined to its partner in b by correlated subqueries on the
+(dataset, equipment_name) index. Otherwise both name columns are read
+and coded by one pandas factorize, and the pairs are whole-array lookups
+of those integer codes. Either way pages are keyed by the id of the
+record of a.
+
+The matched and unmatched counts need the whole join. The factorize
+yields them anyway; the database counts are kept in the Django cache under both
+datasets' content versions.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Subquery
+import numpy as np
+import pandas as pd
+
+from .conditional import dataset_cache_key
+from .ingest import RunningStats
+from .models import EquipmentRecord
+from .parsing import NUMERIC_FIELDS
+from .storage import get_store
+
+# Record fields compared for each pair, after the name
+PAIR_FIELDS = ['equipment_type'] + NUMERIC_FIELDS
+
+# Columns of a page of pairs: a_<field> and b_<field> for each PAIR_FIELDS field
+PAIR_COLUMNS = ['a_id', 'b_id', 'equipment_name'] + [
+    f'{side}_{field}' for field in PAIR_FIELDS for side in ('a', 'b')
+]
+
+
+def _delta(a, b):
+    return b - a if a is not None and b is not None else None
+
+
+def compare_summaries(a, b):
+    """Per-type count deltas and per-parameter mean/std deltas from the stored aggregates"""
+    stats_a, stats_b = RunningStats.from_dataset(a), RunningStats.from_dataset(b)
+    types = {}
+    for eq_type in sorted(set(stats_a.type_counts) | set(stats_b.type_counts)):
+        count_a, count_b = stats_a.type_counts.get(eq_type, 0), stats_b.type_counts.get(eq_type, 0)
+        types[eq_type] = {'a': count_a, 'b': count_b, 'delta': count_b - count_a}
+
+    parameters = {}
+    for field in NUMERIC_FIELDS:
+        summary_a, summary_b = stats_a.moments.overall[field], stats_b.moments.overall[field]
+        parameters[field] = {
+            metric: {'a': summary_a[metric], 'b': summary_b[metric],
+                     'delta': _delta(summary_a[metric], summary_b[metric])}
+            for metric in ('mean', 'std')
+        }
+    return {'types': types, 'parameters': parameters}
+
+
+def _partners(b):
+    """Records of b with the name of the outer record, first one first"""
+    return EquipmentRecord.objects.filter(dataset_id=b.id, equipment_name=OuterRef('equipment_name')).order_by('id')
+
+
+def _database_pairs(a, b, after, limit):
+    partners = _partners(b)
+    annotations = {'b_id': Subquery(partners.values('id')[:1])}
+    for field in PAIR_FIELDS:
+        annotations[f'b_{field}'] = Subquery(partners.values(field)[:1])
+    rows = (EquipmentRecord.objects.filter(dataset_id=a.id, id__gt=after)
+            .annotate(**annotations).filter(b_id__isnull=False).order_by('id')
+            .values_list('id', 'b_id', 'equipment_name',
+                         *(name for field in PAIR_FIELDS for name in (field, f'b_{field}')))[:limit])
+    return pd.DataFrame.from_records(list(rows), columns=PAIR_COLUMNS)
+
+
+def _database_counts(a, b):
+    matched = EquipmentRecord.objects.filter(dataset_id=a.id).filter(Exists(_partners(b))).count()
+    only_in_b = EquipmentRecord.objects.filter(dataset_id=b.id).exclude(Exists(_partners(a))).count()
+    return {'matched': matched, 'only_in_a': a.total_count - matched, 'only_in_b': only_in_b}
+
+
+def _frame_pairs(a, b, after, limit):
+    """A page of pairs and the counts, from the two frames' names coded by one factorize"""
+    columns = ['equipment_name'] + PAIR_FIELDS
+    frame_a = get_store(a).read_frame(a, columns)
+    frame_b = get_store(b).read_frame(b, columns)
+    codes, names = pd.factorize(pd.concat([frame_a['equipment_name'], frame_b['equipment_name']],
+                                          ignore_index=True))
+    codes_a, codes_b = codes[:len(frame_a)], codes[len(frame_a):]
+
+    # Position in b of the first record with each name, -1 where b has none
+    first_b = np.full(len(names), -1, dtype='int64')
+    in_b, positions = np.unique(codes_b, return_index=True)
+    first_b[in_b] = positions
+    partner = first_b[codes_a]
+    in_a = np.zeros(len(names), dtype=bool)
+    in_a[codes_a] = True
+    matched = int((partner >= 0).sum())
+    counts = {'matched': matched, 'only_in_a': len(frame_a) - matched,
+              'only_in_b': int((~in_a[codes_b]).sum())}
+
+    rows = np.flatnonzero((partner >= 0) & (frame_a['id'].to_numpy() > after))[:limit]
+    page_a, page_b = frame_a.iloc[rows], frame_b.iloc[partner[rows]]
+    pairs = pd.DataFrame({'a_id': page_a['id'].to_numpy(), 'b_id': page_b['id'].to_numpy(),
+                          'equipment_name': page_a['equipment_name'].to_numpy()})
+    for field in PAIR_FIELDS:
+        pairs[f'a_{field}'] = page_a[field].to_numpy()
+        pairs[f'b_{field}'] = page_b[field].to_numpy()
+    return pairs, counts
+
+
+def _counts_key(a, b):
+    return dataset_cache_key(a, 'compare', (b.id, b.version, b.modified_at.timestamp()))
+
+
+def compare_records(a, b, after=0, limit=100):
+    """
+    Up to `limit` pairs of records of a after the id `after`, as a frame with
+    PAIR_COLUMNS, and the counts {'matched', 'only_in_a', 'only_in_b'}.
+    """
+    if a.storage != 'database' or b.storage != 'database':
+        return _frame_pairs(a, b, after, limit)
+
+    pairs = _database_pairs(a, b, after, limit)
+    key = _counts_key(a, b)
+    counts = cache.get(key)
+    if counts is None:
+        counts = _database_counts(a, b)
+        cache.set(key, counts, settings.CHART_CACHE_TIMEOUT)
+    return pairs, counts
+
+
+def pairs_to_json(pairs):
+    """Pair dicts: the name, both ids, and a/b (and delta for numbers) of each PAIR_FIELDS field"""
+    for field in NUMERIC_FIELDS:
+        pairs = pairs.assign(**{f'delta_{field}': pairs[f'b_{field}'] - pairs[f'a_{field}']})
+    results = []
+    for row in pairs.to_dict('records'):
+        result = {'equipment_name': row['equipment_name'], 'a_id': int(row['a_id']), 'b_id': int(row['b_id']),
+                  'equipment_type': {'a': row['a_equipment_type'], 'b': row['b_equipment_type']}}
+        for field in NUMERIC_FIELDS:
+            result[field] = {'a': row[f'a_{field}'], 'b': row[f'b_{field}'], 'delta': row[f'delta_{field}']}
+        results.append(result)
+    return results
@@ -0,0 +1,63 @@
+"""
+Conditional GET for dataset resources.
+
+A dataset's `version` goes up whenever its records change, so its id and
+version identify its content without reading any record. Each
+representation gets its own strong ETag: the content version followed by
+a digest of the query string and the negotiated media type.
+Last-Modified is the dataset's `modified_at`.
+
+Responses are marked private (they depend on the credentials) and
+no-cache, so clients revalidate every time; a 304 costs one query on the
+dataset table.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(request, content_version):
+    """Strong ETag of the representation of `content_version` that `request` asks for"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    representation = repr((sorted(request.GET.lists()), renderer.media_type if renderer else None))
+    digest = hashlib.sha256(representation.encode()).hexdigest()[:16]
+    return quote_etag(f'{content_version}-{digest}')
+
+
+def datasets_version(datasets):
+    """Content version of a list of datasets: changes when one is added, removed or changed"""
+    pairs = ','.join(f'{dataset.id}.{dataset.version}' for dataset in datasets)
+    return f'{len(datasets)}-{hashlib.sha256(pairs.encode()).hexdigest()[:16]}'
+
+
+def dataset_cache_key(dataset, kind, spec):
+    """
+    Django cache key of a result computed from a dataset's records, such as
+    a histogram. It names the content version, so a changed dataset never
+    hits an old entry; modified_at as well, in case a deleted dataset's id
+    is reused.
+    """
+    digest = hashlib.sha256(repr(spec).encode()).hexdigest()[:32]
+    return f'{kind}:{dataset.id}:{dataset.version}:{dataset.modified_at.timestamp()}:{digest}'
+
+
+def _timestamp(last_modified):
+    return int(last_modified.timestamp()) if last_modified is not None else None
+
+
+def not_modified(request, etag, last_modified=None):
+    """The 304 response when the client's copy is current (If-None-Match / If-Modified-Since), else None"""
+    response = get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+    if response is not None:
+        add_cache_headers(response, etag, last_modified)
+    return response
+
+
+def add_cache_headers(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(_timestamp(last_modified))
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Accept', 'Authorization'])
+    return response
@@ -0,0 +1,105 @@
+"""
+Downsampling of record series for line charts.
+
+A series is one numeric field over record order; its x values are the
+0-based record positions. Two methods reduce it to at most `points`
+points that draw like the full series:
+
+    lttb    Largest-Triangle-Three-Buckets (Steinarsson, 2013): the first
+            and last points, plus from each of points - 2 equal buckets
+            the point forming the largest triangle with the point chosen
+            from the previous bucket and the mean of the next bucket
+    minmax  the minimum and the maximum of each of points / 2 equal
+            buckets, in record order, so every spike survives
+
+Bucket bounds and means are computed with NumPy for all buckets at once.
+LTTB still picks its points bucket by bucket, because each choice
+depends on the previous one; each step is one argmax over one bucket.
+minmax has no such dependency and runs as whole-array operations.
+"""
+from django.conf import settings
+from django.core.cache import cache
+import numpy as np
+
+from .conditional import dataset_cache_key
+from .storage import get_store
+
+METHODS = ['lttb', 'minmax']
+
+
+def lttb(y, points):
+    """Positions of the `points` points LTTB keeps of the series y (x = position)"""
+    n = len(y)
+    if points >= n or points < 3:
+        return np.arange(n) if points >= n else np.array([0, n - 1][:points], dtype='int64')
+    x = np.arange(n, dtype='float64')
+
+    # Buckets of the points between the first and the last one
+    every = (n - 2) / (points - 2)
+    bounds = (np.floor(np.arange(points - 1) * every) + 1).astype('int64')
+    bounds[-1] = n - 1
+    sizes = np.diff(bounds)
+    # Mean of each bucket, and of the last point as the bucket after the last one
+    mean_x = np.append(np.add.reduceat(x[:-1], bounds[:-1]) / sizes, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:-1], bounds[:-1]) / sizes, y[-1])
+
+    chosen = np.empty(points, dtype='int64')
+    chosen[0], chosen[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        start, stop = bounds[i], bounds[i + 1]
+        bx, by = x[start:stop], y[start:stop]
+        cx, cy = mean_x[i + 1], mean_y[i + 1]
+        # Twice the triangle area, without the constant factor
+        area = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        chosen[i + 1] = a
+    return chosen
+
+
+def minmax(y, points):
+    """Positions of the minimum and maximum of each of points // 2 buckets of y, in order"""
+    n = len(y)
+    buckets = max(points // 2, 1)
+    if 2 * buckets >= n:
+        return np.arange(n)
+    size = -(-n // buckets)
+    # Pad to whole buckets; the padding never wins a min or a max
+    low = np.full(size * buckets, np.inf)
+    high = np.full(size * buckets, -np.inf)
+    low[:n], high[:n] = y, y
+    offsets = np.arange(buckets) * size
+    lows = offsets + low.reshape(buckets, size).argmin(axis=1)
+    highs = offsets + high.reshape(buckets, size).argmax(axis=1)
+    positions = np.sort(np.stack([lows, highs], axis=1), axis=1).ravel()
+    positions = positions[positions < n]
+    # A bucket whose min and max are the same point contributes it once
+    return positions[np.append(True, np.diff(positions) != 0)]
+
+
+DOWNSAMPLERS = {'lttb': lttb, 'minmax': minmax}
+
+
+def downsample_dataset(dataset, fields, points, method='lttb'):
+    """
+    Downsampled series of `fields` over record order, as
+
+        {'method', 'points', 'total', 'series': {field: {'index': [...], 'values': [...]}}}
+
+    where index holds the 0-based record positions kept.
+    """
+    spec = (tuple(fields), points, method)
+    key = dataset_cache_key(dataset, 'downsample', spec)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    frame = get_store(dataset).read_frame(dataset, list(fields))
+    series = {}
+    for field in fields:
+        y = frame[field].to_numpy(dtype='float64')
+        positions = DOWNSAMPLERS[method](y, points)
+        series[field] = {'index': positions.tolist(), 'values': y[positions].tolist()}
+    result = {'method': method, 'points': points, 'total': len(frame), 'series': series}
+    cache.set(key, result, settings.CHART_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,167 @@
+"""
+Server-side filtering and ordering of dataset records.
+
+Query parameters of the records endpoint:
+
+    equipment_type=Pump,Valve        type equal to one of the values
+    pressure__gt=7                   numeric ranges: __gt, __gte, __lt, __lte
+    equipment_name__startswith=P-1   name prefix (case-sensitive)
+    ordering=-temperature            id, equipment_type or a numeric field, '-' for descending
+
+Database-stored records are filtered and ordered in SQL, where the
+composite (dataset, equipment_type) and (dataset, <numeric field>)
+indexes of EquipmentRecord serve the filters and orderings. Columnar
+records are filtered and sorted with pandas, with the same results.
+Name prefixes are compared case-sensitively in both: SQLite's LIKE
+ignores case, so the prefix is also checked with substr() in SQL.
+
+Pages of an ordered query are fetched by keyset: the next page starts
+after the (value, id) of the last record, passed back as ?after_value=
+and ?after=. Ties on the value are ordered by id in the same direction.
+"""
+from django.db.models import Q
+from django.db.models.functions import Substr
+from django.db.models.lookups import Exact
+import pandas as pd
+
+from .parsing import NUMERIC_FIELDS
+
+RANGE_LOOKUPS = ['gt', 'gte', 'lt', 'lte']
+
+# Orderings backed by an index of EquipmentRecord
+ORDERING_FIELDS = ['id', 'equipment_type'] + NUMERIC_FIELDS
+
+_FRAME_OPERATORS = {
+    'gt': lambda column, value: column > value,
+    'gte': lambda column, value: column >= value,
+    'lt': lambda column, value: column < value,
+    'lte': lambda column, value: column <= value,
+}
+
+
+def _parse_value(field, value):
+    if field in NUMERIC_FIELDS:
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f'{field} filters need a number, got {value!r}')
+    return value
+
+
+class RecordQuery:
+    """Filters, ordering and keyset cursor of one records request"""
+
+    def __init__(self, filters=(), ordering='id', after_value=None):
+        # (field, lookup, value) with lookup 'in', 'startswith' or one of RANGE_LOOKUPS
+        self.filters = list(filters)
+        self.descending = ordering.startswith('-')
+        self.order_field = ordering.lstrip('-')
+        self.after_value = after_value
+
+    @classmethod
+    def from_params(cls, params):
+        """Parse the query parameters; raises ValueError with a message for the client"""
+        filters = []
+        types = [item.strip() for item in params.get('equipment_type', '').split(',') if item.strip()]
+        if types:
+            filters.append(('equipment_type', 'in', types))
+        prefix = params.get('equipment_name__startswith')
+        if prefix:
+            filters.append(('equipment_name', 'startswith', prefix))
+        for field in NUMERIC_FIELDS:
+            for lookup in RANGE_LOOKUPS:
+                value = params.get(f'{field}__{lookup}')
+                if value is not None:
+                    filters.append((field, lookup, _parse_value(field, value)))
+
+        ordering = params.get('ordering', 'id')
+        if ordering.lstrip('-') not in ORDERING_FIELDS or ordering == '-id':
+            raise ValueError(f'Cannot order by {ordering!r}; available: {", ".join(ORDERING_FIELDS)}, '
+                             'each but id also descending with a leading -')
+        query = cls(filters, ordering)
+        if query.keyed:
+            after_value = params.get('after_value')
+            if after_value is None and 'after' in params:
+                raise ValueError(f'after needs after_value (the {query.order_field} of the last record) '
+                                 'when ordering')
+            if after_value is not None:
+                query.after_value = _parse_value(query.order_field, after_value)
+        return query
+
+    def __bool__(self):
+        """False for the default query: every record, by id"""
+        return bool(self.filters) or self.keyed
+
+    @property
+    def keyed(self):
+        """Whether pages are keyed on a field other than the id"""
+        return self.order_field != 'id'
+
+    @property
+    def fields(self):
+        """Record fields the filters and ordering read"""
+        names = [field for field, _, _ in self.filters]
+        if self.keyed:
+            names.append(self.order_field)
+        return list(dict.fromkeys(names))
+
+    def cursor(self, last_id, last_value):
+        """Query parameters that continue after the record (last_id, last_value)"""
+        if not self.keyed:
+            return {'after': last_id}
+        value = repr(float(last_value)) if self.order_field in NUMERIC_FIELDS else last_value
+        return {'after': last_id, 'after_value': value}
+
+    def filter_q(self):
+        q = Q()
+        for field, lookup, value in self.filters:
+            q &= Q(**{f'{field}__{lookup}': value})
+            if lookup == 'startswith':
+                q &= Q(Exact(Substr(field, 1, len(value)), value))
+        return q
+
+    def apply(self, records, after=0):
+        """Filter and order an EquipmentRecord queryset, starting after the cursor"""
+        records = records.filter(self.filter_q())
+        if not self.keyed:
+            return records.filter(id__gt=after).order_by('id')
+
+        field = self.order_field
+        if self.after_value is not None:
+            # The inclusive bound lets the (dataset, field) index seek to the cursor
+            if self.descending:
+                records = records.filter(**{f'{field}__lte': self.after_value}).filter(
+                    Q(**{f'{field}__lt': self.after_value}) | Q(id__lt=after))
+            else:
+                records = records.filter(**{f'{field}__gte': self.after_value}).filter(
+                    Q(**{f'{field}__gt': self.after_value}) | Q(id__gt=after))
+        if self.descending:
+            return records.order_by(f'-{field}', '-id')
+        return records.order_by(field, 'id')
+
+    def mask(self, frame):
+        """Boolean Series of the frame rows that pass the filters"""
+        keep = pd.Series(True, index=frame.index)
+        for field, lookup, value in self.filters:
+            column = frame[field]
+            if lookup == 'in':
+                keep &= column.isin(value)
+            elif lookup == 'startswith':
+                keep &= column.str.startswith(value)
+            else:
+                keep &= _FRAME_OPERATORS[lookup](column, value)
+        return keep
+
+    def apply_frame(self, frame, after=0):
+        """apply() for a record frame with an 'id' column"""
+        keep = self.mask(frame)
+        if not self.keyed:
+            return frame[keep & (frame['id'] > after)]
+
+        column = frame[self.order_field]
+        if self.after_value is not None:
+            if self.descending:
+                keep &= (column < self.after_value) | ((column == self.after_value) & (frame['id'] < after))
+            else:
+                keep &= (column > self.after_value) | ((column == self.after_value) & (frame['id'] > after))
+        return frame[keep].sort_values([self.order_field, 'id'], ascending=not self.descending, kind='stable')
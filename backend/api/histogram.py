@@ -0,0 +1,186 @@
+"""
+Binned counts of numeric record fields for charts.
+
+Bin edges come from the dataset's stored statistics (min, max, std), so
+choosing them reads no records. An axis has either
+
+    a fixed width:  edges at multiples of the width, covering [min, max]
+    a bin count:    that many equal-width bins from min to max
+    'auto':         equal-width bins with Scott's width, 3.49 * std / n^(1/3)
+
+Bins are half-open, [edge, next edge), except that the last bin of a
+bin-count axis also holds the maximum, as in numpy.histogram.
+
+A record's bin is floor((value - first edge) / width). Records stored in
+the database are counted by one GROUP BY query on that expression;
+columnar records with NumPy bincount over the same expression, so both
+give the same bins. Results are kept in the Django cache under the
+dataset's id and content version, which an append changes.
+"""
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F, IntegerField, Value
+from django.db.models.functions import Cast, Floor
+import numpy as np
+import pandas as pd
+
+from .conditional import dataset_cache_key
+from .ingest import RunningStats
+from .models import EquipmentRecord
+from .storage import get_store
+
+# Bins per axis chosen by 'auto' for 1D and 2D histograms
+AUTO_MAX_BINS = 100
+AUTO_MAX_BINS_2D = 50
+
+
+class Axis:
+    """Equal-width bins of one field: `bins` bins of `width` starting at `start`"""
+
+    def __init__(self, field, start, width, bins, closed=False):
+        self.field = field
+        self.start = start
+        self.width = width
+        self.bins = bins
+        # Whether the last bin includes its right edge (the maximum)
+        self.closed = closed
+
+    @classmethod
+    def for_summary(cls, field, summary, bins='auto', width=None, auto_max_bins=AUTO_MAX_BINS):
+        """
+        Axis of a field from its stats summary (see api.stats); raises
+        ValueError when it would have more than HISTOGRAM_MAX_BINS bins.
+        """
+        low, high = summary['min'], summary['max']
+        if not summary['count'] or low is None:
+            return cls(field, 0.0, 1.0, 0)
+
+        if width is not None:
+            start = math.floor(low / width) * width
+            if start > low:
+                # low / width rounded up to a whole number
+                start -= width
+            # The same expression that places each record, so the maximum lands in the last bin
+            count = math.floor((high - start) / width) + 1
+            closed = False
+        else:
+            if bins == 'auto':
+                std = summary.get('std') or 0.0
+                scott = 3.49 * std / summary['count'] ** (1 / 3)
+                bins = min(max(math.ceil((high - low) / scott), 1), auto_max_bins) if scott > 0 else 1
+            start, count, closed = low, bins, True
+            width = (high - low) / bins if high > low else 1.0
+
+        if count > settings.HISTOGRAM_MAX_BINS:
+            raise ValueError(f'{field} would have {count} bins; at most {settings.HISTOGRAM_MAX_BINS} are allowed')
+        return cls(field, start, width, count, closed)
+
+    def edges(self):
+        return [self.start + i * self.width for i in range(self.bins + 1)] if self.bins else []
+
+    def to_json(self):
+        return {'field': self.field, 'width': self.width, 'edges': self.edges()}
+
+    def positions(self, values):
+        """Bin index of each value of a NumPy array"""
+        positions = np.floor((values - self.start) / self.width).astype('int64')
+        return np.minimum(positions, self.bins - 1) if self.closed else positions
+
+    def expression(self):
+        """Bin index of the field as a database expression (before closing the last bin)"""
+        position = (F(self.field) - Value(self.start)) / Value(self.width)
+        if connection.vendor == 'sqlite':
+            # CAST truncates, which is floor for these non-negative positions;
+            # FLOOR may be a Python function registered by Django
+            return Cast(position, IntegerField())
+        return Floor(position)
+
+
+def _overall_statistics(dataset):
+    if dataset.statistics:
+        return dataset.statistics['overall']
+    # Ingested before statistics were stored
+    return RunningStats.from_dataset(dataset).moments.overall
+
+
+def _database_counts(dataset, axes, group_by_type):
+    """{type or None: counts array} from one GROUP BY query"""
+    annotations = {f'bin{i}': axis.expression() for i, axis in enumerate(axes)}
+    columns = list(annotations) + (['equipment_type'] if group_by_type else [])
+    rows = (EquipmentRecord.objects.filter(dataset_id=dataset.id)
+            .annotate(**annotations).values(*columns).annotate(count=Count('id')).order_by())
+
+    shape = tuple(axis.bins for axis in axes)
+    counts = {}
+    for row in rows:
+        key = row['equipment_type'] if group_by_type else None
+        if key not in counts:
+            counts[key] = np.zeros(shape, dtype='int64')
+        index = tuple(min(int(row[f'bin{i}']), axis.bins - 1) for i, axis in enumerate(axes))
+        counts[key][index] += row['count']
+    return counts
+
+
+def _frame_counts(dataset, axes, group_by_type):
+    """{type or None: counts array} with NumPy bincount over the columns"""
+    fields = list(dict.fromkeys(axis.field for axis in axes))
+    frame = get_store(dataset).read_frame(dataset, fields + (['equipment_type'] if group_by_type else []))
+    shape = tuple(axis.bins for axis in axes)
+    flat = np.zeros(len(frame), dtype='int64')
+    for axis in axes:
+        flat = flat * axis.bins + axis.positions(frame[axis.field].to_numpy(dtype='float64'))
+
+    size = int(np.prod(shape))
+    if not group_by_type:
+        return {None: np.bincount(flat, minlength=size).reshape(shape)}
+    types = pd.Categorical(frame['equipment_type'])
+    counts = np.bincount(types.codes.astype('int64') * size + flat, minlength=len(types.categories) * size)
+    counts = counts.reshape((len(types.categories),) + shape)
+    return {eq_type: counts[code] for code, eq_type in enumerate(types.categories) if counts[code].any()}
+
+
+def dataset_histogram(dataset, fields, bins=None, widths=None, group_by_type=False):
+    """
+    Histogram of one field, or 2D binned counts of two, as
+
+        {'x': axis, 'y': axis (2D only), 'counts': counts}
+
+    where an axis is {'field', 'width', 'edges'} and counts is a list of
+    bin counts (a list of lists indexed [x bin][y bin] in 2D), or a dict of
+    them by equipment type when `group_by_type`. `bins` and `widths` give
+    each axis a bin count ('auto' when None) or a fixed width.
+    """
+    bins = list(bins or [None] * len(fields))
+    widths = list(widths or [None] * len(fields))
+    spec = (tuple(fields), tuple(bins), tuple(widths), group_by_type)
+    key = dataset_cache_key(dataset, 'histogram', spec)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    statistics = _overall_statistics(dataset)
+    auto_max_bins = AUTO_MAX_BINS if len(fields) == 1 else AUTO_MAX_BINS_2D
+    axes = [Axis.for_summary(field, statistics[field], count or 'auto', width, auto_max_bins)
+            for field, count, width in zip(fields, bins, widths)]
+
+    if not all(axis.bins for axis in axes):
+        counts = {}
+    elif dataset.storage == 'database':
+        counts = _database_counts(dataset, axes, group_by_type)
+    else:
+        counts = _frame_counts(dataset, axes, group_by_type)
+    if group_by_type:
+        counts = {eq_type: counts[eq_type].tolist() for eq_type in sorted(counts)}
+    else:
+        empty = np.zeros(tuple(axis.bins for axis in axes), dtype='int64')
+        counts = counts.get(None, empty).tolist()
+
+    result = {'x': axes[0].to_json()}
+    if len(axes) > 1:
+        result['y'] = axes[1].to_json()
+    result['counts'] = counts
+    cache.set(key, result, settings.CHART_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,139 @@
+"""
+Streaming CSV ingestion.
+
+Uploads are read in fixed-size chunks so that memory use depends on the
+chunk size rather than on the size of the file. Every chunk is validated
+(see api.validation), inserted and folded into the running dataset
+aggregates before the next one is read.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Dataset
+from .parsing import NUMERIC_FIELDS, read_csv_chunks
+from .stats import StatsAccumulator
+from .storage import get_store
+from .validation import validated_frames
+
+
+SUMMARY_FIELDS = [
+    'total_count', 'avg_flowrate', 'avg_pressure', 'avg_temperature',
+    'equipment_types', 'statistics', 'version', 'modified_at', 'part_count',
+]
+
+
+class RunningStats:
+    """Dataset aggregates accumulated one chunk at a time"""
+
+    def __init__(self):
+        self.count = 0
+        self.type_counts = {}
+        self.moments = StatsAccumulator()
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        """Resume from the aggregates stored on a dataset, without reading its records"""
+        stats = cls()
+        if dataset.total_count and not dataset.statistics:
+            # Ingested before statistics were stored: rebuild them once from the records
+            stats.update(get_store(dataset).read_frame(dataset, ['equipment_type'] + NUMERIC_FIELDS))
+            return stats
+        stats.count = dataset.total_count
+        stats.type_counts = dict(dataset.equipment_types)
+        stats.moments = StatsAccumulator(dataset.statistics)
+        return stats
+
+    def update(self, frame):
+        """Fold a record frame (see to_record_frame) into the running totals"""
+        self.count += len(frame)
+        self.moments.update(frame)
+        for eq_type, count in frame['equipment_type'].value_counts().items():
+            # Categorical columns also report unused categories
+            if count:
+                self.type_counts[eq_type] = self.type_counts.get(eq_type, 0) + int(count)
+
+    def mean(self, field):
+        return self.moments.mean(field)
+
+    def apply(self, dataset):
+        """Copy the current aggregates onto a Dataset instance (without saving)"""
+        dataset.total_count = self.count
+        dataset.avg_flowrate = round(self.mean('flowrate'), 2)
+        dataset.avg_pressure = round(self.mean('pressure'), 2)
+        dataset.avg_temperature = round(self.mean('temperature'), 2)
+        # Most common type first, matching pandas value_counts()
+        dataset.equipment_types = dict(
+            sorted(self.type_counts.items(), key=lambda item: item[1], reverse=True)
+        )
+        dataset.statistics = self.moments.to_json()
+        # New content: cached copies of the dataset are no longer valid
+        dataset.version += 1
+        dataset.modified_at = timezone.now()
+
+
+def csv_frames(csv_file, chunksize=None, mode=None, report=None):
+    """
+    Validated record frames of a CSV file, one per chunk. Invalid rows are
+    added to `report` (a ValidationReport) and handled according to `mode`.
+    """
+    return validated_frames(read_csv_chunks(csv_file, chunksize), mode, report)
+
+
+def iter_ingest(csv_file, dataset, chunksize=None, mode=None, report=None):
+    """
+    Stream `csv_file` into `dataset`, yielding the RunningStats after each chunk.
+
+    Each chunk and the dataset aggregates are written in their own
+    transaction. Callers that need all-or-nothing behaviour should use
+    ingest_csv() or wrap the iteration in transaction.atomic().
+    """
+    stats = RunningStats()
+    for frame in csv_frames(csv_file, chunksize, mode, report):
+        with transaction.atomic():
+            get_store(dataset).append(dataset, frame)
+            stats.update(frame)
+            stats.apply(dataset)
+            dataset.save(update_fields=SUMMARY_FIELDS)
+        yield stats
+
+
+def ingest_csv(csv_file, dataset, chunksize=None, mode=None, report=None):
+    """
+    Stream `csv_file` into `dataset` chunk by chunk.
+
+    The dataset aggregates are saved after every chunk. Everything runs in
+    one transaction, so a bad chunk halfway through leaves nothing behind.
+    Returns the final RunningStats.
+    """
+    stats = RunningStats()
+    with transaction.atomic():
+        for stats in iter_ingest(csv_file, dataset, chunksize, mode, report):
+            pass
+    return stats
+
+
+def append_frames(dataset, frames):
+    """
+    Append record frames to an existing dataset.
+
+    Only the new rows are stored; the aggregates are extended from the
+    ones saved on the dataset, so the cost does not depend on how many
+    records it already holds. Everything runs in one transaction with the
+    dataset row locked against concurrent appends. Returns the number of
+    rows appended.
+    """
+    with transaction.atomic():
+        dataset = Dataset.objects.select_for_update().get(pk=dataset.pk)
+        stats = RunningStats.from_dataset(dataset)
+        before = stats.count
+        store = get_store(dataset)
+        for frame in frames:
+            store.append(dataset, frame)
+            stats.update(frame)
+            # The next frame's ids follow this one's
+            dataset.total_count = stats.count
+        stats.apply(dataset)
+        # The dataset no longer matches the file it was uploaded from
+        dataset.content_hash = ''
+        dataset.save(update_fields=SUMMARY_FIELDS + ['content_hash'])
+    return stats.count - before
@@ -0,0 +1,379 @@
+"""
+Background ingestion jobs.
+
+Uploads are stored under MEDIA_ROOT/ingest/ and recorded as IngestJob
+rows; the database is the queue. A job ingests either one CSV file or a
+batch of files and archives (see api.batch). Jobs are picked up either by a thread
+pool inside the web process (INGEST_WORKERS > 0) or by the
+`run_ingest_worker` management command. With INGEST_WORKERS = 0 jobs run
+inline in the request, which is what the test suite uses.
+
+A job builds its dataset chunk by chunk, each chunk in its own
+transaction, so the dataset stays hidden (Dataset.ready = False) until
+the job succeeds. Each chunk also moves the job's heartbeat; a running
+job without progress for INGEST_JOB_TIMEOUT_MINUTES is taken to have lost
+its worker and is failed by fail_stale_jobs().
+
+The pool only knows the jobs handed to it in memory, so when it starts
+it runs recover_jobs(): the jobs a previous process left running are
+failed once stale, and those left pending are queued again.
+
+Retention pruning after an upload runs on the same pool.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import os
+import tarfile
+import tempfile
+import threading
+import zipfile
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .batch import extract_members, ingest_batch
+from .ingest import iter_ingest
+from .models import Dataset, IngestJob, default_validation_mode
+from .parsing import IngestError, fingerprint
+from .retention import delete_datasets, expired_datasets, prune_datasets
+from .validation import ValidationFailed, ValidationReport
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.INGEST_WORKERS,
+                thread_name_prefix='ingest',
+            )
+            _executor.submit(_recover_in_thread)
+        return _executor
+
+
+def _duplicate_job(user, filename, content_hash, mode):
+    """
+    A file identical to one of the user's existing datasets, validated in
+    the same mode, is not stored or parsed again: return a job that is
+    already finished, flagged as deduplicated and points at that dataset.
+    Returns None if there is no such dataset.
+    """
+    # A lenient dataset may lack rows that strict mode would reject the file for
+    existing = Dataset.objects.filter(user=user, content_hash=content_hash, validation_mode=mode).first()
+    if existing is None:
+        return None
+    now = timezone.now()
+    return IngestJob.objects.create(
+        user=user,
+        filename=filename,
+        content_hash=content_hash,
+        validation_mode=mode,
+        deduplicated=True,
+        state=IngestJob.SUCCEEDED,
+        rows_processed=existing.total_count,
+        dataset=existing,
+        started_at=now,
+        finished_at=now,
+    )
+
+
+def _schedule(job):
+    if settings.INGEST_WORKERS > 0:
+        # Only hand the job to the pool once the row is visible to other connections
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.pk))
+    else:
+        run_job(job.pk)
+
+
+def enqueue_ingest(user, uploaded_file, validation_mode=None):
+    """Store an uploaded file, create its IngestJob and schedule it"""
+    content_hash = fingerprint(uploaded_file)
+    mode = validation_mode or default_validation_mode()
+    duplicate = _duplicate_job(user, uploaded_file.name, content_hash, mode)
+    if duplicate is not None:
+        return duplicate
+
+    job = IngestJob(user=user, filename=uploaded_file.name, content_hash=content_hash, validation_mode=mode)
+    job.upload.save(uploaded_file.name, uploaded_file, save=False)
+    job.save()
+    _schedule(job)
+    return job
+
+
+def enqueue_stored_ingest(user, filename, stored_name, validation_mode=None):
+    """
+    Queue a file that already lives in default storage, such as an
+    assembled resumable upload. The job takes ownership of the file.
+    """
+    with default_storage.open(stored_name, 'rb') as stored_file:
+        content_hash = fingerprint(stored_file)
+    mode = validation_mode or default_validation_mode()
+    duplicate = _duplicate_job(user, filename, content_hash, mode)
+    if duplicate is not None:
+        default_storage.delete(stored_name)
+        return duplicate
+
+    job = IngestJob(user=user, filename=filename, content_hash=content_hash, validation_mode=mode)
+    job.upload.name = stored_name
+    job.save()
+    _schedule(job)
+    return job
+
+
+def enqueue_batch(user, uploaded_files, merge=False, validation_mode=None):
+    """
+    Store the files of a batch upload (CSVs and archives), create its
+    IngestJob and schedule it. Unpacking, parsing and loading all happen
+    in the job.
+    """
+    uploads = []
+    for uploaded_file in uploaded_files:
+        stored_name = default_storage.save(f'ingest/{os.path.basename(uploaded_file.name)}', uploaded_file)
+        uploads.append({'name': uploaded_file.name, 'stored_name': stored_name})
+    if len(uploaded_files) == 1:
+        filename = uploaded_files[0].name
+    else:
+        filename = f'batch of {len(uploaded_files)} uploads'
+    job = IngestJob.objects.create(
+        user=user,
+        kind=IngestJob.BATCH,
+        filename=filename,
+        validation_mode=validation_mode or default_validation_mode(),
+        batch={'uploads': uploads, 'merge': merge},
+    )
+    _schedule(job)
+    return job
+
+
+def _delete_uploads(job):
+    job.upload.delete(save=False)
+    for upload in job.batch.get('uploads', []):
+        default_storage.delete(upload['stored_name'])
+
+
+def _prune_in_thread(user_id):
+    close_old_connections()
+    try:
+        prune_datasets(user_id)
+    except Exception:
+        logger.exception("Retention pruning for user %s failed", user_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_prune(user):
+    """Apply the retention policy of `user` once the current transaction commits, off the request thread"""
+    if not settings.RETENTION_ON_UPLOAD:
+        return
+    if settings.INGEST_WORKERS > 0:
+        transaction.on_commit(lambda: _get_executor().submit(_prune_in_thread, user.pk))
+    else:
+        prune_datasets(user)
+
+
+def claim_job(job_id):
+    """Atomically move a pending job to running. Returns False if someone else got it."""
+    now = timezone.now()
+    return IngestJob.objects.filter(pk=job_id, state=IngestJob.PENDING).update(
+        state=IngestJob.RUNNING, started_at=now, heartbeat_at=now
+    ) == 1
+
+
+def _record_progress(job, rows):
+    """Store the rows processed so far, which is also the job's heartbeat"""
+    job.rows_processed = rows
+    IngestJob.objects.filter(pk=job.pk).update(rows_processed=rows, heartbeat_at=timezone.now())
+
+
+def claim_next_job():
+    """Claim the oldest pending job, or return None when the queue is empty"""
+    pending = IngestJob.objects.filter(state=IngestJob.PENDING).order_by('created_at', 'id')
+    for job_id in pending.values_list('id', flat=True)[:10]:
+        if claim_job(job_id):
+            return job_id
+    return None
+
+
+def fail_stale_jobs():
+    """
+    Fail the running jobs that have made no progress for
+    INGEST_JOB_TIMEOUT_MINUTES, deleting the datasets they left unfinished.
+    Returns the number of jobs failed.
+    """
+    cutoff = timezone.now() - timedelta(minutes=settings.INGEST_JOB_TIMEOUT_MINUTES)
+    failed = 0
+    stale = IngestJob.objects.filter(state=IngestJob.RUNNING, heartbeat_at__lt=cutoff).order_by('created_at', 'id')
+    for job in stale:
+        # Conditional, in case the job finished since it was read
+        if not IngestJob.objects.filter(pk=job.pk, state=IngestJob.RUNNING).update(
+            state=IngestJob.FAILED,
+            error='Ingest job timed out',
+            dataset=None,
+            finished_at=timezone.now(),
+        ):
+            continue
+        if job.dataset_id is not None:
+            delete_datasets([job.dataset_id])
+        _delete_uploads(job)
+        IngestJob.objects.filter(pk=job.pk).update(upload='')
+        failed += 1
+    return failed
+
+
+def recover_jobs():
+    """
+    Fail the stale running jobs and hand the pending ones to the pool.
+    Returns the number of jobs queued again.
+    """
+    fail_stale_jobs()
+    pending = IngestJob.objects.filter(state=IngestJob.PENDING).order_by('created_at', 'id')
+    job_ids = list(pending.values_list('id', flat=True))
+    for job_id in job_ids:
+        # A job another process claims first is skipped by run_job()
+        _get_executor().submit(_run_in_thread, job_id)
+    return len(job_ids)
+
+
+def _recover_in_thread():
+    close_old_connections()
+    try:
+        recover_jobs()
+    except Exception:
+        logger.exception("Recovering ingest jobs failed")
+    finally:
+        close_old_connections()
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def run_job(job_id, claimed=False):
+    """Ingest the file of one job, recording progress and the outcome on the job row"""
+    if not claimed and not claim_job(job_id):
+        return
+    job = IngestJob.objects.get(pk=job_id)
+    if job.kind == IngestJob.BATCH:
+        _run_batch_job(job)
+        return
+    dataset = Dataset.objects.create(user=job.user, filename=job.filename, ready=False)
+    # Recorded now so that fail_stale_jobs() can find the unfinished dataset
+    IngestJob.objects.filter(pk=job.pk).update(dataset=dataset)
+    report = ValidationReport()
+
+    try:
+        with job.upload.open('rb') as csv_file:
+            for stats in iter_ingest(csv_file, dataset, mode=job.validation_mode, report=report):
+                _record_progress(job, stats.count)
+        if report and not job.rows_processed:
+            raise ValidationFailed(report)
+        # Only a complete dataset is listed and may serve later duplicate uploads
+        dataset.content_hash = job.content_hash
+        dataset.validation_mode = job.validation_mode
+        dataset.ready = True
+        dataset.save(update_fields=['content_hash', 'validation_mode', 'ready'])
+    except Exception as e:
+        if isinstance(e, IngestError):
+            job.error = str(e)
+        else:
+            logger.exception("Ingest job %s failed", job.pk)
+            job.error = f'Error processing file: {str(e)}'
+        delete_datasets([dataset.id])
+        job.state = IngestJob.FAILED
+        job.dataset = None
+    else:
+        job.state = IngestJob.SUCCEEDED
+        job.dataset = dataset
+
+    job.validation = report.to_json()
+    job.finished_at = timezone.now()
+    job.upload.delete(save=False)
+    job.save(update_fields=['state', 'error', 'validation', 'dataset', 'rows_processed', 'finished_at', 'upload'])
+    if job.state == IngestJob.SUCCEEDED:
+        schedule_prune(job.user)
+
+
+def _run_batch_job(job):
+    """Unpack, parse and load the files of a batch job"""
+    uploads = job.batch.get('uploads', [])
+    merged = None
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            stored_files = [File(default_storage.open(upload['stored_name'], 'rb'), name=upload['name'])
+                            for upload in uploads]
+            try:
+                members = extract_members(stored_files, workdir)
+            finally:
+                for stored_file in stored_files:
+                    stored_file.close()
+            if not members:
+                raise IngestError('No CSV files found')
+
+            if job.batch.get('merge'):
+                merged_name = uploads[0]['name'] if len(uploads) == 1 else f'batch of {len(members)} files'
+                merged = Dataset.objects.create(user=job.user, filename=merged_name, ready=False)
+                # Recorded now so that fail_stale_jobs() can find the unfinished dataset
+                IngestJob.objects.filter(pk=job.pk).update(dataset=merged)
+
+            datasets, files = ingest_batch(job.user, members, merged=merged, mode=job.validation_mode,
+                                           progress=lambda rows: _record_progress(job, rows))
+    except Exception as e:
+        if isinstance(e, IngestError):
+            job.error = str(e)
+        else:
+            if not isinstance(e, (zipfile.BadZipFile, tarfile.TarError)):
+                logger.exception("Batch ingest job %s failed", job.pk)
+            job.error = f'Error processing file: {str(e)}'
+        if merged is not None:
+            delete_datasets([merged.id])
+        job.state = IngestJob.FAILED
+        job.dataset = None
+    else:
+        job.files = files
+        job.rows_processed = sum(entry['rows'] for entry in files if entry['status'] in ('created', 'merged'))
+        job.dataset = merged if merged is not None and merged in datasets else None
+        if any(entry['status'] != 'error' for entry in files):
+            job.state = IngestJob.SUCCEEDED
+        else:
+            job.state = IngestJob.FAILED
+            job.error = 'No file could be loaded'
+
+    if job.state == IngestJob.SUCCEEDED and settings.RETENTION_ON_UPLOAD:
+        _prune_batch(job)
+    job.finished_at = timezone.now()
+    _delete_uploads(job)
+    job.save(update_fields=['state', 'error', 'files', 'dataset', 'rows_processed', 'finished_at'])
+
+
+def _prune_batch(job):
+    """
+    Apply the retention policy before a batch job reports its files: a
+    batch may hold more files than the policy keeps, and the files whose
+    datasets are removed are marked 'pruned' rather than pointing at them.
+    """
+    try:
+        pruned = set(expired_datasets(job.user).values_list('id', flat=True))
+        if pruned:
+            delete_datasets(list(pruned))
+    except Exception:
+        logger.exception("Retention pruning for user %s failed", job.user_id)
+        return
+    for entry in job.files:
+        if entry.get('dataset_id') in pruned:
+            entry['status'] = 'pruned'
+            del entry['dataset_id']
+    if job.dataset_id in pruned:
+        job.dataset = None
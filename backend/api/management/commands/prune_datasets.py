@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.retention import delete_datasets, expired_datasets, get_policy
+
+
+class Command(BaseCommand):
+    help = "Remove datasets that the retention policy no longer keeps"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only prune the datasets of this username')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Records deleted per statement (default: RETENTION_DELETE_BATCH_SIZE)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List the datasets that would be removed without deleting them')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(datasets__isnull=False).distinct().order_by('id')
+        if options['user']:
+            if not User.objects.filter(username=options['user']).exists():
+                raise CommandError(f"User {options['user']} does not exist")
+            users = users.filter(username=options['user'])
+
+        removed = 0
+        for user in users:
+            expired = list(expired_datasets(user, get_policy(user)).values_list('id', 'filename', 'total_count'))
+            if not expired:
+                continue
+            for dataset_id, filename, total_count in expired:
+                self.stdout.write(f"{user.username}: dataset {dataset_id} {filename} ({total_count} rows)")
+            if not options['dry_run']:
+                delete_datasets([dataset_id for dataset_id, _, _ in expired], options['batch_size'])
+            removed += len(expired)
+
+        action = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f"{action} {removed} dataset(s)"))
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:50
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_uploadsession'),
+    ]
+
+    operations = [
+        # Existing datasets all keep their records in the table,
+        # whatever RECORD_STORAGE_BACKEND is set to now
+        migrations.AddField(
+            model_name='dataset',
+            name='storage',
+            field=models.CharField(choices=[('database', 'Database rows'), ('columnar', 'Columnar files')], default='database', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='dataset',
+            name='storage',
+            field=models.CharField(choices=[('database', 'Database rows'), ('columnar', 'Columnar files')], default=api.models.default_record_storage, max_length=20),
+        ),
+    ]
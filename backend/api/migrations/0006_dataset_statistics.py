@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:52
+
+from django.db import migrations, models
+import math
+import pandas as pd
+
+
+NUMERIC_FIELDS = ['flowrate', 'pressure', 'temperature']
+
+
+def summarize(values):
+    """Summary of one column in the stored layout of api.stats, frozen for this migration"""
+    present = values.dropna()
+    count = len(present)
+    if not count:
+        return {'count': 0, 'null_count': len(values), 'min': None, 'max': None,
+                'mean': None, 'std': None, 'm2': 0.0}
+    mean = float(present.mean())
+    # Deviations from the mean, not the sum of squares, so nothing cancels
+    m2 = float(((present - mean) ** 2).sum())
+    return {
+        'count': count,
+        'null_count': len(values) - count,
+        'min': float(present.min()),
+        'max': float(present.max()),
+        'mean': mean,
+        'std': math.sqrt(m2 / (count - 1)) if count > 1 else None,
+        'm2': m2,
+    }
+
+
+def backfill_statistics(apps, schema_editor):
+    """Compute statistics for datasets whose records are in the database"""
+    Dataset = apps.get_model('api', 'Dataset')
+    EquipmentRecord = apps.get_model('api', 'EquipmentRecord')
+    columns = ['equipment_type'] + NUMERIC_FIELDS
+    for dataset in Dataset.objects.filter(storage='database').iterator():
+        rows = EquipmentRecord.objects.filter(dataset_id=dataset.id).values_list(*columns)
+        frame = pd.DataFrame.from_records(list(rows), columns=columns)
+        frame[NUMERIC_FIELDS] = frame[NUMERIC_FIELDS].astype('float64')
+        dataset.statistics = {
+            'overall': {field: summarize(frame[field]) for field in NUMERIC_FIELDS},
+            'by_type': {
+                eq_type: {field: summarize(group[field]) for field in NUMERIC_FIELDS}
+                for eq_type, group in frame.groupby('equipment_type', sort=False)
+            },
+        }
+        dataset.save(update_fields=['statistics'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_dataset_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='statistics',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(backfill_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:06
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_retentionpolicy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='validation',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='validation_mode',
+            field=models.CharField(choices=[('strict', 'Reject files with invalid rows'), ('lenient', 'Drop invalid rows')], default=api.models.default_validation_mode, max_length=10),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:27
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def backfill_modified_at(apps, schema_editor):
+    """Existing datasets last changed when they were uploaded"""
+    Dataset = apps.get_model('api', 'Dataset')
+    Dataset.objects.update(modified_at=F('uploaded_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_equipmentrecord_dataset_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(backfill_modified_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_equipmentrecord_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipmentrecord',
+            index=models.Index(fields=['dataset', 'equipment_name'], name='api_equipme_dataset_36a982_idx'),
+        ),
+    ]
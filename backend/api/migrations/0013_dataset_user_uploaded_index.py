@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_equipmentrecord_name_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(fields=['user', 'uploaded_at'], name='api_dataset_user_id_988ced_idx'),
+        ),
+    ]
@@ -0,0 +1,126 @@
+# Squashes 0013 to 0015, so that a new database creates the (user,
+# -uploaded_at, -id) dataset index directly instead of building the
+# (user, uploaded_at) index of 0013 and dropping it again in 0015.
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import numpy as np
+import os
+import sqlite3
+
+
+# The trigram index of api.search, frozen for this migration
+FTS_TABLE = 'api_searchentry_fts'
+
+# First SQLite with the FTS5 trigram tokenizer; older ones get no FTS
+# table and api.search falls back to icontains
+SQLITE_TRIGRAM_VERSION = (3, 34)
+
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    "equipment_name, content='api_searchentry', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER api_searchentry_ai AFTER INSERT ON api_searchentry BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, equipment_name) VALUES (new.id, new.equipment_name); END",
+    f"CREATE TRIGGER api_searchentry_ad AFTER DELETE ON api_searchentry BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, equipment_name) VALUES ('delete', old.id, old.equipment_name); END",
+    f"CREATE TRIGGER api_searchentry_au AFTER UPDATE ON api_searchentry BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, equipment_name) VALUES ('delete', old.id, old.equipment_name); "
+    f"INSERT INTO {FTS_TABLE}(rowid, equipment_name) VALUES (new.id, new.equipment_name); END",
+]
+
+POSTGRESQL_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX api_searchentry_name_trgm ON api_searchentry USING gin (equipment_name gin_trgm_ops)",
+]
+
+
+def columnar_entries(directory):
+    """(record id, name, type) of the records in the .npz part files of a columnar dataset"""
+    if not os.path.isdir(directory):
+        return
+    record_id = 1
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.npz'):
+            continue
+        with np.load(os.path.join(directory, name)) as data:
+            names = data['names'].tobytes().decode('utf-8').split('\0')
+            types = data['type_values'][data['type_codes']].tolist()
+        for equipment_name, equipment_type in zip(names, types):
+            yield record_id, equipment_name, equipment_type
+            record_id += 1
+
+
+def build_search_index(apps, schema_editor):
+    """Create the trigram index and add every stored record to it"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite' and sqlite3.sqlite_version_info < SQLITE_TRIGRAM_VERSION:
+        vendor = None
+    for statement in {'sqlite': SQLITE_SCHEMA, 'postgresql': POSTGRESQL_SCHEMA}.get(vendor, []):
+        schema_editor.execute(statement)
+
+    # Records in the database are copied in one statement
+    schema_editor.execute(
+        'INSERT INTO api_searchentry (dataset_id, record_id, equipment_name, equipment_type) '
+        'SELECT r.dataset_id, r.id, r.equipment_name, r.equipment_type FROM api_equipmentrecord r '
+        "INNER JOIN api_dataset d ON d.id = r.dataset_id WHERE d.storage = 'database' ORDER BY r.id"
+    )
+    Dataset = apps.get_model('api', 'Dataset')
+    SearchEntry = apps.get_model('api', 'SearchEntry')
+    for dataset_id in Dataset.objects.filter(storage='columnar').values_list('id', flat=True).iterator():
+        directory = os.path.join(settings.MEDIA_ROOT, 'columnar', str(dataset_id))
+        SearchEntry.objects.bulk_create(
+            (SearchEntry(dataset_id=dataset_id, record_id=record_id, equipment_name=equipment_name,
+                         equipment_type=equipment_type)
+             for record_id, equipment_name, equipment_type in columnar_entries(directory)),
+            batch_size=1000,
+        )
+
+
+def remove_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for trigger in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS api_searchentry_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS api_searchentry_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    replaces = [
+        ('api', '0013_dataset_user_uploaded_index'),
+        ('api', '0014_searchentry'),
+        ('api', '0015_dataset_user_newest_index'),
+    ]
+
+    dependencies = [
+        ('api', '0012_equipmentrecord_name_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(fields=['user', '-uploaded_at', '-id'], name='api_dataset_user_id_1e7af2_idx'),
+        ),
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('record_id', models.IntegerField()),
+                ('equipment_name', models.CharField(max_length=255)),
+                ('equipment_type', models.CharField(max_length=100)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.dataset')),
+            ],
+            options={
+                'verbose_name_plural': 'search entries',
+                'indexes': [models.Index(fields=['dataset', 'equipment_type', 'record_id'], name='api_searche_dataset_88ea0b_idx')],
+            },
+        ),
+        migrations.RunPython(build_search_index, remove_search_index),
+        migrations.AlterModelOptions(
+            name='dataset',
+            options={'ordering': ['-uploaded_at', '-id']},
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_searchentry'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='dataset',
+            options={'ordering': ['-uploaded_at', '-id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='dataset',
+            name='api_dataset_user_id_988ced_idx',
+        ),
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(fields=['user', '-uploaded_at', '-id'], name='api_dataset_user_id_1e7af2_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_dataset_user_newest_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='ready',
+            field=models.BooleanField(default=True),
+        ),
+    ]
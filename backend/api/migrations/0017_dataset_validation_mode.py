@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:04
+
+from django.db import migrations, models
+
+
+def backfill_validation_mode(apps, schema_editor):
+    """Take the mode of datasets with a content hash from the job that ingested them"""
+    Dataset = apps.get_model('api', 'Dataset')
+    IngestJob = apps.get_model('api', 'IngestJob')
+    jobs = IngestJob.objects.filter(state='succeeded', deduplicated=False, dataset__isnull=False)
+    for dataset_id, mode in jobs.values_list('dataset_id', 'validation_mode').iterator():
+        Dataset.objects.filter(id=dataset_id).exclude(content_hash='').update(validation_mode=mode)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_dataset_ready'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='validation_mode',
+            field=models.CharField(blank=True, choices=[('strict', 'Reject files with invalid rows'), ('lenient', 'Drop invalid rows')], max_length=10),
+        ),
+        migrations.RunPython(backfill_validation_mode, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_dataset_validation_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='batch',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='files',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='kind',
+            field=models.CharField(choices=[('csv', 'CSV file'), ('batch', 'Batch of files and archives')], default='csv', max_length=10),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:35
+
+from django.db import migrations, models
+
+
+def backfill_heartbeats(apps, schema_editor):
+    """Jobs already running have had no progress recorded since they started"""
+    IngestJob = apps.get_model('api', 'IngestJob')
+    IngestJob.objects.filter(started_at__isnull=False).update(heartbeat_at=models.F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_ingestjob_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_heartbeats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:38
+
+from django.conf import settings
+from django.db import migrations, models
+import os
+
+
+def count_parts(apps, schema_editor):
+    """Number the next part of each columnar dataset after the part files it has"""
+    Dataset = apps.get_model('api', 'Dataset')
+    for dataset in Dataset.objects.filter(storage='columnar').only('id').iterator():
+        directory = os.path.join(settings.MEDIA_ROOT, 'columnar', str(dataset.id))
+        if os.path.isdir(directory):
+            dataset.part_count = sum(name.endswith('.npz') for name in os.listdir(directory))
+            dataset.save(update_fields=['part_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_ingestjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='part_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_parts, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,36 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
 
+STORAGE_CHOICES = [
+    ('database', 'Database rows'),
+    ('columnar', 'Columnar files'),
+]
+
+
+def default_record_storage():
+    return settings.RECORD_STORAGE_BACKEND
+
+
+VALIDATION_MODE_CHOICES = [
+    ('strict', 'Reject files with invalid rows'),
+    ('lenient', 'Drop invalid rows'),
+]
+
+
+def default_validation_mode():
+    return settings.INGEST_VALIDATION_MODE
+
+
+class DatasetManager(models.Manager):
+    """Only the datasets whose ingest has finished (Dataset.all_objects has every one)"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(ready=True)
+
+
 class Dataset(models.Model):
     """Model to store uploaded CSV datasets"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='datasets')
@@ -13,9 +41,32 @@ class Dataset(models.Model):
     avg_pressure = models.FloatField(default=0.0)
     avg_temperature = models.FloatField(default=0.0)
     equipment_types = models.JSONField(default=dict)
+    # Per-parameter and per-type count/null_count/min/max/mean/std (see api.stats)
+    statistics = models.JSONField(default=dict)
+    content_hash = models.CharField(max_length=64, blank=True)
+    # Mode the file was validated in; with content_hash, the key for deduplicating uploads
+    validation_mode = models.CharField(max_length=10, choices=VALIDATION_MODE_CHOICES, blank=True)
+    storage = models.CharField(max_length=20, choices=STORAGE_CHOICES, default=default_record_storage)
+    # Part files of a columnar dataset; the next part's number (see api.storage)
+    part_count = models.PositiveIntegerField(default=0)
+    # Content version and time of the last change to the records; they make up the ETag
+    version = models.PositiveIntegerField(default=1)
+    modified_at = models.DateTimeField(default=timezone.now)
+    # False while a background job is still committing chunks: the dataset is
+    # hidden from every listing, search and retention count until then
+    ready = models.BooleanField(default=True)
+
+    objects = DatasetManager()
+    all_objects = models.Manager()
     
     class Meta:
-        ordering = ['-uploaded_at']
+        ordering = ['-uploaded_at', '-id']
+        indexes = [
+            models.Index(fields=['user', 'content_hash']),
+            # A user's datasets newest first (the listing's keyset pages, retention),
+            # or read backwards in upload order (api.trends)
+            models.Index(fields=['user', '-uploaded_at', '-id']),
+        ]
         
     def __str__(self):
         return f"{self.filename} - {self.uploaded_at.strftime('%Y-%m-%d %H:%M')}"
@@ -30,5 +81,112 @@ class EquipmentRecord(models.Model):
     pressure = models.FloatField()
     temperature = models.FloatField()
     
+    class Meta:
+        indexes = [
+            # Keyset pagination of a dataset's records: WHERE dataset_id = ? AND id > ? ORDER BY id
+            models.Index(fields=['dataset', 'id']),
+            # Filters and orderings of the records endpoint (see api.filtering)
+            models.Index(fields=['dataset', 'equipment_type']),
+            models.Index(fields=['dataset', 'flowrate']),
+            models.Index(fields=['dataset', 'pressure']),
+            models.Index(fields=['dataset', 'temperature']),
+            # Pairing the records of two datasets by name (see api.comparison)
+            models.Index(fields=['dataset', 'equipment_name']),
+        ]
+    
+    def __str__(self):
+        return f"{self.equipment_name} ({self.equipment_type})"
+
+
+class SearchEntry(models.Model):
+    """Name and type of one record of either storage backend, indexed for search (see api.search)"""
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='+')
+    # EquipmentRecord id, or 1-based position for columnar records
+    record_id = models.IntegerField()
+    equipment_name = models.CharField(max_length=255)
+    equipment_type = models.CharField(max_length=100)
+
+    class Meta:
+        verbose_name_plural = 'search entries'
+        indexes = [models.Index(fields=['dataset', 'equipment_type', 'record_id'])]
+
     def __str__(self):
         return f"{self.equipment_name} ({self.equipment_type})"
+
+
+class IngestJob(models.Model):
+    """Background ingestion of an uploaded CSV file"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    CSV = 'csv'
+    BATCH = 'batch'
+    KIND_CHOICES = [
+        (CSV, 'CSV file'),
+        (BATCH, 'Batch of files and archives'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ingest_jobs')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=CSV)
+    filename = models.CharField(max_length=255)
+    upload = models.FileField(upload_to='ingest/', blank=True)
+    # Batch jobs: {'uploads': [{'name', 'stored_name'}], 'merge': bool}
+    batch = models.JSONField(default=dict, blank=True)
+    # Batch jobs: the outcome of each CSV (see api.batch.ingest_batch)
+    files = models.JSONField(default=list, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    deduplicated = models.BooleanField(default=False)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=PENDING)
+    rows_processed = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    validation_mode = models.CharField(max_length=10, choices=VALIDATION_MODE_CHOICES,
+                                       default=default_validation_mode)
+    # ValidationReport.to_json() of the rows rejected or dropped
+    validation = models.JSONField(default=dict, blank=True)
+    dataset = models.ForeignKey(Dataset, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Last progress of a running job: fail_stale_jobs() measures the timeout from it
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['state', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.filename} ({self.state})"
+
+
+class UploadSession(models.Model):
+    """A resumable upload being assembled from byte ranges"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    file = models.FileField(upload_to='uploads/')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+
+class RetentionPolicy(models.Model):
+    """Per-user retention limits; an empty field falls back to the RETENTION_* setting, 0 means no limit"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='retention_policy')
+    max_datasets = models.PositiveIntegerField(null=True, blank=True)
+    max_age_days = models.PositiveIntegerField(null=True, blank=True)
+    max_rows = models.PositiveBigIntegerField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'retention policies'
+
+    def __str__(self):
+        return f"Retention policy of {self.user.username}"
@@ -0,0 +1,29 @@
+"""
+Opaque keyset cursors.
+
+A cursor holds the sort key of the last item of a page, and the next
+page starts strictly after it, so a page costs an index seek however
+deep it is and items added meanwhile neither repeat nor shift later
+pages. The key is encoded as URL-safe base64 of its JSON: clients pass
+it back without reading it, and the key may change without changing the
+API.
+"""
+import base64
+import json
+
+
+def encode_cursor(key):
+    """Cursor string of a list of JSON-serializable sort key values"""
+    data = json.dumps(key, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """The sort key of a cursor made by encode_cursor; ValueError if it is not one"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        key = None
+    if not isinstance(key, list) or len(key) != length:
+        raise ValueError('Invalid cursor')
+    return key
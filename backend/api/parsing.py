@@ -0,0 +1,218 @@
+"""
+CSV parsing and validation.
+
+Only the five required columns are read. Names and types have a fixed
+schema (text, and a categorical for Type); a measurement column is read
+as numbers where it can be, and a bad value turns it to text (for the
+chunk it is in) instead of aborting the read, so api.validation can
+report it by row. The C engine gets this from its type inference. The
+pyarrow reader fixes its column types from the first block, so the
+measurements are read as text and each block's columns converted to
+numbers afterwards. CSV_PARSE_ENGINE picks the parser: 'pyarrow'
+(multithreaded, optional dependency), pandas' 'c' engine, or 'auto' for
+pyarrow when it is installed and 'c' otherwise. Both engines produce the
+same frames.
+
+Nothing in this module touches the database, so its functions can run in
+worker processes that never call django.setup().
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:  # optional: falls back to the pandas C parser
+    pa = pc = pa_csv = None
+
+
+REQUIRED_COLUMNS = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+
+# CSV column -> EquipmentRecord field
+COLUMN_FIELDS = {
+    'Equipment Name': 'equipment_name',
+    'Type': 'equipment_type',
+    'Flowrate': 'flowrate',
+    'Pressure': 'pressure',
+    'Temperature': 'temperature',
+}
+
+NUMERIC_FIELDS = ['flowrate', 'pressure', 'temperature']
+
+NUMERIC_COLUMNS = ['Flowrate', 'Pressure', 'Temperature']
+
+# Parse schema of the text columns
+COLUMN_DTYPES = {
+    'Equipment Name': str,
+    'Type': 'category',
+}
+
+# Rough CSV bytes per row, to turn a chunk size in rows into a pyarrow block size
+ARROW_BYTES_PER_ROW = 64
+
+
+class IngestError(Exception):
+    """Raised when an upload cannot be ingested. The message is safe to return to the client."""
+
+
+def validate_columns(df):
+    """Ensure the required CSV headers are present"""
+    if not all(col in df.columns for col in REQUIRED_COLUMNS):
+        raise IngestError(f'CSV must contain columns: {", ".join(REQUIRED_COLUMNS)}')
+
+
+def parse_engine(engine=None):
+    """The parser to use: `engine`, or the one configured by CSV_PARSE_ENGINE"""
+    engine = engine or settings.CSV_PARSE_ENGINE
+    if engine == 'auto':
+        return 'pyarrow' if pa_csv is not None else 'c'
+    if engine == 'pyarrow' and pa_csv is None:
+        raise ImproperlyConfigured("CSV_PARSE_ENGINE is 'pyarrow' but pyarrow is not installed")
+    if engine not in ('pyarrow', 'c'):
+        raise ImproperlyConfigured(f"Unknown CSV_PARSE_ENGINE: {engine}")
+    return engine
+
+
+def _is_required(column):
+    return column in REQUIRED_COLUMNS
+
+
+def _read_header(source):
+    """Column names of a CSV path or file, rewinding the file afterwards"""
+    header = pd.read_csv(source, nrows=0)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return header
+
+
+def _arrow_options(chunksize=None):
+    types = {
+        'Equipment Name': pa.string(),
+        'Type': pa.dictionary(pa.int32(), pa.string()),
+        # Inferred types would be fixed by the first block (see the module docstring)
+        **{column: pa.string() for column in NUMERIC_COLUMNS},
+    }
+    read_options = pa_csv.ReadOptions(use_threads=True)
+    if chunksize:
+        read_options.block_size = chunksize * ARROW_BYTES_PER_ROW
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=REQUIRED_COLUMNS, column_types=types, strings_can_be_null=True,
+    )
+    return read_options, convert_options
+
+
+def _arrow_frame(data):
+    """DataFrame of an Arrow table or batch, with each measurement column that is all numbers as float64"""
+    columns = []
+    for name, column in zip(data.schema.names, data.columns):
+        if name in NUMERIC_COLUMNS:
+            try:
+                column = pc.cast(column, pa.float64())
+            except pa.ArrowInvalid:
+                pass  # left as text for api.validation to report
+        columns.append(column)
+    return type(data).from_arrays(columns, names=data.schema.names).to_pandas()
+
+
+def _arrow_chunks(source, chunksize):
+    # The header is checked first so that missing columns give the usual message
+    validate_columns(_read_header(source))
+    read_options, convert_options = _arrow_options(chunksize)
+    reader = pa_csv.open_csv(source, read_options=read_options, convert_options=convert_options)
+    for batch in reader:
+        yield _arrow_frame(batch)
+
+
+def read_csv_chunks(csv_file, chunksize=None, engine=None):
+    """
+    Return an iterator of DataFrames of the required columns, of at most
+    `chunksize` rows (pyarrow: of roughly that many rows).
+    """
+    chunksize = chunksize or settings.INGEST_CHUNK_SIZE
+    engine = parse_engine(engine)
+    if engine == 'pyarrow':
+        return _arrow_chunks(csv_file, chunksize)
+    return pd.read_csv(csv_file, chunksize=chunksize, engine=engine,
+                       usecols=_is_required, dtype=COLUMN_DTYPES)
+
+
+def read_csv(source, engine=None):
+    """Read a whole CSV file (path or file object) into one DataFrame of the required columns"""
+    engine = parse_engine(engine)
+    if engine == 'pyarrow':
+        validate_columns(_read_header(source))
+        read_options, convert_options = _arrow_options()
+        return _arrow_frame(pa_csv.read_csv(source, read_options=read_options, convert_options=convert_options))
+    return pd.read_csv(source, engine=engine, usecols=_is_required, dtype=COLUMN_DTYPES)
+
+
+def _type_categorical(series):
+    """Equipment types as a categorical of strings; missing values become 'nan' as str() would"""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.astype(str).astype('category')
+    if series.isna().any():
+        if 'nan' not in series.cat.categories:
+            series = series.cat.add_categories(['nan'])
+        series = series.fillna('nan')
+    return series
+
+
+def to_record_frame(chunk):
+    """
+    Select the required columns of a CSV chunk, rename them to
+    EquipmentRecord fields and coerce them to their stored types.
+    The equipment type stays categorical. Measurements must already be
+    numeric (see api.validation).
+    """
+    frame = chunk[REQUIRED_COLUMNS].rename(columns=COLUMN_FIELDS)
+    # Same coercion the ORM applies: str() for CharFields, float() for FloatFields
+    names = frame['equipment_name']
+    if names.hasnans:
+        names = names.fillna('nan')
+    # Parsed names are already str; only rows built from JSON may need converting
+    if pd.api.types.infer_dtype(names, skipna=False) != 'string':
+        names = names.astype(str)
+    frame['equipment_name'] = names
+    frame['equipment_type'] = _type_categorical(frame['equipment_type'])
+    for field in NUMERIC_FIELDS:
+        frame[field] = frame[field].astype('float64')
+    return frame
+
+
+def frame_from_rows(rows):
+    """
+    Build a DataFrame with the CSV column names from a list of row objects
+    keyed either by those names or by the EquipmentRecord field names.
+    """
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise IngestError('Rows must be a list of objects')
+    columns = {field: column for column, field in COLUMN_FIELDS.items()}
+    df = pd.DataFrame([{columns.get(key, key): value for key, value in row.items()} for row in rows])
+    validate_columns(df)
+    return df
+
+
+def check_header(csv_file):
+    """Validate the header row without reading the data, then rewind the file"""
+    validate_columns(_read_header(csv_file))
+
+
+def fingerprint(csv_file, block_size=1 << 20):
+    """SHA-256 of the file contents, read block by block, then rewind the file"""
+    digest = hashlib.sha256()
+    csv_file.seek(0)
+    for block in iter(lambda: csv_file.read(block_size), b''):
+        digest.update(block)
+    csv_file.seek(0)
+    return digest.hexdigest()
+
+
+def parse_file(path, engine=None):
+    """Read a whole CSV file and check its columns; rows are validated by api.validation"""
+    df = read_csv(path, engine)
+    validate_columns(df)
+    return df
@@ -0,0 +1,144 @@
+"""
+Response renderers.
+
+FastJSONRenderer produces the same JSON as DRF's JSONRenderer, encoded
+with orjson when it is installed (optional dependency) and with the
+standard library otherwise. Values orjson does not handle natively,
+including datetimes (so their format matches), go through DRF's encoder.
+Numbers in exponent form may be spelled differently (1e16, not 1e+16);
+their values are the same.
+
+The dataset detail and records endpoints also negotiate columnar
+formats (RECORD_RENDERER_CLASSES). Renderers with `columnar = True` are
+handed the records as a DataFrame, straight from the record store, and
+write one array per column instead of one object per record:
+
+    columnar   application/vnd.equipment.columnar+json
+    msgpack    application/msgpack (needs msgpack)
+    arrow      application/vnd.apache.arrow.stream (needs pyarrow); the
+               records are the table, the rest of the response is JSON
+               in the schema metadata under 'json'
+"""
+import pandas as pd
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to json.dumps
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: the msgpack format is not offered
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: the arrow format is not offered
+    pa = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer with an orjson fast path"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY,
+        )
+        # Escaped by JSONRenderer so the output is also valid JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+def frame_columns(frame, numpy=True):
+    """{column: values} of a record frame; numbers as NumPy arrays when `numpy`, otherwise lists"""
+    return {
+        column: values.to_numpy() if numpy and pd.api.types.is_numeric_dtype(values) else values.tolist()
+        for column, values in frame.items()
+    }
+
+
+def _split_frame(data):
+    """(response without its record frame, the frame or None)"""
+    if not isinstance(data, dict):
+        return data, None
+    rest = {key: value for key, value in data.items() if not isinstance(value, pd.DataFrame)}
+    frames = [value for value in data.values() if isinstance(value, pd.DataFrame)]
+    return rest, frames[0] if frames else None
+
+
+def _with_columns(data, numpy=True):
+    if not isinstance(data, dict):
+        return data
+    return {
+        key: frame_columns(value, numpy) if isinstance(value, pd.DataFrame) else value
+        for key, value in data.items()
+    }
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):
+    """JSON with records as {"id": [...], "flowrate": [...], ...}"""
+    media_type = 'application/vnd.equipment.columnar+json'
+    format = 'columnar'
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(_with_columns(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """MessagePack with the columnar JSON layout"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(_with_columns(data, numpy=False), default=JSONRenderer.encoder_class().default)
+
+
+class ArrowStreamRenderer(BaseRenderer):
+    """Arrow IPC stream of the records, with the rest of the response as JSON metadata"""
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    charset = None
+    render_style = 'binary'
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rest, frame = _split_frame(data)
+        if frame is None:
+            table = pa.table({})
+        else:
+            if 'equipment_type' in frame:
+                # Dictionary-encoded: a few distinct types repeated on every row
+                frame = frame.astype({'equipment_type': 'category'})
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b'json'] = FastJSONRenderer().render(rest)
+        table = table.replace_schema_metadata(metadata)
+
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+RECORD_RENDERER_CLASSES = [FastJSONRenderer, ColumnarJSONRenderer]
+if msgpack is not None:
+    RECORD_RENDERER_CLASSES.append(MessagePackRenderer)
+if pa is not None:
+    RECORD_RENDERER_CLASSES.append(ArrowStreamRenderer)
+RECORD_RENDERER_CLASSES.append(BrowsableAPIRenderer)
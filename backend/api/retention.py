@@ -0,0 +1,90 @@
+"""
+Dataset retention: which of a user's datasets are kept.
+
+A dataset is removed once any limit of the user's policy excludes it:
+
+    max_datasets   keep only the N newest datasets
+    max_age_days   drop datasets uploaded more than N days ago
+    max_rows       keep the newest datasets while their total row count
+                   stays within N (the newest dataset is always kept)
+
+Limits come from the user's RetentionPolicy, falling back to the
+RETENTION_* settings; 0 disables a limit. The expired set is selected in
+one query. Their records and search entries are deleted in primary-key
+batches before the datasets themselves, so no single statement has to
+cascade through millions of rows.
+"""
+from datetime import timedelta
+from functools import reduce
+import operator
+
+from django.conf import settings
+from django.db.models import F, Q, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Dataset, EquipmentRecord, RetentionPolicy, SearchEntry
+
+POLICY_FIELDS = ['max_datasets', 'max_age_days', 'max_rows']
+
+
+def get_policy(user):
+    """Effective limits for `user` as {'max_datasets', 'max_age_days', 'max_rows'}"""
+    policy = {
+        'max_datasets': settings.RETENTION_MAX_DATASETS,
+        'max_age_days': settings.RETENTION_MAX_AGE_DAYS,
+        'max_rows': settings.RETENTION_MAX_ROWS,
+    }
+    override = RetentionPolicy.objects.filter(user=user).first()
+    if override is not None:
+        for field in POLICY_FIELDS:
+            if getattr(override, field) is not None:
+                policy[field] = getattr(override, field)
+    return policy
+
+
+def expired_datasets(user, policy=None):
+    """QuerySet of the datasets of `user` that the policy no longer keeps"""
+    policy = policy or get_policy(user)
+    datasets = Dataset.objects.filter(user=user)
+    newest_first = [F('uploaded_at').desc(), F('id').desc()]
+
+    conditions = []
+    if policy['max_datasets']:
+        kept = datasets.order_by(*newest_first).values('id')[:policy['max_datasets']]
+        conditions.append(~Q(id__in=kept))
+    if policy['max_age_days']:
+        cutoff = timezone.now() - timedelta(days=policy['max_age_days'])
+        conditions.append(Q(uploaded_at__lt=cutoff))
+    if policy['max_rows']:
+        over = datasets.annotate(
+            position=Window(RowNumber(), order_by=newest_first),
+            rows_so_far=Window(Sum('total_count'), order_by=newest_first),
+        ).filter(position__gt=1, rows_so_far__gt=policy['max_rows']).values('id')
+        conditions.append(Q(id__in=over))
+
+    if not conditions:
+        return datasets.none()
+    return datasets.filter(reduce(operator.or_, conditions))
+
+
+def delete_datasets(dataset_ids, batch_size=None):
+    """Delete datasets, removing their EquipmentRecord and SearchEntry rows in batches first"""
+    batch_size = batch_size or settings.RETENTION_DELETE_BATCH_SIZE
+    for model in (EquipmentRecord, SearchEntry):
+        rows = model.objects.filter(dataset_id__in=dataset_ids).order_by()
+        while True:
+            # Each batch is its own short statement (and transaction in autocommit)
+            deleted, _ = model.objects.filter(pk__in=rows.values('pk')[:batch_size]).delete()
+            if deleted < batch_size:
+                break
+    # Per-instance delete so post_delete removes columnar files
+    Dataset.all_objects.filter(id__in=dataset_ids).delete()
+
+
+def prune_datasets(user, batch_size=None):
+    """Apply the retention policy of `user`. Returns the number of datasets removed."""
+    dataset_ids = list(expired_datasets(user).values_list('id', flat=True))
+    if dataset_ids:
+        delete_datasets(dataset_ids, batch_size)
+    return len(dataset_ids)
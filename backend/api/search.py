@@ -0,0 +1,196 @@
+"""
+Search of equipment names and types across a user's datasets.
+
+Every stored record, whichever backend holds it, has a SearchEntry row
+with its dataset, record id, name and type. The record stores write
+them as they append (see api.storage), so the index is current as soon
+as an ingest commits. A query matches records whose name or type
+contains it, ignoring case.
+
+Names go through a trigram index:
+
+    SQLite       an FTS5 table with the trigram tokenizer over the
+                 SearchEntry names (external content, kept in step by
+                 triggers), scanned over the id range of each of the
+                 user's datasets in turn
+    PostgreSQL   a GIN gin_trgm_ops index (pg_trgm) on the name
+
+Migration 0014 creates them. Other databases fall back to unindexed
+icontains, as does SQLite before 3.34, which has no trigram tokenizer
+(the migration leaves the FTS table out there). Trigrams need queries
+of at least MIN_QUERY_LENGTH characters. Types are too few to index
+that way (every row would hold the trigrams of one of a handful of
+values): the matching types are picked from the type counts stored on
+each dataset, and their records read through the (dataset, type) index.
+
+Results are the name matches first, closest (shortest name) first, then
+the records whose type matches, each in record order. Only the first
+RANK_WINDOW name matches are ranked, so a query that matches most
+records costs no more than a selective one.
+"""
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Dataset, EquipmentRecord, SearchEntry
+
+MIN_QUERY_LENGTH = 3
+
+# Name matches ranked per query (at least the limit)
+RANK_WINDOW = 1000
+
+FTS_TABLE = 'api_searchentry_fts'
+
+# Keys of a search result
+RESULT_FIELDS = ['dataset_id', 'filename', 'record_id', 'equipment_name', 'equipment_type']
+
+
+def index_frame(dataset, frame, first_id):
+    """Add SearchEntry rows for a record frame whose first record has id `first_id`"""
+    if frame.empty:
+        return
+    # Multi-row INSERTs rather than executemany: FTS5 flushes its pending
+    # terms at every statement, so one row per statement writes one index
+    # segment per row (about six times slower on SQLite)
+    table = SearchEntry._meta.db_table
+    rows_per_statement = (connection.features.max_query_params or 4000) // 4
+    params = []
+    for row in zip([dataset.id] * len(frame), range(first_id, first_id + len(frame)),
+                   frame['equipment_name'].tolist(), frame['equipment_type'].tolist()):
+        params.extend(row)
+    with connection.cursor() as cursor:
+        for start in range(0, len(frame), rows_per_statement):
+            chunk = params[start * 4:(start + rows_per_statement) * 4]
+            cursor.execute(
+                f'INSERT INTO {table} (dataset_id, record_id, equipment_name, equipment_type) VALUES '
+                + ', '.join(['(%s, %s, %s, %s)'] * (len(chunk) // 4)),
+                chunk,
+            )
+
+
+def index_database_records(dataset, after=0):
+    """Add SearchEntry rows for the EquipmentRecord rows of `dataset` with id greater than `after`"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {SearchEntry._meta.db_table} (dataset_id, record_id, equipment_name, equipment_type) '
+            f'SELECT dataset_id, id, equipment_name, equipment_type FROM {EquipmentRecord._meta.db_table} '
+            'WHERE dataset_id = %s AND id > %s ORDER BY id',
+            [dataset.id, after],
+        )
+
+
+def _like_pattern(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _fts_phrase(query):
+    # One quoted phrase: the trigram tokenizer matches it as a substring
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _has_fts_table():
+    """Whether the migration created the FTS5 trigram table"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def matching_types(query, datasets):
+    """{dataset id: [types containing `query`]} from the type counts stored on `datasets`"""
+    query = query.lower()
+    types = {}
+    for dataset_id, type_counts in datasets.values_list('id', 'equipment_types'):
+        matched = sorted(eq_type for eq_type in type_counts or {} if query in eq_type.lower())
+        if matched:
+            types[dataset_id] = matched
+    return types
+
+
+def matching_entries(query):
+    """SearchEntry queryset of the entries whose name or type contains `query`, through the indexes"""
+    if connection.vendor == 'sqlite' and _has_fts_table():
+        names = Q(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [_fts_phrase(query)]))
+    elif connection.vendor == 'postgresql':
+        names = Q(id__in=RawSQL('SELECT id FROM api_searchentry WHERE equipment_name ILIKE %s', [_like_pattern(query)]))
+    else:
+        names = Q(equipment_name__icontains=query)
+    types = Q()
+    for dataset_id, eq_types in matching_types(query, Dataset.objects.all()).items():
+        types |= Q(dataset_id=dataset_id, equipment_type__in=eq_types)
+    return SearchEntry.objects.filter(names | types) if types else SearchEntry.objects.filter(names)
+
+
+def _sqlite_name_rows(dataset_ids, query, window):
+    rows = []
+    with connection.cursor() as cursor:
+        for dataset_id in dataset_ids:
+            # The FTS table holds every user's names: bound the scan to the
+            # dataset's id range, and CROSS JOIN keeps the FTS scan driving
+            ids = SearchEntry.objects.filter(dataset_id=dataset_id).order_by('id').values_list('id', flat=True)
+            bounds = ids.first(), ids.last()
+            if bounds[0] is None:
+                continue
+            cursor.execute(
+                f'SELECT e.id, e.dataset_id, e.record_id, e.equipment_name, e.equipment_type FROM {FTS_TABLE} '
+                f'CROSS JOIN api_searchentry e ON e.id = {FTS_TABLE}.rowid WHERE {FTS_TABLE} MATCH %s '
+                f'AND {FTS_TABLE}.rowid BETWEEN %s AND %s AND e.dataset_id = %s LIMIT %s',
+                [_fts_phrase(query), *bounds, dataset_id, window - len(rows)],
+            )
+            rows += cursor.fetchall()
+            if len(rows) >= window:
+                break
+    return rows
+
+
+def _name_rows(dataset_ids, query, window):
+    """(id, dataset_id, record_id, name, type) of up to `window` records whose name contains `query`"""
+    if connection.vendor == 'sqlite' and _has_fts_table():
+        return _sqlite_name_rows(dataset_ids, query, window)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id, dataset_id, record_id, equipment_name, equipment_type FROM api_searchentry '
+                'WHERE dataset_id = ANY(%s) AND equipment_name ILIKE %s LIMIT %s',
+                [list(dataset_ids), _like_pattern(query), window],
+            )
+            return cursor.fetchall()
+    return list(SearchEntry.objects.filter(dataset_id__in=dataset_ids, equipment_name__icontains=query)
+                .order_by('id').values_list('id', 'dataset_id', 'record_id', 'equipment_name',
+                                            'equipment_type')[:window])
+
+
+def _type_rows(datasets, query, limit):
+    """(dataset_id, record_id, name, type) of up to `limit` records whose type, but not name, contains `query`"""
+    rows = []
+    for dataset_id, eq_types in matching_types(query, datasets).items():
+        for eq_type in eq_types:
+            if len(rows) >= limit:
+                return rows
+            entries = (SearchEntry.objects.filter(dataset_id=dataset_id, equipment_type=eq_type)
+                       .exclude(equipment_name__icontains=query).order_by('record_id')
+                       .values_list('dataset_id', 'record_id', 'equipment_name', 'equipment_type'))
+            rows += entries[:limit - len(rows)]
+    return rows
+
+
+def search_records(user, query, limit=20):
+    """
+    The best `limit` records of `user`'s datasets whose name or type contains
+    `query`, as dicts with the RESULT_FIELDS keys. Raises ValueError for a
+    query that is too short.
+    """
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        raise ValueError(f'Search for at least {MIN_QUERY_LENGTH} characters')
+
+    datasets = Dataset.objects.filter(user=user).order_by('id')
+    filenames = dict(datasets.values_list('id', 'filename'))
+    names = sorted(_name_rows(list(filenames), query, max(RANK_WINDOW, limit)),
+                   key=lambda row: (len(row[3]), row[0]))
+    rows = [row[1:] for row in names[:limit]]
+    # Fewer name matches than the limit means they were all found
+    if len(rows) < limit:
+        rows += _type_rows(datasets, query, limit - len(rows))
+    return [dict(zip(RESULT_FIELDS, (dataset_id, filenames[dataset_id], record_id, name, eq_type)))
+            for dataset_id, record_id, name, eq_type in rows]
@@ -1,6 +1,19 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Dataset, EquipmentRecord
+from .models import Dataset, EquipmentRecord, IngestJob, UploadSession
+from .stats import public_statistics
+from .storage import get_store, records_from_rows
+
+
+class DynamicFieldsMixin:
+    """Accepts a `fields` argument naming the subset of fields to output"""
+    
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -22,7 +35,7 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class EquipmentRecordSerializer(serializers.ModelSerializer):
+class EquipmentRecordSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Equipment Record model"""
     
     class Meta:
@@ -30,29 +43,77 @@ class EquipmentRecordSerializer(serializers.ModelSerializer):
         fields = ['id', 'equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature']
 
 
-class DatasetSerializer(serializers.ModelSerializer):
-    """Serializer for Dataset model"""
-    records = EquipmentRecordSerializer(many=True, read_only=True)
+class DatasetSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Serializer for Dataset model. Pass record_fields in the context to
+    project the records, and columnar=True to get them as a DataFrame.
+    """
+    records = serializers.SerializerMethodField()
     username = serializers.CharField(source='user.username', read_only=True)
+    statistics = serializers.SerializerMethodField()
     
     class Meta:
         model = Dataset
         fields = [
             'id', 'filename', 'uploaded_at', 'username',
             'total_count', 'avg_flowrate', 'avg_pressure', 
-            'avg_temperature', 'equipment_types', 'records'
+            'avg_temperature', 'equipment_types', 'statistics', 'records'
         ]
         read_only_fields = ['uploaded_at']
+    
+    def get_records(self, obj):
+        # Read through the dataset's record store so every backend is served.
+        # Records are plain dicts built from tuples: a nested
+        # EquipmentRecordSerializer costs several times more per record.
+        # Columnar renderers (context['columnar']) take the DataFrame itself.
+        record_fields = self.context.get('record_fields', EquipmentRecordSerializer.Meta.fields)
+        fields = [f for f in record_fields if f != 'id']
+        if self.context.get('columnar'):
+            return get_store(obj).read_frame(obj, fields or ['flowrate'])[record_fields]
+        rows = get_store(obj).read_rows(obj, fields or ['flowrate'])
+        return records_from_rows(rows, fields, include_id='id' in record_fields)
+
+    def get_statistics(self, obj):
+        return public_statistics(obj.statistics)
 
 
-class DatasetSummarySerializer(serializers.ModelSerializer):
+class DatasetSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Dataset summary (without records)"""
     username = serializers.CharField(source='user.username', read_only=True)
+    statistics = serializers.SerializerMethodField()
     
     class Meta:
         model = Dataset
         fields = [
             'id', 'filename', 'uploaded_at', 'username',
             'total_count', 'avg_flowrate', 'avg_pressure', 
-            'avg_temperature', 'equipment_types'
+            'avg_temperature', 'equipment_types', 'statistics'
         ]
+
+    def get_statistics(self, obj):
+        return public_statistics(obj.statistics)
+
+
+class IngestJobSerializer(serializers.ModelSerializer):
+    """Serializer for background ingest job status"""
+    dataset_id = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = IngestJob
+        fields = [
+            'id', 'kind', 'filename', 'state', 'rows_processed', 'error', 'validation_mode',
+            'validation', 'files', 'dataset_id', 'deduplicated', 'created_at', 'started_at', 'finished_at'
+        ]
+
+    def get_dataset_id(self, job):
+        # A running job's dataset is still hidden
+        return job.dataset_id if job.state == IngestJob.SUCCEEDED else None
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer for resumable upload sessions"""
+    
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'offset', 'created_at']
+        read_only_fields = ['offset', 'created_at']
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Dataset
+from .storage import get_store
+
+
+@receiver(post_delete, sender=Dataset)
+def delete_stored_records(sender, instance, **kwargs):
+    """Remove records kept outside the database; table rows go by cascade"""
+    if instance.storage != 'database':
+        get_store(instance).delete(instance)
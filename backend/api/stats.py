@@ -0,0 +1,144 @@
+"""
+Single-pass descriptive statistics.
+
+Every parameter is summarised as
+
+    {'count', 'null_count', 'min', 'max', 'mean', 'std', 'm2'}
+
+where `m2` is the sum of squared deviations from the mean. Summaries of
+separate chunks are combined with the parallel form of Welford's
+algorithm (Chan et al.), so the result is exact however the data was
+split and the stored summaries can be extended later without rescanning
+any records. `std` is the sample standard deviation (ddof=1, like pandas).
+`m2` is only needed to merge: it is stored, but the API serves the
+summaries through public_statistics(), without it.
+"""
+import math
+
+from .parsing import NUMERIC_FIELDS
+
+# Summary keys kept only to merge summaries later
+MERGE_KEYS = ['m2']
+
+
+def empty_summary():
+    return {'count': 0, 'null_count': 0, 'min': None, 'max': None, 'mean': None, 'std': None, 'm2': 0.0}
+
+
+def _finish(summary):
+    """Fill in std and return the summary with its keys in the documented order"""
+    count = summary['count']
+    std = math.sqrt(summary['m2'] / (count - 1)) if count > 1 else None
+    return {
+        'count': count,
+        'null_count': summary['null_count'],
+        'min': summary['min'],
+        'max': summary['max'],
+        'mean': summary['mean'],
+        'std': std,
+        'm2': summary['m2'],
+    }
+
+
+def merge_summaries(a, b):
+    """Combine the summaries of two disjoint sets of values"""
+    if not b['count']:
+        merged = dict(a)
+    elif not a['count']:
+        merged = dict(b)
+    else:
+        count = a['count'] + b['count']
+        delta = b['mean'] - a['mean']
+        merged = {
+            'count': count,
+            'min': min(a['min'], b['min']),
+            'max': max(a['max'], b['max']),
+            'mean': a['mean'] + delta * b['count'] / count,
+            'm2': a['m2'] + b['m2'] + delta * delta * a['count'] * b['count'] / count,
+        }
+    merged['null_count'] = a['null_count'] + b['null_count']
+    return _finish(merged)
+
+
+def _summary_from_agg(count, size, mean, var, minimum, maximum):
+    count = int(count)
+    if not count:
+        summary = empty_summary()
+    else:
+        summary = {
+            'count': count,
+            'min': float(minimum),
+            'max': float(maximum),
+            'mean': float(mean),
+            # var is NaN for a single value; its m2 is 0
+            'm2': float(var) * (count - 1) if count > 1 else 0.0,
+        }
+    summary['null_count'] = int(size) - count
+    return _finish(summary)
+
+
+AGGREGATES = ['count', 'size', 'mean', 'var', 'min', 'max']
+
+
+def summarize_frame(frame):
+    """
+    Summaries of one record frame: ({field: summary}, {type: {field: summary}}),
+    computed column-wise without Python loops over rows.
+    """
+    overall_agg = frame[NUMERIC_FIELDS].agg(AGGREGATES)
+    overall = {
+        field: _summary_from_agg(*(overall_agg.at[name, field] for name in AGGREGATES))
+        for field in NUMERIC_FIELDS
+    }
+
+    by_type = {}
+    if len(frame):
+        grouped = frame.groupby('equipment_type', sort=False, observed=True)[NUMERIC_FIELDS].agg(AGGREGATES)
+        for eq_type, row in grouped.iterrows():
+            by_type[eq_type] = {
+                field: _summary_from_agg(*(row[(field, name)] for name in AGGREGATES))
+                for field in NUMERIC_FIELDS
+            }
+    return overall, by_type
+
+
+class StatsAccumulator:
+    """Overall and per-type summaries, extended one frame at a time"""
+
+    def __init__(self, statistics=None):
+        statistics = statistics or {}
+        self.overall = {field: empty_summary() for field in NUMERIC_FIELDS}
+        self.overall.update(statistics.get('overall', {}))
+        self.by_type = {eq_type: dict(fields) for eq_type, fields in statistics.get('by_type', {}).items()}
+
+    def update(self, frame):
+        overall, by_type = summarize_frame(frame)
+        for field, summary in overall.items():
+            self.overall[field] = merge_summaries(self.overall[field], summary)
+        for eq_type, fields in by_type.items():
+            current = self.by_type.setdefault(eq_type, {f: empty_summary() for f in NUMERIC_FIELDS})
+            for field, summary in fields.items():
+                current[field] = merge_summaries(current[field], summary)
+
+    def mean(self, field):
+        return self.overall[field]['mean'] or 0.0
+
+    def to_json(self):
+        return {'overall': self.overall, 'by_type': self.by_type}
+
+
+def _public_summary(summary):
+    return {key: value for key, value in summary.items() if key not in MERGE_KEYS}
+
+
+def public_statistics(statistics):
+    """Stored dataset statistics as served by the API, without the MERGE_KEYS"""
+    if not statistics:
+        return statistics
+    return {
+        'overall': {field: _public_summary(summary) for field, summary in statistics.get('overall', {}).items()},
+        'by_type': {
+            eq_type: {field: _public_summary(summary) for field, summary in fields.items()}
+            for eq_type, fields in statistics.get('by_type', {}).items()
+        },
+    }
@@ -0,0 +1,279 @@
+"""
+Record storage backends.
+
+A dataset's records live either in the EquipmentRecord table
+('database') or as packed NumPy column files under MEDIA_ROOT
+('columnar'). Dataset.storage records which; everything that writes or
+reads records goes through get_store(dataset) so either backend can
+serve every view.
+
+Columnar layout, one part file per ingested chunk:
+
+    MEDIA_ROOT/columnar/<dataset id>/part-00000.npz
+        flowrate, pressure, temperature   float64
+        type_codes                        uint16 indexes into type_values
+        type_values                       unicode, one entry per distinct type
+        names                             UTF-8 names joined by NUL bytes
+
+Columnar records have no table row, so their id is their 1-based
+position in the dataset. Dataset.part_count numbers the parts.
+"""
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.conf import settings
+import numpy as np
+import pandas as pd
+
+from .bulkload import RECORD_FIELDS, load_records
+from .filtering import RecordQuery
+from .models import EquipmentRecord
+from .parsing import NUMERIC_FIELDS
+from .search import index_database_records, index_frame
+
+
+class RecordStore:
+    """Interface shared by the storage backends"""
+    name = None
+
+    def append(self, dataset, frame):
+        """Store the rows of a record frame (see parsing.to_record_frame) and index them for search"""
+        raise NotImplementedError
+
+    def read_frame(self, dataset, fields=None):
+        """
+        Return the dataset's records as a DataFrame with an 'id' column
+        followed by `fields` (default: all record fields), in record order.
+        """
+        raise NotImplementedError
+
+    def read_page(self, dataset, after=0, limit=100, fields=None, query=None):
+        """
+        Like read_frame(), but only the first `limit` records whose id is
+        greater than `after` (keyset pagination). With a RecordQuery
+        (see api.filtering), only the records passing its filters, in its
+        order, after its cursor.
+        """
+        raise NotImplementedError
+
+    def read_rows(self, dataset, fields=None, after=0, limit=None, query=None):
+        """
+        Like read_page(), or read_frame() when `limit` and `query` are None,
+        but as a list of (id, *fields) tuples of Python values. Cheaper than
+        a DataFrame when the records are only going to be serialized.
+        """
+        if limit is None and query is None:
+            frame = self.read_frame(dataset, fields)
+        else:
+            frame = self.read_page(dataset, after, limit, fields, query)
+        return list(zip(*(frame[column].tolist() for column in frame)))
+
+    def count(self, dataset, query):
+        """Number of records passing the filters of a RecordQuery"""
+        raise NotImplementedError
+
+    def delete(self, dataset):
+        """Drop every stored record of the dataset"""
+        raise NotImplementedError
+
+
+class DatabaseRecordStore(RecordStore):
+    """One EquipmentRecord row per measurement"""
+    name = 'database'
+
+    def append(self, dataset, frame):
+        # The new rows get ids above the dataset's last one
+        last_id = EquipmentRecord.objects.filter(dataset_id=dataset.id).order_by('-id').values_list(
+            'id', flat=True).first()
+        load_records(dataset.id, frame)
+        index_database_records(dataset, after=last_id or 0)
+
+    def read_frame(self, dataset, fields=None):
+        columns = ['id'] + list(fields or RECORD_FIELDS)
+        rows = EquipmentRecord.objects.filter(dataset_id=dataset.id).order_by('id').values_list(*columns)
+        return pd.DataFrame.from_records(list(rows), columns=columns)
+
+    def queryset(self, dataset, after=0, query=None):
+        """The dataset's records after the cursor, filtered and ordered by `query` (default: by id)"""
+        # Served by the (dataset, id) index whatever the page, or by the
+        # (dataset, <field>) index of a filter or ordering
+        return (query or RecordQuery()).apply(EquipmentRecord.objects.filter(dataset_id=dataset.id), after)
+
+    def read_page(self, dataset, after=0, limit=100, fields=None, query=None):
+        columns = ['id'] + list(fields or RECORD_FIELDS)
+        rows = self.queryset(dataset, after, query).values_list(*columns)[:limit]
+        return pd.DataFrame.from_records(list(rows), columns=columns)
+
+    def read_rows(self, dataset, fields=None, after=0, limit=None, query=None):
+        # values_list tuples are already the result
+        rows = self.queryset(dataset, after, query).values_list('id', *(fields or RECORD_FIELDS))
+        return list(rows if limit is None else rows[:limit])
+
+    def count(self, dataset, query):
+        return EquipmentRecord.objects.filter(dataset_id=dataset.id).filter(query.filter_q()).count()
+
+    def delete(self, dataset):
+        EquipmentRecord.objects.filter(dataset_id=dataset.id).delete()
+
+
+class ColumnarRecordStore(RecordStore):
+    """Typed column arrays in .npz part files"""
+    name = 'columnar'
+
+    def directory(self, dataset):
+        return os.path.join(settings.MEDIA_ROOT, 'columnar', str(dataset.id))
+
+    def _parts(self, dataset):
+        directory = self.directory(dataset)
+        if not os.path.isdir(directory):
+            return []
+        return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith('.npz')]
+
+    def append(self, dataset, frame):
+        """
+        Write a part file. `dataset` must be the locked row, with total_count
+        and part_count up to date: they give the first record id and the part
+        name, and part_count is advanced here (the caller saves it).
+        """
+        if frame.empty:
+            return
+        directory = self.directory(dataset)
+        os.makedirs(directory, exist_ok=True)
+        first_id = dataset.total_count + 1
+        types = pd.Categorical(frame['equipment_type'])
+        arrays = {field: frame[field].to_numpy(dtype='float64') for field in NUMERIC_FIELDS}
+        arrays['type_codes'] = types.codes.astype('uint16')
+        arrays['type_values'] = np.asarray(types.categories, dtype=str)
+        arrays['names'] = np.frombuffer('\0'.join(frame['equipment_name']).encode('utf-8'), dtype='uint8')
+
+        path = os.path.join(directory, f'part-{dataset.part_count:05d}.npz')
+        # Write under a temporary name so readers never see a partial part, then
+        # link it into place: unlike a rename, the link fails if a concurrent
+        # append already wrote this part, rather than replacing its records
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.link(tmp_path, path)
+        finally:
+            os.remove(tmp_path)
+        dataset.part_count += 1
+        index_frame(dataset, frame, first_id)
+
+    def _read_part(self, part, fields, start=0, stop=None):
+        columns = {}
+        with np.load(part) as data:
+            for field in fields:
+                if field in NUMERIC_FIELDS:
+                    columns[field] = data[field][start:stop]
+                elif field == 'equipment_type':
+                    columns[field] = data['type_values'][data['type_codes'][start:stop]]
+                elif field == 'equipment_name':
+                    columns[field] = data['names'].tobytes().decode('utf-8').split('\0')[start:stop]
+        return columns
+
+    def _part_length(self, part):
+        """Row count of a part, read from an array header without loading any data"""
+        with zipfile.ZipFile(part) as archive, archive.open('flowrate.npy') as f:
+            if np.lib.format.read_magic(f) == (1, 0):
+                shape, _, _ = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, _ = np.lib.format.read_array_header_2_0(f)
+        return shape[0]
+
+    def _frame(self, parts, fields, first_id):
+        if not parts:
+            return pd.DataFrame(columns=['id'] + fields)
+        frame = pd.DataFrame({
+            field: np.concatenate([np.asarray(part[field]) for part in parts])
+            for field in fields
+        })
+        frame.insert(0, 'id', np.arange(first_id, first_id + len(frame)))
+        return frame
+
+    def read_frame(self, dataset, fields=None):
+        fields = list(fields or RECORD_FIELDS)
+        parts = [self._read_part(part, fields) for part in self._parts(dataset)]
+        return self._frame(parts, fields, 1)
+
+    def read_page(self, dataset, after=0, limit=100, fields=None, query=None):
+        fields = list(fields or RECORD_FIELDS)
+        if query is not None:
+            # Filters and orderings need whole columns, but only their own:
+            # the page's ids pick the rows of the projected fields
+            keys = query.apply_frame(self.read_frame(dataset, query.fields), after)
+            return self._read_ids(dataset, fields, keys['id'].to_numpy()[:limit])
+        # Ids are positions, so record `after` + 1 is row `after` (0-based)
+        start, stop = max(after, 0), max(after, 0) + limit
+        parts = []
+        offset = 0
+        for part in self._parts(dataset):
+            if offset >= stop:
+                break
+            length = self._part_length(part)
+            if offset + length > start:
+                parts.append(self._read_part(part, fields, max(start - offset, 0), stop - offset))
+            offset += length
+        return self._frame(parts, fields, start + 1)
+
+    def _read_ids(self, dataset, fields, ids):
+        """Frame of the records with these ids (1-based positions), in the order given"""
+        if not len(ids):
+            return self._frame([], fields, 1)
+        # Visit the parts in position order, reading each only over the span it contributes
+        order = np.argsort(ids, kind='stable')
+        positions = np.asarray(ids, dtype='int64')[order] - 1
+        parts = []
+        offset = 0
+        for part in self._parts(dataset):
+            if offset > positions[-1]:
+                break
+            length = self._part_length(part)
+            lo, hi = np.searchsorted(positions, [offset, offset + length])
+            if hi > lo:
+                start, stop = positions[lo] - offset, positions[hi - 1] - offset + 1
+                columns = self._read_part(part, fields, start, stop)
+                rows = positions[lo:hi] - offset - start
+                parts.append({field: np.asarray(columns[field])[rows] for field in fields})
+            offset += length
+        frame = self._frame(parts, fields, 1)
+        frame['id'] = positions + 1
+        # Back from position order to the order asked for
+        return frame.iloc[np.argsort(order, kind='stable')].reset_index(drop=True)
+
+    def count(self, dataset, query):
+        if not query.filters:
+            return dataset.total_count
+        # Only the filtered columns are read to build the mask
+        frame = self.read_frame(dataset, list(dict.fromkeys(field for field, _, _ in query.filters)))
+        return int(query.mask(frame).sum())
+
+    def delete(self, dataset):
+        shutil.rmtree(self.directory(dataset), ignore_errors=True)
+
+
+STORES = {store.name: store for store in (DatabaseRecordStore(), ColumnarRecordStore())}
+
+
+def get_store(dataset):
+    """The RecordStore that holds `dataset`'s records"""
+    return STORES[dataset.storage]
+
+
+def records_from_frame(frame):
+    """Record dicts with the EquipmentRecordSerializer field names"""
+    return frame.to_dict('records')
+
+
+def records_from_rows(rows, fields=None, include_id=True):
+    """
+    Record dicts from read_rows() tuples, keyed like EquipmentRecordSerializer
+    and without any per-field serializer work.
+    """
+    fields = RECORD_FIELDS if fields is None else list(fields)
+    if include_id:
+        names = ['id'] + fields
+        return [dict(zip(names, row)) for row in rows]
+    return [dict(zip(fields, row[1:])) for row in rows]
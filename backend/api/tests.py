@@ -0,0 +1,1764 @@
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+import importlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import mock, skipUnless
+import zipfile
+
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+import numpy as np
+import pandas as pd
+
+from . import batch
+from .aggregation import METRICS, aggregate_datasets
+from .bulkload import RECORD_FIELDS, load_method, load_records
+from .downsample import lttb, minmax
+from .filtering import RecordQuery
+from .ingest import append_frames, ingest_csv
+from .jobs import claim_job, claim_next_job, fail_stale_jobs, recover_jobs
+from .models import Dataset, EquipmentRecord, IngestJob, RetentionPolicy, SearchEntry
+from .parsing import (
+    ARROW_BYTES_PER_ROW, NUMERIC_FIELDS, IngestError, check_header, fingerprint, frame_from_rows, parse_engine,
+    parse_file, pa_csv, read_csv, read_csv_chunks, to_record_frame,
+)
+from .renderers import FastJSONRenderer, msgpack, pa
+from .retention import expired_datasets, get_policy, prune_datasets
+from .search import FTS_TABLE
+from .serializers import DatasetSerializer, EquipmentRecordSerializer
+from .stats import merge_summaries, summarize_frame
+from .storage import STORES, get_store, records_from_rows
+from .validation import ValidationFailed, ValidationReport, parse_and_validate, validated_frames
+
+
+def record_index(*fields):
+    """Name of the EquipmentRecord index on exactly these fields"""
+    return next(index.name for index in EquipmentRecord._meta.indexes if index.fields == list(fields))
+
+
+def sample_frame(n=60):
+    types = ['Pump', 'Valve', 'Reactor']
+    return pd.DataFrame({
+        'Equipment Name': [f'{types[i % 3][0]}-{i}' for i in range(n)],
+        'Type': [types[i % 3] for i in range(n)],
+        'Flowrate': [100.0 + i for i in range(n)],
+        'Pressure': [float(i % 10) for i in range(n)],
+        'Temperature': [float((i * 7) % 13) for i in range(n)],
+    })
+
+
+def csv_bytes(frame):
+    return frame.to_csv(index=False).encode()
+
+
+def post_csv(client, frame, name='plant.csv', **data):
+    """POST `frame` as a CSV file to the upload endpoint"""
+    return client.post('/api/datasets/upload/', {
+        'file': SimpleUploadedFile(name, csv_bytes(frame), content_type='text/csv'), **data,
+    })
+
+
+class ChunkedIngestTests(TestCase):
+    """CSV files are read and stored one chunk at a time, all or nothing"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('chunks', password='secret')
+        self.dataset = Dataset.objects.create(user=self.user, filename='chunks.csv', storage='database')
+        self.frame = sample_frame(250)
+
+    def test_chunks_add_up_to_the_whole_file(self):
+        chunks = list(read_csv_chunks(io.BytesIO(csv_bytes(self.frame)), chunksize=40, engine='c'))
+        self.assertEqual([len(chunk) for chunk in chunks], [40] * 6 + [10])
+
+        with override_settings(CSV_PARSE_ENGINE='c'):
+            stats = ingest_csv(io.BytesIO(csv_bytes(self.frame)), self.dataset, chunksize=40)
+        self.dataset.refresh_from_db()
+        self.assertEqual(stats.count, 250)
+        self.assertEqual(EquipmentRecord.objects.filter(dataset=self.dataset).count(), 250)
+        self.assertEqual(self.dataset.total_count, 250)
+        self.assertEqual(self.dataset.avg_flowrate, round(self.frame['Flowrate'].mean(), 2))
+        self.assertEqual(self.dataset.avg_temperature, round(self.frame['Temperature'].mean(), 2))
+        self.assertEqual(self.dataset.equipment_types, self.frame['Type'].value_counts().to_dict())
+
+    def test_bad_chunk_leaves_nothing_behind(self):
+        frame = self.frame.astype({'Flowrate': object})
+        frame.loc[200, 'Flowrate'] = 'high'
+        with override_settings(CSV_PARSE_ENGINE='c'), self.assertRaises(ValidationFailed):
+            ingest_csv(io.BytesIO(csv_bytes(frame)), self.dataset, chunksize=40, mode='strict')
+        self.dataset.refresh_from_db()
+        self.assertFalse(EquipmentRecord.objects.filter(dataset=self.dataset).exists())
+        self.assertEqual(self.dataset.total_count, 0)
+
+
+class BulkLoadTests(TestCase):
+    """Every load path stores the same rows as the ORM would"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('bulk', password='secret')
+        self.frame = to_record_frame(sample_frame(25))
+
+    def stored_rows(self, dataset):
+        return list(EquipmentRecord.objects.filter(dataset=dataset).order_by('id').values_list(*RECORD_FIELDS))
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite load path')
+    def test_sqlite_uses_executemany(self):
+        self.assertEqual(load_method(), 'executemany')
+
+    def test_load_paths_store_identical_rows(self):
+        expected = [tuple(row) for row in self.frame[RECORD_FIELDS].itertuples(index=False)]
+        methods = ['executemany', 'bulk_create'] + (['copy'] if load_method() == 'copy' else [])
+        for method in methods:
+            with self.subTest(method=method), override_settings(BULK_LOAD_BATCH_SIZE=7):
+                dataset = Dataset.objects.create(user=self.user, filename=f'{method}.csv', storage='database')
+                load_records(dataset.id, self.frame, method=method)
+                self.assertEqual(self.stored_rows(dataset), expected)
+
+    def test_empty_frame_loads_nothing(self):
+        dataset = Dataset.objects.create(user=self.user, filename='empty.csv', storage='database')
+        load_records(dataset.id, self.frame.iloc[:0], method='executemany')
+        self.assertEqual(self.stored_rows(dataset), [])
+
+
+@override_settings(INGEST_WORKERS=0)
+class IngestJobTests(TestCase):
+    """Uploads are queued as jobs and only their finished datasets are visible"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('jobs', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, frame, **data):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            return post_csv(self.client, frame, **data)
+
+    def listed_ids(self):
+        return [dataset['id'] for dataset in self.client.get('/api/datasets/').json()]
+
+    def test_upload_runs_job_to_a_listed_dataset(self):
+        response = self.upload(sample_frame(30))
+        self.assertEqual(response.status_code, 202)
+        job = self.client.get(f"/api/jobs/{response.json()['id']}/").json()
+        self.assertEqual(job['state'], IngestJob.SUCCEEDED)
+        self.assertEqual(job['rows_processed'], 30)
+        self.assertEqual(self.listed_ids(), [job['dataset_id']])
+        self.assertEqual(Dataset.objects.get(id=job['dataset_id']).total_count, 30)
+
+    def test_failed_job_leaves_no_dataset(self):
+        frame = sample_frame(30).astype({'Pressure': object})
+        frame.loc[3, 'Pressure'] = 'n/a'
+        job = self.client.get(f"/api/jobs/{self.upload(frame, validation='strict').json()['id']}/").json()
+        self.assertEqual(job['state'], IngestJob.FAILED)
+        self.assertIsNone(job['dataset_id'])
+        self.assertTrue(job['error'])
+        self.assertFalse(Dataset.all_objects.exists())
+
+    def test_unfinished_dataset_is_hidden(self):
+        hidden = Dataset.objects.create(user=self.user, filename='partial.csv', ready=False)
+        shown = Dataset.objects.create(user=self.user, filename='done.csv')
+        self.assertEqual(self.listed_ids(), [shown.id])
+        self.assertEqual(self.client.get(f'/api/datasets/{hidden.id}/').status_code, 404)
+        self.assertTrue(Dataset.all_objects.filter(id=hidden.id).exists())
+
+    def test_jobs_are_claimed_oldest_first_and_once(self):
+        now = timezone.now()
+        newer = IngestJob.objects.create(user=self.user, filename='b.csv', created_at=now)
+        older = IngestJob.objects.create(user=self.user, filename='a.csv', created_at=now - timedelta(minutes=5))
+        self.assertEqual(claim_next_job(), older.id)
+        self.assertFalse(claim_job(older.id))
+        self.assertEqual(claim_next_job(), newer.id)
+        self.assertIsNone(claim_next_job())
+
+    def test_stale_running_job_is_failed(self):
+        dataset = Dataset.objects.create(user=self.user, filename='stuck.csv', ready=False)
+        started = timezone.now() - timedelta(minutes=90)
+        stale = IngestJob.objects.create(user=self.user, filename='stuck.csv', state=IngestJob.RUNNING,
+                                         started_at=started, heartbeat_at=started, dataset=dataset)
+        # Started as long ago, but still making progress
+        busy = IngestJob.objects.create(user=self.user, filename='busy.csv', state=IngestJob.RUNNING,
+                                        started_at=started, heartbeat_at=timezone.now())
+        with override_settings(INGEST_JOB_TIMEOUT_MINUTES=60):
+            self.assertEqual(fail_stale_jobs(), 1)
+        stale.refresh_from_db()
+        busy.refresh_from_db()
+        self.assertEqual(stale.state, IngestJob.FAILED)
+        self.assertEqual(busy.state, IngestJob.RUNNING)
+        self.assertFalse(Dataset.all_objects.filter(id=dataset.id).exists())
+
+    def test_progress_moves_the_heartbeat(self):
+        with override_settings(INGEST_WORKERS=0):
+            job_id = self.upload(sample_frame(30)).json()['id']
+        job = IngestJob.objects.get(id=job_id)
+        self.assertIsNotNone(job.heartbeat_at)
+        self.assertGreaterEqual(job.heartbeat_at, job.started_at)
+
+    def test_pool_start_recovers_left_jobs(self):
+        started = timezone.now() - timedelta(minutes=90)
+        stale = IngestJob.objects.create(user=self.user, filename='lost.csv', state=IngestJob.RUNNING,
+                                         started_at=started, heartbeat_at=started)
+        pending = IngestJob.objects.create(user=self.user, filename='waiting.csv')
+        with mock.patch('api.jobs._get_executor') as get_executor:
+            self.assertEqual(recover_jobs(), 1)
+        submit = get_executor.return_value.submit
+        self.assertEqual(submit.call_count, 1)
+        self.assertEqual(submit.call_args.args[1], pending.id)
+        stale.refresh_from_db()
+        self.assertEqual(stale.state, IngestJob.FAILED)
+
+
+@override_settings(INGEST_WORKERS=0)
+class DeduplicationTests(TestCase):
+    """An identical file validated the same way is answered with the existing dataset"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('dedup', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.frame = sample_frame(40)
+
+    def upload(self, frame, **data):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            return post_csv(self.client, frame, **data).json()
+
+    def test_identical_file_returns_existing_dataset(self):
+        first = self.upload(self.frame, name='a.csv')
+        second = self.upload(self.frame, name='b.csv')
+        self.assertFalse(first['deduplicated'])
+        self.assertTrue(second['deduplicated'])
+        self.assertEqual(second['state'], IngestJob.SUCCEEDED)
+        self.assertEqual(second['dataset_id'], first['dataset_id'])
+        self.assertEqual(second['rows_processed'], 40)
+        self.assertEqual(Dataset.objects.count(), 1)
+
+    def test_changed_file_is_ingested(self):
+        first = self.upload(self.frame)
+        second = self.upload(self.frame.iloc[:-1])
+        self.assertFalse(second['deduplicated'])
+        self.assertNotEqual(second['dataset_id'], first['dataset_id'])
+
+    def test_other_validation_mode_is_not_a_duplicate(self):
+        frame = self.frame.astype({'Flowrate': object})
+        frame.loc[5, 'Flowrate'] = 'broken'
+        lenient = self.upload(frame, validation='lenient')
+        self.assertEqual(lenient['rows_processed'], 39)
+        strict = self.upload(frame, validation='strict')
+        self.assertFalse(strict['deduplicated'])
+        self.assertEqual(strict['state'], IngestJob.FAILED)
+        self.assertTrue(self.upload(frame, validation='lenient')['deduplicated'])
+
+    def test_other_users_datasets_are_not_reused(self):
+        self.upload(self.frame)
+        other = User.objects.create_user('other', password='secret')
+        self.client.force_authenticate(other)
+        self.assertFalse(self.upload(self.frame)['deduplicated'])
+
+
+@override_settings(INGEST_WORKERS=0)
+class ResumableUploadTests(TestCase):
+    """Byte ranges are assembled at the session offset and the file is queued once complete"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('resume', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.data = csv_bytes(sample_frame(60))
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post('/api/datasets/upload/sessions/',
+                                        {'filename': 'big.csv', 'size': len(self.data)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.url = f"/api/datasets/upload/sessions/{response.json()['id']}/"
+
+    def put_range(self, start, end):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            return self.client.put(self.url, self.data[start:end + 1], content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.data)}')
+
+    def complete(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            return self.client.post(f'{self.url}complete/')
+
+    def test_ranges_assemble_the_file(self):
+        middle = len(self.data) // 2
+        self.assertEqual(self.put_range(0, middle).json()['offset'], middle + 1)
+        # A retried chunk overlapping received bytes is accepted
+        self.assertEqual(self.put_range(middle - 10, len(self.data) - 1).json()['offset'], len(self.data))
+        response = self.complete()
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['state'], IngestJob.SUCCEEDED)
+        self.assertEqual(Dataset.objects.get(id=job['dataset_id']).total_count, 60)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_range_past_the_offset_conflicts(self):
+        self.put_range(0, 99)
+        response = self.put_range(200, 299)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 100)
+        self.assertEqual(self.client.get(self.url).json()['offset'], 100)
+
+    def test_incomplete_upload_cannot_complete(self):
+        self.put_range(0, 99)
+        response = self.complete()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 100)
+        self.assertFalse(IngestJob.objects.exists())
+
+    def test_missing_content_range_is_rejected(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.put(self.url, self.data, content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 400)
+
+
+def zip_bytes(members):
+    """A .zip archive of {name: bytes}"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tar_bytes(members):
+    """A .tar.gz archive of {name: bytes}"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+@override_settings(INGEST_WORKERS=0, BATCH_PARSE_WORKERS=2)
+class BatchUploadTests(TestCase):
+    """Batches of CSVs and archives run as jobs that report on every file"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('batch', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.unit_a = csv_bytes(sample_frame(30))
+        self.unit_b = csv_bytes(sample_frame(20))
+
+    def upload(self, *files, **data):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post('/api/datasets/upload/batch/', {
+                'files': [SimpleUploadedFile(name, content) for name, content in files], **data,
+            })
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def test_each_csv_becomes_a_dataset(self):
+        job = self.upload(('shift.zip', zip_bytes({'shift/a.csv': self.unit_a, 'shift/readme.txt': b'hi'})),
+                          ('b.tar.gz', tar_bytes({'b.csv': self.unit_b})))
+        self.assertEqual(job['kind'], IngestJob.BATCH)
+        self.assertEqual(job['state'], IngestJob.SUCCEEDED)
+        self.assertEqual(job['rows_processed'], 50)
+        self.assertEqual([(f['filename'], f['status'], f['rows']) for f in job['files']],
+                         [('shift/a.csv', 'created', 30), ('b.csv', 'created', 20)])
+        self.assertEqual(sorted(Dataset.objects.values_list('total_count', flat=True)), [20, 30])
+        # The stored uploads are removed once the job has run
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'ingest')), [])
+
+    def test_merge_loads_one_dataset(self):
+        job = self.upload(('a.csv', self.unit_a), ('b.csv', self.unit_b), merge='true')
+        self.assertEqual([f['status'] for f in job['files']], ['merged', 'merged'])
+        dataset = Dataset.objects.get()
+        self.assertEqual(job['dataset_id'], dataset.id)
+        self.assertEqual(dataset.total_count, 50)
+        self.assertTrue(dataset.ready)
+
+    def test_identical_files_are_skipped(self):
+        first = self.upload(('a.csv', self.unit_a))
+        job = self.upload(('again.zip', zip_bytes({'copy.csv': self.unit_a})))
+        self.assertEqual(job['files'], [{'filename': 'copy.csv', 'status': 'duplicate',
+                                         'dataset_id': first['files'][0]['dataset_id'], 'rows': 30}])
+        self.assertEqual(Dataset.objects.count(), 1)
+
+    @override_settings(RETENTION_ON_UPLOAD=True, RETENTION_MAX_DATASETS=5)
+    def test_batch_larger_than_retention(self):
+        members = {f'unit_{i}.csv': csv_bytes(sample_frame(10 + i)) for i in range(8)}
+        job = self.upload(('plant.zip', zip_bytes(members)))
+        self.assertEqual(job['state'], IngestJob.SUCCEEDED)
+        self.assertEqual([f['status'] for f in job['files']], ['pruned'] * 3 + ['created'] * 5)
+        kept = [f['dataset_id'] for f in job['files'] if f['status'] == 'created']
+        self.assertEqual(sorted(Dataset.objects.values_list('id', flat=True)), sorted(kept))
+        self.assertTrue(all('dataset_id' not in f for f in job['files'][:3]))
+
+    def test_invalid_rows_are_reported_per_file(self):
+        frame = sample_frame(10).astype({'Temperature': object})
+        frame.loc[2, 'Temperature'] = 'hot'
+        job = self.upload(('bad.csv', csv_bytes(frame)), ('good.csv', self.unit_b), validation='lenient')
+        bad, good = job['files']
+        self.assertEqual((bad['status'], bad['rows']), ('created', 9))
+        self.assertEqual(bad['validation']['errors'][0]['row'], 3)
+        self.assertEqual(good['rows'], 20)
+
+        job = self.upload(('bad.csv', csv_bytes(frame)), validation='strict')
+        self.assertEqual(job['state'], IngestJob.FAILED)
+        self.assertEqual(job['files'][0]['status'], 'error')
+
+    def test_archive_limits(self):
+        archive = ('big.zip', zip_bytes({'a.csv': self.unit_a, 'b.csv': self.unit_b}))
+        limits = [
+            ({'BATCH_UPLOAD_MAX_FILES': 1}, 'at most 1 CSV files'),
+            ({'BATCH_UPLOAD_MAX_ENTRIES': 1}, 'more than 1 entries'),
+            ({'BATCH_UPLOAD_MAX_FILE_BYTES': len(self.unit_a) - 1}, 'larger than'),
+            ({'BATCH_UPLOAD_MAX_TOTAL_BYTES': len(self.unit_a) + 10}, 'The batch is larger than'),
+        ]
+        for limit, error in limits:
+            with self.subTest(limit=limit), override_settings(**limit):
+                job = self.upload(archive)
+                self.assertEqual(job['state'], IngestJob.FAILED)
+                self.assertIn(error, job['error'])
+        self.assertFalse(Dataset.all_objects.exists())
+
+    def test_copy_stops_at_the_limit(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'member.csv')
+            self.assertIsNone(batch._copy_hashed(io.BytesIO(self.unit_a), path, len(self.unit_a) - 1))
+            self.assertLess(os.path.getsize(path), len(self.unit_a))
+            self.assertEqual(batch._copy_hashed(io.BytesIO(self.unit_a), path, len(self.unit_a))[1],
+                             len(self.unit_a))
+
+    def test_unsupported_file_is_rejected(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post('/api/datasets/upload/batch/',
+                                        {'files': [SimpleUploadedFile('notes.txt', b'hello')]})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IngestJob.objects.exists())
+
+    def test_broken_pool_is_replaced(self):
+        broken = batch._get_pool()
+        # A worker that dies breaks the whole executor
+        self.assertIsInstance(broken.submit(os._exit, 1).exception(), BrokenProcessPool)
+        self.assertEqual(list(batch._pool_results(abs, [(-3,), (4,)])), [(3, None), (4, None)])
+        self.assertIsNot(batch._get_pool(), broken)
+
+
+class ColumnarStoreTests(TestCase):
+    """Columnar part files hold the same records as database rows, ids being positions"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('columnar', password='secret')
+        # Three appends: three part files
+        self.frames = [sample_frame(25), sample_frame(10), sample_frame(40)]
+        self.datasets = {}
+        with override_settings(MEDIA_ROOT=self.media_root):
+            for storage in STORES:
+                dataset = Dataset.objects.create(user=self.user, filename=f'{storage}.csv', storage=storage)
+                for frame in self.frames:
+                    append_frames(dataset, validated_frames([frame]))
+                self.datasets[storage] = dataset
+        self.store = STORES['columnar']
+        self.columnar = self.datasets['columnar']
+
+    def test_parts_round_trip(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            self.assertEqual(len(self.store._parts(self.columnar)), 3)
+            frame = self.store.read_frame(self.columnar)
+        expected = to_record_frame(pd.concat(self.frames, ignore_index=True))
+        self.assertEqual(frame['id'].tolist(), list(range(1, 76)))
+        for field in RECORD_FIELDS:
+            self.assertEqual(frame[field].tolist(), expected[field].astype(object).tolist())
+
+    def test_page_spans_parts(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            page = self.store.read_page(self.columnar, after=20, limit=20, fields=['equipment_name'])
+        self.assertEqual(page['id'].tolist(), list(range(21, 41)))
+        # Record 25 ends the first part, 26 starts the second
+        self.assertEqual(page['equipment_name'].tolist()[4:6], ['P-24', 'P-0'])
+
+    def test_filtered_pages_match_database(self):
+        query = RecordQuery.from_params({'equipment_type': 'Valve,Reactor', 'flowrate__gte': '105',
+                                         'ordering': '-temperature'})
+        with override_settings(MEDIA_ROOT=self.media_root):
+            for fields in (None, ['equipment_name'], ['pressure', 'equipment_type']):
+                with self.subTest(fields=fields):
+                    pages = {storage: STORES[storage].read_rows(dataset, fields, limit=30, query=query)
+                             for storage, dataset in self.datasets.items()}
+                    columnar_ids = [row[0] for row in pages['columnar']]
+                    self.assertEqual(len(pages['columnar']), 30)
+                    # Database ids are row ids: compare the fields, and the ids as positions
+                    self.assertEqual([row[1:] for row in pages['columnar']],
+                                     [row[1:] for row in pages['database']])
+                    first_id = EquipmentRecord.objects.filter(dataset=self.datasets['database']).order_by('id')[0].id
+                    self.assertEqual(columnar_ids, [row[0] - first_id + 1 for row in pages['database']])
+            self.assertEqual(self.store.count(self.columnar, query),
+                             STORES['database'].count(self.datasets['database'], query))
+
+    def test_append_names_parts_from_the_dataset_row(self):
+        self.columnar.refresh_from_db()
+        self.assertEqual(self.columnar.part_count, 3)
+        with override_settings(MEDIA_ROOT=self.media_root):
+            # Several frames in one append: each continues the ids of the last
+            append_frames(self.columnar, validated_frames([sample_frame(5), sample_frame(6)]))
+            frame = self.store.read_frame(self.columnar, ['equipment_name'])
+        self.assertEqual(frame['id'].tolist(), list(range(1, 87)))
+        self.assertEqual(frame['equipment_name'].tolist()[75:81], ['P-0', 'V-1', 'R-2', 'P-3', 'V-4', 'P-0'])
+        self.assertEqual(SearchEntry.objects.filter(dataset=self.columnar).count(), 86)
+
+    def test_append_never_replaces_a_part(self):
+        # A writer that read the row before another append committed
+        stale = Dataset.objects.get(pk=self.columnar.pk)
+        stale.total_count, stale.part_count = 40, 2
+        with override_settings(MEDIA_ROOT=self.media_root):
+            with self.assertRaises(FileExistsError):
+                self.store.append(stale, to_record_frame(sample_frame(5)))
+            frame = self.store.read_frame(self.columnar, ['equipment_name'])
+            self.assertEqual(sorted(os.listdir(self.store.directory(self.columnar))),
+                             ['part-00000.npz', 'part-00001.npz', 'part-00002.npz'])
+        self.assertEqual(len(frame), 75)
+
+    def test_delete_removes_parts(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            directory = self.store.directory(self.columnar)
+            self.assertTrue(os.path.isdir(directory))
+            self.store.delete(self.columnar)
+            self.assertFalse(os.path.exists(directory))
+
+
+class StatisticsTests(TestCase):
+    """Chunked summaries merge to the figures of the whole data"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('stats', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        rng = np.random.default_rng(8)
+        self.frame = sample_frame(300)
+        self.frame['Flowrate'] = 1e6 + rng.normal(0, 1, 300)
+        self.frame['Pressure'] = rng.exponential(5, 300)
+
+    def assert_matches_pandas(self, statistics, frame):
+        records = to_record_frame(frame)
+        groups = [('overall', records, statistics['overall'])] + [
+            (eq_type, group, statistics['by_type'][eq_type])
+            for eq_type, group in records.groupby('equipment_type', observed=True)
+        ]
+        for name, values, summaries in groups:
+            for field in NUMERIC_FIELDS:
+                with self.subTest(group=name, field=field):
+                    summary = summaries[field]
+                    self.assertEqual(summary['count'], values[field].count())
+                    self.assertEqual(summary['min'], values[field].min())
+                    self.assertEqual(summary['max'], values[field].max())
+                    self.assertAlmostEqual(summary['mean'], values[field].mean(), places=6)
+                    self.assertAlmostEqual(summary['std'], values[field].std(), places=9)
+
+    def test_chunked_ingest_matches_pandas(self):
+        dataset = Dataset.objects.create(user=self.user, filename='stats.csv', storage='database')
+        ingest_csv(io.BytesIO(csv_bytes(self.frame)), dataset, chunksize=37)
+        dataset.refresh_from_db()
+        self.assert_matches_pandas(dataset.statistics, self.frame)
+
+    def test_append_extends_stored_statistics(self):
+        dataset = Dataset.objects.create(user=self.user, filename='stats.csv', storage='database')
+        append_frames(dataset, validated_frames([self.frame.iloc[:120]]))
+        append_frames(dataset, validated_frames([self.frame.iloc[120:]]))
+        dataset.refresh_from_db()
+        self.assert_matches_pandas(dataset.statistics, self.frame)
+
+    def test_merge_is_independent_of_the_split(self):
+        records = to_record_frame(self.frame)
+        whole, _ = summarize_frame(records)
+        first, _ = summarize_frame(records.iloc[:1])
+        rest, _ = summarize_frame(records.iloc[1:])
+        merged = {field: merge_summaries(first[field], rest[field]) for field in NUMERIC_FIELDS}
+        for field in NUMERIC_FIELDS:
+            self.assertAlmostEqual(merged[field]['m2'], whole[field]['m2'], delta=whole[field]['m2'] * 1e-12)
+            self.assertIsNone(first[field]['std'])
+
+    def test_m2_is_stored_but_not_served(self):
+        dataset = Dataset.objects.create(user=self.user, filename='stats.csv', storage='database')
+        append_frames(dataset, validated_frames([self.frame]))
+        dataset.refresh_from_db()
+        self.assertIn('m2', dataset.statistics['overall']['flowrate'])
+        for url in ('/api/datasets/', f'/api/datasets/{dataset.id}/'):
+            with self.subTest(url=url):
+                body = self.client.get(url).json()
+                statistics = (body[0] if isinstance(body, list) else body)['statistics']
+                self.assertEqual(set(statistics['overall']['flowrate']),
+                                 {'count', 'null_count', 'min', 'max', 'mean', 'std'})
+                self.assertNotIn('m2', statistics['by_type']['Pump']['pressure'])
+
+
+class AppendTests(TestCase):
+    """Appended rows extend the records and the stored aggregates, all or nothing"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('append', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.frame = sample_frame(90)
+
+    def make_dataset(self, storage):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            dataset = Dataset.objects.create(user=self.user, filename=f'{storage}.csv', storage=storage,
+                                             content_hash='0' * 64, validation_mode='strict')
+            append_frames(dataset, validated_frames([self.frame.iloc[:60]]))
+        dataset.refresh_from_db()
+        return dataset
+
+    def append(self, dataset, data, format=None):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            return self.client.post(f'/api/datasets/{dataset.id}/append/', data, format=format)
+
+    def test_rows_extend_records_and_aggregates(self):
+        rows = self.frame.iloc[60:].to_dict('records')
+        for storage in STORES:
+            with self.subTest(storage=storage):
+                dataset = self.make_dataset(storage)
+                response = self.append(dataset, {'rows': rows}, format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['rows_appended'], 30)
+                dataset.refresh_from_db()
+                self.assertEqual(dataset.total_count, 90)
+                self.assertEqual(dataset.avg_flowrate, round(self.frame['Flowrate'].mean(), 2))
+                self.assertEqual(dataset.equipment_types, self.frame['Type'].value_counts().to_dict())
+                self.assertEqual(dataset.content_hash, '')
+                with override_settings(MEDIA_ROOT=self.media_root):
+                    names = get_store(dataset).read_frame(dataset, ['equipment_name'])['equipment_name']
+                self.assertEqual(list(names), list(self.frame['Equipment Name']))
+
+    def test_csv_file_is_appended(self):
+        dataset = self.make_dataset('database')
+        upload = SimpleUploadedFile('more.csv', csv_bytes(self.frame.iloc[60:]), content_type='text/csv')
+        response = self.append(dataset, {'file': upload})
+        self.assertEqual(response.json()['dataset']['total_count'], 90)
+
+    def test_invalid_rows_append_nothing(self):
+        dataset = self.make_dataset('database')
+        rows = self.frame.iloc[60:].to_dict('records')
+        rows[5]['Pressure'] = 'high'
+        response = self.append(dataset, {'rows': rows}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['validation']['errors'][0]['row'], 6)
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.total_count, 60)
+        self.assertEqual(EquipmentRecord.objects.filter(dataset=dataset).count(), 60)
+
+        response = self.append(dataset, {'rows': rows, 'validation': 'lenient'}, format='json')
+        self.assertEqual(response.json()['rows_appended'], 29)
+
+    def test_other_users_dataset_is_not_found(self):
+        dataset = self.make_dataset('database')
+        self.client.force_authenticate(User.objects.create_user('intruder', password='secret'))
+        response = self.append(dataset, {'rows': self.frame.iloc[60:].to_dict('records')}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(RETENTION_MAX_DATASETS=0, RETENTION_MAX_AGE_DAYS=0, RETENTION_MAX_ROWS=0)
+class RetentionTests(TestCase):
+    """The oldest datasets beyond any limit of the policy are deleted with their rows"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('retention', password='secret')
+        now = timezone.now()
+        # Oldest first: 40, 30, 20 and 10 rows, uploaded 4, 3, 2 and 1 days ago
+        self.datasets = []
+        for age, rows in zip((4, 3, 2, 1), (40, 30, 20, 10)):
+            dataset = Dataset.objects.create(user=self.user, filename=f'{rows}.csv', storage='database',
+                                             uploaded_at=now - timedelta(days=age))
+            append_frames(dataset, validated_frames([sample_frame(rows)]))
+            self.datasets.append(dataset)
+
+    def kept(self):
+        return sorted(Dataset.objects.filter(user=self.user).values_list('total_count', flat=True))
+
+    def test_max_rows_deletes_the_oldest(self):
+        with override_settings(RETENTION_MAX_ROWS=45):
+            self.assertEqual(prune_datasets(self.user, batch_size=7), 2)
+        self.assertEqual(self.kept(), [10, 20])
+        removed = [dataset.id for dataset in self.datasets[:2]]
+        self.assertFalse(EquipmentRecord.objects.filter(dataset_id__in=removed).exists())
+        self.assertFalse(SearchEntry.objects.filter(dataset_id__in=removed).exists())
+
+    def test_newest_dataset_is_kept_over_max_rows(self):
+        with override_settings(RETENTION_MAX_ROWS=5):
+            prune_datasets(self.user)
+        self.assertEqual(self.kept(), [10])
+
+    def test_max_datasets_and_age(self):
+        with override_settings(RETENTION_MAX_DATASETS=3):
+            self.assertEqual(list(expired_datasets(self.user)), [self.datasets[0]])
+        with override_settings(RETENTION_MAX_AGE_DAYS=2):
+            self.assertEqual(sorted(d.id for d in expired_datasets(self.user)),
+                             [self.datasets[0].id, self.datasets[1].id, self.datasets[2].id])
+
+    def test_user_policy_overrides_settings(self):
+        RetentionPolicy.objects.create(user=self.user, max_datasets=1)
+        with override_settings(RETENTION_MAX_DATASETS=3, RETENTION_MAX_ROWS=1000):
+            self.assertEqual(get_policy(self.user), {'max_datasets': 1, 'max_age_days': 0, 'max_rows': 1000})
+            prune_datasets(self.user)
+        self.assertEqual(self.kept(), [10])
+
+    def test_unfinished_datasets_are_neither_counted_nor_pruned(self):
+        hidden = Dataset.objects.create(user=self.user, filename='partial.csv', ready=False,
+                                        uploaded_at=timezone.now() - timedelta(days=30), total_count=500)
+        with override_settings(RETENTION_MAX_DATASETS=4, RETENTION_MAX_ROWS=100):
+            self.assertEqual(prune_datasets(self.user), 0)
+        self.assertTrue(Dataset.all_objects.filter(id=hidden.id).exists())
+
+
+class ParsingTests(TestCase):
+    """Both parser engines read only the required columns into the same frames"""
+
+    def setUp(self):
+        frame = sample_frame(120)
+        frame.insert(2, 'Notes', ['spare'] * 120)
+        frame['Pressure'] = frame['Pressure'].astype(object)
+        frame.loc[7, 'Pressure'] = 'high'
+        self.data = csv_bytes(frame)
+
+    def engines(self):
+        return ['c', 'pyarrow'] if pa_csv is not None else ['c']
+
+    def test_engines_agree(self):
+        frames = {}
+        for engine in self.engines():
+            frame = read_csv(io.BytesIO(self.data), engine)
+            self.assertEqual(list(frame.columns), ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature'])
+            self.assertIsInstance(frame['Type'].dtype, pd.CategoricalDtype)
+            # A bad value leaves its column as text for validation to report
+            self.assertEqual(frame.loc[7, 'Pressure'], 'high')
+            frames[engine] = frame.astype({'Type': str, 'Pressure': str})
+        for engine, frame in frames.items():
+            pd.testing.assert_frame_equal(frame, frames['c'])
+
+    def test_chunks_cover_the_file(self):
+        for engine in self.engines():
+            with self.subTest(engine=engine):
+                chunks = list(read_csv_chunks(io.BytesIO(self.data), chunksize=50, engine=engine))
+                self.assertEqual(sum(len(chunk) for chunk in chunks), 120)
+                if engine == 'c':
+                    self.assertEqual([len(chunk) for chunk in chunks], [50, 50, 20])
+
+    def test_bad_value_after_the_first_block(self):
+        frame = sample_frame(2000).astype({'Flowrate': object})
+        frame.loc[1500, 'Flowrate'] = 'high'
+        data = csv_bytes(frame)
+        # Well past the first pyarrow block of 50 rows' worth of bytes
+        self.assertGreater(data.index(b'high'), 50 * ARROW_BYTES_PER_ROW)
+        for engine in self.engines():
+            with self.subTest(engine=engine):
+                chunks = list(read_csv_chunks(io.BytesIO(data), chunksize=50, engine=engine))
+                self.assertEqual(sum(len(chunk) for chunk in chunks), 2000)
+                bad = [chunk for chunk in chunks if 'high' in chunk['Flowrate'].tolist()]
+                self.assertEqual(len(bad), 1)
+                # Only the block holding the value falls back to text
+                self.assertEqual(chunks[0]['Flowrate'].dtype, np.float64)
+
+    def test_engine_setting(self):
+        self.assertEqual(parse_engine('auto'), 'pyarrow' if pa_csv is not None else 'c')
+        self.assertEqual(parse_engine('c'), 'c')
+        with override_settings(CSV_PARSE_ENGINE='c'):
+            self.assertEqual(parse_engine(), 'c')
+        with self.assertRaises(ImproperlyConfigured):
+            parse_engine('python')
+
+    def test_missing_column_is_reported(self):
+        data = sample_frame(3).drop(columns=['Temperature']).to_csv(index=False).encode()
+        with tempfile.NamedTemporaryFile(suffix='.csv') as csv_file:
+            csv_file.write(data)
+            csv_file.flush()
+            for engine in self.engines():
+                with self.subTest(engine=engine), self.assertRaisesMessage(IngestError, 'CSV must contain columns'):
+                    parse_file(csv_file.name, engine)
+        with self.assertRaises(IngestError):
+            check_header(io.BytesIO(data))
+
+    def test_json_rows_take_either_key_style(self):
+        rows = [{'Equipment Name': 'P-1', 'Type': 'Pump', 'Flowrate': 1, 'Pressure': 2, 'Temperature': 3},
+                {'equipment_name': 'V-1', 'equipment_type': 'Valve', 'flowrate': 4.5, 'pressure': 5,
+                 'temperature': 6}]
+        frame = to_record_frame(frame_from_rows(rows))
+        self.assertEqual(frame['equipment_name'].tolist(), ['P-1', 'V-1'])
+        self.assertEqual(frame['flowrate'].tolist(), [1.0, 4.5])
+        with self.assertRaises(IngestError):
+            frame_from_rows({'rows': rows})
+
+    def test_fingerprint_rewinds(self):
+        upload = io.BytesIO(self.data)
+        self.assertEqual(fingerprint(upload), fingerprint(io.BytesIO(self.data)))
+        self.assertEqual(upload.tell(), 0)
+        self.assertNotEqual(fingerprint(io.BytesIO(self.data + b'\n')), fingerprint(upload))
+
+
+@override_settings(INGEST_VALUE_BOUNDS={}, INGEST_MAX_REPORTED_ERRORS=100)
+class ValidationTests(TestCase):
+    """Invalid rows are found column by column and reported by data row number, whichever parser reads them"""
+
+    def setUp(self):
+        frame = sample_frame(2000).astype({'Pressure': object, 'Flowrate': object})
+        frame.loc[3, 'Pressure'] = 'broken'
+        # Far enough in to be past the first block of either parser
+        frame.loc[1500, 'Flowrate'] = 'high'
+        frame.loc[1700, 'Equipment Name'] = None
+        self.data = csv_bytes(frame)
+
+    def engines(self):
+        return ['c', 'pyarrow'] if pa_csv is not None else ['c']
+
+    def chunks(self, data, engine):
+        return read_csv_chunks(io.BytesIO(data), chunksize=50, engine=engine)
+
+    def test_strict_mode_reports_every_chunk(self):
+        for engine in self.engines():
+            with self.subTest(engine=engine):
+                report = ValidationReport()
+                yielded = []
+                with self.assertRaises(ValidationFailed) as failure:
+                    for frame in validated_frames(self.chunks(self.data, engine), 'strict', report):
+                        yielded.append(frame)
+                self.assertEqual(yielded, [])
+                self.assertIs(failure.exception.report, report)
+                self.assertEqual(report.rows_rejected, 3)
+                self.assertEqual([(e['row'], e['column'], e['error']) for e in report.to_json()['errors']], [
+                    (4, 'Pressure', 'not a number'), (1501, 'Flowrate', 'not a number'),
+                    (1701, 'Equipment Name', 'missing value'),
+                ])
+                self.assertIn('first at row 4, Pressure: not a number', str(failure.exception))
+
+    def test_lenient_mode_drops_invalid_rows(self):
+        for engine in self.engines():
+            with self.subTest(engine=engine):
+                report = ValidationReport()
+                frame = pd.concat(validated_frames(self.chunks(self.data, engine), 'lenient', report))
+                self.assertEqual(len(frame), 1997)
+                self.assertNotIn('P-1500', frame['equipment_name'].tolist())
+                self.assertEqual(frame['flowrate'].dtype, np.float64)
+                self.assertEqual(report.counts, {'Pressure: not a number': 1, 'Flowrate: not a number': 1,
+                                                 'Equipment Name: missing value': 1})
+
+    def test_bounds_by_equipment_type(self):
+        bounds = {'*': {'Pressure': [None, 8]}, 'Pump': {'Flowrate': [0, 150]}}
+        # Pumps are every third row from 0, with flowrate 100 + i; pressure is i % 10
+        above_flow = [i + 1 for i in range(51, 60, 3)]
+        above_pressure = [i + 1 for i in range(60) if i % 10 == 9]
+        for engine in self.engines():
+            with self.subTest(engine=engine):
+                report = ValidationReport()
+                with override_settings(INGEST_VALUE_BOUNDS=bounds):
+                    frames = list(validated_frames(self.chunks(csv_bytes(sample_frame(60)), engine), 'lenient',
+                                                   report))
+                self.assertEqual(report.counts, {'Flowrate: above maximum 150': 3, 'Pressure: above maximum 8': 6})
+                self.assertEqual(sorted(e['row'] for e in report.errors), sorted(above_flow + above_pressure))
+                self.assertEqual(sum(len(frame) for frame in frames),
+                                 60 - len(set(above_flow) | set(above_pressure)))
+
+    def test_reported_errors_are_capped(self):
+        frame = sample_frame(30).astype({'Temperature': object})
+        frame['Temperature'] = 'hot'
+        for engine in self.engines():
+            with self.subTest(engine=engine):
+                report = ValidationReport(max_errors=5)
+                list(validated_frames(self.chunks(csv_bytes(frame), engine), 'lenient', report))
+                self.assertEqual(report.error_count, 30)
+                self.assertEqual(len(report.to_json()['errors']), 5)
+                self.assertEqual(report.errors[0]['value'], 'hot')
+
+    def test_unknown_mode(self):
+        with self.assertRaises(IngestError):
+            list(validated_frames(self.chunks(self.data, 'c'), 'loose'))
+
+    def test_parse_and_validate_takes_settings_as_arguments(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as csv_file:
+            csv_file.write(self.data)
+            csv_file.flush()
+            for engine in self.engines():
+                with self.subTest(engine=engine):
+                    frame, report = parse_and_validate(csv_file.name, engine, 'strict', {}, 1)
+                    self.assertIsNone(frame)
+                    self.assertEqual((report.error_count, len(report.errors)), (3, 1))
+                    bounds = {'*': {'Flowrate': [0, 2089]}}
+                    frame, report = parse_and_validate(csv_file.name, engine, 'lenient', bounds, 10)
+                    self.assertEqual(len(frame), 2000 - 3 - 10)
+
+
+class RecordPagingTests(TestCase):
+    """Record pages follow the record ids, so every record comes once whichever page is read"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('paging', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_dataset(self, storage, n=50):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            dataset = Dataset.objects.create(user=self.user, filename=f'{storage}.csv', storage=storage)
+            append_frames(dataset, validated_frames([sample_frame(n)]))
+        return dataset
+
+    def get(self, url, params=None):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_pages_cover_the_records_once(self):
+        for storage in STORES:
+            with self.subTest(storage=storage):
+                dataset = self.make_dataset(storage)
+                body = self.get(f'/api/datasets/{dataset.id}/records/', {'page_size': 20})
+                names = []
+                pages = 0
+                while True:
+                    pages += 1
+                    self.assertEqual(body['count'], 50)
+                    names += [record['equipment_name'] for record in body['results']]
+                    if body['next'] is None:
+                        break
+                    self.assertIn('page_size=20', body['next'])
+                    body = self.get(body['next'])
+                self.assertEqual(pages, 3)
+                self.assertEqual(names, sample_frame(50)['Equipment Name'].tolist())
+
+    def test_appended_records_do_not_shift_later_pages(self):
+        dataset = self.make_dataset('database', 30)
+        first = self.get(f'/api/datasets/{dataset.id}/records/', {'page_size': 20})
+        with override_settings(MEDIA_ROOT=self.media_root):
+            append_frames(dataset, validated_frames([sample_frame(5)]))
+        second = self.get(first['next'])
+        ids = [record['id'] for record in first['results'] + second['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(len(second['results']), 15)
+        self.assertEqual(ids, sorted(ids))
+
+    def test_deep_pages_cost_the_same_queries(self):
+        dataset = self.make_dataset('database', 200)
+        last_id = EquipmentRecord.objects.filter(dataset=dataset).order_by('-id').values_list('id', flat=True)[10]
+        url = f'/api/datasets/{dataset.id}/records/'
+        with CaptureQueriesContext(connection) as first:
+            self.get(url, {'page_size': 10})
+        with CaptureQueriesContext(connection) as deep:
+            body = self.get(url, {'page_size': 10, 'after': last_id})
+        self.assertEqual(len(first), len(deep))
+        self.assertEqual(len(body['results']), 10)
+        self.assertIsNone(body['next'])
+
+    def test_rejects_bad_paging_parameters(self):
+        dataset = self.make_dataset('database', 5)
+        for params in ({'after': '-1'}, {'after': 'x'}, {'page_size': '0'}, {'page_size': 10 ** 6}):
+            with self.subTest(params=params):
+                with override_settings(RECORDS_MAX_PAGE_SIZE=1000):
+                    response = self.client.get(f'/api/datasets/{dataset.id}/records/', params)
+                self.assertEqual(response.status_code, 400)
+        other = User.objects.create_user('other', password='secret')
+        foreign = Dataset.objects.create(user=other, filename='theirs.csv')
+        self.assertEqual(self.client.get(f'/api/datasets/{foreign.id}/records/').status_code, 404)
+
+    def test_detail_can_leave_records_out(self):
+        dataset = self.make_dataset('database', 5)
+        self.assertEqual(len(self.get(f'/api/datasets/{dataset.id}/')['records']), 5)
+        body = self.get(f'/api/datasets/{dataset.id}/', {'records': 'false'})
+        self.assertNotIn('records', body)
+        self.assertEqual(body['total_count'], 5)
+
+
+class ProjectionTests(TestCase):
+    """?fields= and ?exclude= narrow both the response and the columns read"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('projection', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with override_settings(MEDIA_ROOT=self.media_root):
+            self.dataset = Dataset.objects.create(user=self.user, filename='plant.csv')
+            append_frames(self.dataset, validated_frames([sample_frame(10)]))
+
+    def get(self, url, params):
+        with override_settings(MEDIA_ROOT=self.media_root), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), ' '.join(query['sql'] for query in queries)
+
+    def test_dataset_list(self):
+        body, sql = self.get('/api/datasets/', {'fields': 'id,filename'})
+        self.assertEqual(body, [{'id': self.dataset.id, 'filename': 'plant.csv'}])
+        self.assertNotIn('"avg_flowrate"', sql)
+        self.assertNotIn('"equipment_types"', sql)
+        body, _ = self.get('/api/datasets/', {'exclude': 'statistics,equipment_types'})
+        self.assertEqual(list(body[0]), ['id', 'filename', 'uploaded_at', 'username', 'total_count',
+                                         'avg_flowrate', 'avg_pressure', 'avg_temperature'])
+
+    def test_detail_projects_dataset_and_record_fields(self):
+        body, sql = self.get(f'/api/datasets/{self.dataset.id}/', {'fields': 'filename,records.flowrate'})
+        self.assertEqual(list(body), ['filename', 'records'])
+        self.assertEqual(body['records'][:2], [{'flowrate': 100.0}, {'flowrate': 101.0}])
+        self.assertNotIn('"equipment_name"', sql)
+        body, _ = self.get(f'/api/datasets/{self.dataset.id}/', {'exclude': 'statistics,records.id'})
+        self.assertNotIn('statistics', body)
+        self.assertEqual(list(body['records'][0]), ['equipment_name', 'equipment_type', 'flowrate', 'pressure',
+                                                    'temperature'])
+
+    def test_records(self):
+        body, sql = self.get(f'/api/datasets/{self.dataset.id}/records/', {'fields': 'id,pressure'})
+        self.assertEqual([list(record) for record in body['results']], [['id', 'pressure']] * 10)
+        self.assertNotIn('"temperature"', sql)
+        body, _ = self.get(f'/api/datasets/{self.dataset.id}/records/', {'exclude': 'id,equipment_type'})
+        self.assertEqual(body['results'][0], {'equipment_name': 'P-0', 'flowrate': 100.0, 'pressure': 0.0,
+                                              'temperature': 0.0})
+
+    def test_unknown_field(self):
+        for url in ('/api/datasets/', f'/api/datasets/{self.dataset.id}/',
+                    f'/api/datasets/{self.dataset.id}/records/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'fields': 'id,colour'})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('colour', response.json()['error'])
+
+
+class FastSerializationTests(TestCase):
+    """The fast read path gives the same records and JSON as the DRF serializers"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('fast', password='secret')
+        self.dataset = Dataset.objects.create(user=self.user, filename='plant.csv')
+        append_frames(self.dataset, validated_frames([sample_frame(12)]))
+
+    def test_records_match_the_model_serializer(self):
+        records = EquipmentRecord.objects.filter(dataset=self.dataset).order_by('id')
+        expected = EquipmentRecordSerializer(records, many=True).data
+        rows = get_store(self.dataset).read_rows(self.dataset)
+        self.assertEqual(records_from_rows(rows), [dict(record) for record in expected])
+        fields = ['pressure', 'equipment_name']
+        rows = get_store(self.dataset).read_rows(self.dataset, fields)
+        self.assertEqual(records_from_rows(rows, fields, include_id=False)[0],
+                         {'pressure': 0.0, 'equipment_name': 'P-0'})
+
+    def test_detail_records_keep_serializer_field_names(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        body = client.get(f'/api/datasets/{self.dataset.id}/').json()
+        self.assertEqual(list(body), DatasetSerializer.Meta.fields)
+        self.assertEqual(list(body['records'][0]), EquipmentRecordSerializer.Meta.fields)
+
+    def test_json_is_byte_identical(self):
+        data = {
+            'filename': 'café .csv',
+            'uploaded_at': timezone.now(),
+            'values': [1.5, 100.0, -0.25, None, True, np.float64(2.5), 7],
+            'nested': {'records': records_from_rows(get_store(self.dataset).read_rows(self.dataset))},
+        }
+        expected = JSONRenderer().render(data)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        with mock.patch('api.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+
+
+class ResponseFormatTests(TestCase):
+    """Columnar formats carry the same records as the JSON list of objects"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('formats', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_dataset(self, storage):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            dataset = Dataset.objects.create(user=self.user, filename=f'{storage}.csv', storage=storage)
+            append_frames(dataset, validated_frames([sample_frame(25)]))
+        return dataset
+
+    def get(self, url, params=None, **headers):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            return self.client.get(url, params, **headers)
+
+    def as_columns(self, records):
+        return {name: [record[name] for record in records] for name in records[0]}
+
+    def test_columnar_json_by_accept_header(self):
+        for storage in STORES:
+            with self.subTest(storage=storage):
+                url = f'/api/datasets/{self.make_dataset(storage).id}/records/'
+                expected = self.get(url, {'page_size': 10}).json()
+                response = self.get(url, {'page_size': 10}, HTTP_ACCEPT='application/vnd.equipment.columnar+json')
+                self.assertEqual(response['Content-Type'], 'application/vnd.equipment.columnar+json')
+                body = response.json()
+                self.assertEqual(body['results'], self.as_columns(expected['results']))
+                self.assertEqual((body['count'], body['next']), (expected['count'], expected['next']))
+
+    @skipUnless(msgpack is not None, 'msgpack is not installed')
+    def test_msgpack(self):
+        dataset = self.make_dataset('database')
+        expected = self.get(f'/api/datasets/{dataset.id}/', {'fields': 'filename,records'}).json()
+        response = self.get(f'/api/datasets/{dataset.id}/', {'fields': 'filename,records', 'format': 'msgpack'})
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        body = msgpack.unpackb(response.content)
+        self.assertEqual(body, {'filename': 'database.csv', 'records': self.as_columns(expected['records'])})
+
+    @skipUnless(pa is not None, 'pyarrow is not installed')
+    def test_arrow_stream(self):
+        for storage in STORES:
+            with self.subTest(storage=storage):
+                url = f'/api/datasets/{self.make_dataset(storage).id}/records/'
+                expected = self.get(url, {'page_size': 10}).json()
+                response = self.get(url, {'page_size': 10}, HTTP_ACCEPT='application/vnd.apache.arrow.stream')
+                self.assertEqual(response.status_code, 200)
+                table = pa.ipc.open_stream(response.content).read_all()
+                self.assertEqual(table.to_pydict(), self.as_columns(expected['results']))
+                self.assertTrue(pa.types.is_dictionary(table.schema.field('equipment_type').type))
+                rest = json.loads(table.schema.metadata[b'json'])
+                self.assertEqual(rest, {'count': 25, 'next': expected['next']})
+
+    @skipUnless(pa is not None, 'pyarrow is not installed')
+    def test_arrow_error_body(self):
+        dataset = self.make_dataset('database')
+        response = self.get(f'/api/datasets/{dataset.id}/records/', {'page_size': 0, 'format': 'arrow'})
+        self.assertEqual(response.status_code, 400)
+        table = pa.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.num_columns, 0)
+        self.assertIn('page_size', json.loads(table.schema.metadata[b'json'])['error'])
+
+    def test_unknown_format(self):
+        dataset = self.make_dataset('database')
+        response = self.get(f'/api/datasets/{dataset.id}/records/', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 406)
+
+
+class ConditionalGetTests(TestCase):
+    """Unchanged datasets are revalidated with a 304 from their content version"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('etags', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.dataset = Dataset.objects.create(user=self.user, filename='plant.csv')
+        append_frames(self.dataset, validated_frames([sample_frame(20)]))
+        self.url = f'/api/datasets/{self.dataset.id}/'
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        # One query on the dataset table, none on the records
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_records_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        append_frames(self.dataset, validated_frames([sample_frame(5)]))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['total_count'], 25)
+
+    def test_each_representation_has_its_own_etag(self):
+        etags = {
+            self.client.get(self.url)['ETag'],
+            self.client.get(self.url, {'records': 'false'})['ETag'],
+            self.client.get(self.url, HTTP_ACCEPT='application/vnd.equipment.columnar+json')['ETag'],
+        }
+        self.assertEqual(len(etags), 3)
+
+    def test_list_etag_follows_added_and_removed_datasets(self):
+        etag = self.client.get('/api/datasets/')['ETag']
+        self.assertEqual(self.client.get('/api/datasets/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        other = Dataset.objects.create(user=self.user, filename='second.csv')
+        added = self.client.get('/api/datasets/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(added.status_code, 200)
+        self.client.delete(f'/api/datasets/{other.id}/delete/')
+        self.assertEqual(self.client.get('/api/datasets/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/datasets/', HTTP_IF_NONE_MATCH=added['ETag']).status_code, 200)
+
+
+class AggregationTests(TestCase):
+    """Grouped aggregates match pandas over the same records, whichever store holds them"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('aggregates', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_dataset(self, storage, frame):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            dataset = Dataset.objects.create(user=self.user, filename=f'{storage}.csv', storage=storage)
+            append_frames(dataset, validated_frames([frame]))
+        return dataset
+
+    def get(self, url, params):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def assert_matches(self, results, frame):
+        for eq_type, group in frame.groupby('Type'):
+            result = results[eq_type]
+            self.assertEqual(result['count'], len(group))
+            for column in ('Flowrate', 'Pressure', 'Temperature'):
+                values = result[column.lower()]
+                self.assertAlmostEqual(values['avg'], group[column].mean())
+                self.assertAlmostEqual(values['stddev'], group[column].std())
+                self.assertAlmostEqual(values['sum'], group[column].sum())
+                self.assertEqual((values['min'], values['max']), (group[column].min(), group[column].max()))
+
+    def test_group_by_type(self):
+        frame = sample_frame(90)
+        for storage in STORES:
+            with self.subTest(storage=storage):
+                dataset = self.make_dataset(storage, frame)
+                body = self.get(f'/api/datasets/{dataset.id}/aggregate/', {'group_by': 'equipment_type'})
+                self.assertEqual(body['metrics'], METRICS)
+                self.assertEqual(list(body['results']), ['Pump', 'Reactor', 'Valve'])
+                self.assert_matches(body['results'], frame)
+
+    def test_groups_merge_across_stores(self):
+        first, second = sample_frame(40), sample_frame(70).iloc[40:]
+        ids = [self.make_dataset('database', first).id, self.make_dataset('columnar', second).id]
+        body = self.get('/api/datasets/aggregate/', {'ids': ','.join(map(str, ids)), 'group_by': 'equipment_type'})
+        self.assert_matches(body['results'], pd.concat([first, second]))
+        body = self.get('/api/datasets/aggregate/', {'ids': ','.join(map(str, ids)),
+                                                    'group_by': 'dataset,equipment_type', 'metrics': 'count'})
+        self.assertEqual(body['results'][str(ids[1])]['Pump'], {'count': 10})
+
+    def test_stddev_is_stable_for_large_values(self):
+        frame = sample_frame(60)
+        frame['Flowrate'] = 1e9 + np.arange(60) * 0.001
+        for storage in STORES:
+            with self.subTest(storage=storage):
+                dataset = self.make_dataset(storage, frame)
+                with override_settings(MEDIA_ROOT=self.media_root):
+                    result = aggregate_datasets([dataset], metrics=['stddev'], fields=['flowrate'])
+                self.assertAlmostEqual(result['flowrate']['stddev'], frame['Flowrate'].std(), places=9)
+
+    def test_subset_and_small_groups(self):
+        dataset = self.make_dataset('database', sample_frame(4))
+        body = self.get(f'/api/datasets/{dataset.id}/aggregate/',
+                        {'group_by': 'equipment_type', 'metrics': 'count,stddev', 'fields': 'pressure'})
+        self.assertEqual(body['results']['Pump'], {'count': 2, 'pressure': {'stddev': 2.1213203435596424}})
+        self.assertEqual(body['results']['Valve'], {'count': 1, 'pressure': {'stddev': None}})
+        self.assertEqual(self.get(f'/api/datasets/{dataset.id}/aggregate/', {'metrics': 'count'})['results'],
+                         {'count': 4})
+
+    def test_rejects_bad_parameters(self):
+        dataset = self.make_dataset('database', sample_frame(4))
+        foreign = Dataset.objects.create(user=User.objects.create_user('other', password='secret'),
+                                         filename='theirs.csv')
+        for url, params, code in ((f'/api/datasets/{dataset.id}/aggregate/', {'group_by': 'colour'}, 400),
+                                  (f'/api/datasets/{dataset.id}/aggregate/', {'metrics': 'median'}, 400),
+                                  ('/api/datasets/aggregate/', {}, 400),
+                                  ('/api/datasets/aggregate/', {'ids': 'a'}, 400),
+                                  ('/api/datasets/aggregate/', {'ids': f'{dataset.id},{foreign.id}'}, 404)):
+            with self.subTest(url=url, params=params):
+                self.assertEqual(self.client.get(url, params).status_code, code)
+
+
+class RecordQueryPlanTests(TestCase):
+    """Record filters, orderings and name joins are served by the composite indexes on SQLite and PostgreSQL"""
+
+    def setUp(self):
+        user = User.objects.create_user('plans', password='secret')
+        self.dataset = Dataset.objects.create(user=user, filename='plans.csv', storage='database')
+        append_frames(self.dataset, validated_frames([sample_frame()]))
+
+    def plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # A small test table is cheaper to scan; this asks whether the index can serve the query
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def page_plan(self, params, after=0):
+        query = RecordQuery.from_params(params)
+        records = STORES['database'].queryset(self.dataset, after, query)
+        return self.plan(records.values_list('id', 'flowrate')[:101])
+
+    def count_plan(self, params):
+        query = RecordQuery.from_params(params)
+        return self.plan(EquipmentRecord.objects.filter(dataset_id=self.dataset.id).filter(query.filter_q()))
+
+    def test_type_filter_uses_type_index(self):
+        self.assertIn(record_index('dataset', 'equipment_type'), self.page_plan({'equipment_type': 'Pump'}))
+        self.assertIn(record_index('dataset', 'equipment_type'), self.count_plan({'equipment_type': 'Pump'}))
+
+    def test_range_filter_uses_field_index(self):
+        self.assertIn(record_index('dataset', 'pressure'), self.count_plan({'pressure__gt': '7'}))
+        self.assertIn(record_index('dataset', 'pressure'),
+                      self.page_plan({'pressure__gt': '7', 'ordering': 'pressure'}))
+
+    def test_ordering_uses_field_index_without_sorting(self):
+        for ordering in ('temperature', '-temperature'):
+            plan = self.page_plan({'ordering': ordering})
+            self.assertIn(record_index('dataset', 'temperature'), plan)
+            if connection.vendor == 'sqlite':
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_comparison_uses_name_index(self):
+        other = Dataset.objects.create(user=self.dataset.user, filename='other.csv', storage='database')
+        append_frames(other, validated_frames([sample_frame()]))
+        partners = EquipmentRecord.objects.filter(dataset_id=other.id, equipment_name=OuterRef('equipment_name'))
+        plan = self.plan(EquipmentRecord.objects.filter(dataset_id=self.dataset.id).filter(Exists(partners)))
+        self.assertIn(record_index('dataset', 'equipment_name'), plan)
+
+    def test_cursor_seeks_in_field_index(self):
+        plan = self.page_plan({'ordering': 'temperature', 'after': '5', 'after_value': '6.0'}, after=5)
+        self.assertIn(record_index('dataset', 'temperature'), plan)
+        if connection.vendor == 'sqlite':
+            self.assertIn('temperature>', plan)
+
+
+class RecordFilterTests(TestCase):
+    """Filtered, ordered pages are the same for both storage backends"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('filters', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_dataset(self, storage, frame=None):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            dataset = Dataset.objects.create(user=self.user, filename=f'{storage}.csv', storage=storage)
+            append_frames(dataset, validated_frames([sample_frame() if frame is None else frame]))
+        return dataset
+
+    def fetch_all(self, dataset, params):
+        records = []
+        url = f'/api/datasets/{dataset.id}/records/'
+        with override_settings(MEDIA_ROOT=self.media_root):
+            while url:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200, response.content)
+                body = response.json()
+                records.extend(body['results'])
+                url, params = body['next'], None
+        return body['count'], records
+
+    def test_filter_and_order_across_pages(self):
+        params = {'equipment_type': 'Pump', 'pressure__gt': '2', 'ordering': '-temperature', 'page_size': 4}
+        frame = sample_frame()
+        frame['id'] = range(1, len(frame) + 1)
+        expected = frame[(frame['Type'] == 'Pump') & (frame['Pressure'] > 2)]
+        expected = expected.sort_values(['Temperature', 'id'], ascending=False)
+
+        for storage in ('database', 'columnar'):
+            with self.subTest(storage=storage):
+                dataset = self.make_dataset(storage)
+                count, records = self.fetch_all(dataset, params)
+                self.assertEqual(count, len(expected))
+                self.assertEqual([record['equipment_name'] for record in records],
+                                 expected['Equipment Name'].tolist())
+
+    def test_name_prefix(self):
+        dataset = self.make_dataset('database')
+        count, records = self.fetch_all(dataset, {'equipment_name__startswith': 'V-1', 'fields': 'equipment_name'})
+        self.assertEqual([record['equipment_name'] for record in records], ['V-1', 'V-10', 'V-13', 'V-16', 'V-19'])
+        self.assertEqual(count, 5)
+
+    def test_name_prefix_is_case_sensitive_in_both_stores(self):
+        frame = sample_frame(6)
+        frame['Equipment Name'] = ['Pump-A', 'pump-b', 'PUMP-C', 'Pump-D', 'pumpkin', 'Pum']
+        for storage in ('database', 'columnar'):
+            with self.subTest(storage=storage):
+                dataset = self.make_dataset(storage, frame)
+                count, records = self.fetch_all(dataset, {'equipment_name__startswith': 'Pump',
+                                                          'fields': 'equipment_name'})
+                self.assertEqual([record['equipment_name'] for record in records], ['Pump-A', 'Pump-D'])
+                self.assertEqual(count, 2)
+
+    def test_rejects_unknown_ordering_and_bad_numbers(self):
+        dataset = self.make_dataset('database')
+        for params in ({'ordering': 'equipment_name'}, {'pressure__gt': 'high'},
+                       {'ordering': 'pressure', 'after': '3'}):
+            with self.subTest(params=params):
+                response = self.client.get(f'/api/datasets/{dataset.id}/records/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class HistogramTests(TestCase):
+    """Binned counts match NumPy and are the same for both storage backends"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('histograms', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.frame = sample_frame(600)
+
+    def histogram(self, storage, params):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            dataset = Dataset.objects.create(user=self.user, filename=f'{storage}.csv', storage=storage)
+            append_frames(dataset, validated_frames([self.frame]))
+            response = self.client.get(f'/api/datasets/{dataset.id}/histogram/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_bin_count_matches_numpy(self):
+        expected, edges = np.histogram(self.frame['Flowrate'], bins=50)
+        for storage in ('database', 'columnar'):
+            with self.subTest(storage=storage):
+                body = self.histogram(storage, {'x': 'flowrate', 'bins': '50'})
+                np.testing.assert_allclose(body['x']['edges'], edges)
+                self.assertEqual(body['counts'], expected.tolist())
+
+    def test_by_type_and_2d(self):
+        params = {'x': 'flowrate', 'bin_width': '5', 'group_by': 'equipment_type'}
+        by_type = {storage: self.histogram(storage, params) for storage in ('database', 'columnar')}
+        self.assertEqual(by_type['database'], by_type['columnar'])
+        counts = by_type['database']['counts']
+        self.assertEqual(sorted(counts), ['Pump', 'Reactor', 'Valve'])
+        for eq_type, type_counts in counts.items():
+            self.assertEqual(sum(type_counts), int((self.frame['Type'] == eq_type).sum()))
+
+        params = {'x': 'pressure', 'y': 'temperature', 'bins': '10,13'}
+        grids = {storage: self.histogram(storage, params) for storage in ('database', 'columnar')}
+        self.assertEqual(grids['database'], grids['columnar'])
+        expected, _, _ = np.histogram2d(self.frame['Pressure'], self.frame['Temperature'], bins=[10, 13])
+        self.assertEqual(grids['database']['counts'], expected.astype(int).tolist())
+
+
+class DownsampleTests(TestCase):
+    """LTTB keeps the reference algorithm's points; both storage backends give the same series"""
+
+    def reference_lttb(self, data, threshold):
+        n = len(data)
+        every = (n - 2) / (threshold - 2)
+        a, kept = 0, [0]
+        for i in range(threshold - 2):
+            start, stop = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, n)
+            avg_x, avg_y = sum(range(start, stop)) / (stop - start), sum(data[start:stop]) / (stop - start)
+            bucket = range(int(i * every) + 1, int((i + 1) * every) + 1)
+            a = max(bucket, key=lambda j: abs((a - avg_x) * (data[j] - data[a]) - (a - j) * (avg_y - data[a])))
+            kept.append(a)
+        return kept + [n - 1]
+
+    def test_lttb_matches_reference(self):
+        data = np.random.default_rng(0).normal(size=5000).cumsum()
+        for points in (3, 50, 777, 4999):
+            with self.subTest(points=points):
+                self.assertEqual(lttb(data, points).tolist(), self.reference_lttb(data.tolist(), points))
+
+    def test_minmax_keeps_extremes(self):
+        data = np.random.default_rng(1).normal(size=10001)
+        positions = minmax(data, 100)
+        self.assertLessEqual(len(positions), 100)
+        self.assertTrue(np.all(np.diff(positions) > 0))
+        self.assertEqual(data[positions].max(), data.max())
+        self.assertEqual(data[positions].min(), data.min())
+
+    def test_endpoint(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        user = User.objects.create_user('downsample', password='secret')
+        client = APIClient()
+        client.force_authenticate(user)
+        frame = sample_frame(500)
+        bodies = []
+        with override_settings(MEDIA_ROOT=media_root):
+            for storage in ('database', 'columnar'):
+                dataset = Dataset.objects.create(user=user, filename=f'{storage}.csv', storage=storage)
+                append_frames(dataset, validated_frames([frame]))
+                response = client.get(f'/api/datasets/{dataset.id}/downsample/', {'fields': 'flowrate', 'points': 40})
+                self.assertEqual(response.status_code, 200, response.content)
+                bodies.append(response.json())
+            for params in ({'points': 2}, {'method': 'average'}, {'fields': 'equipment_name'}):
+                response = client.get(f'/api/datasets/{dataset.id}/downsample/', params)
+                self.assertEqual(response.status_code, 400, params)
+        self.assertEqual(bodies[0], bodies[1])
+        series = bodies[0]['series']['flowrate']
+        self.assertEqual(bodies[0]['total'], 500)
+        self.assertEqual(series['index'], lttb(frame['Flowrate'].to_numpy(), 40).tolist())
+        self.assertEqual(series['values'], frame['Flowrate'].iloc[series['index']].tolist())
+
+
+class ComparisonTests(TestCase):
+    """Pairs and counts are the same whichever way the two datasets are stored"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('compare', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.before = sample_frame(60)
+        # Ten records dropped, three added (one of them a second P-30) and every flowrate up by 1.5
+        after = sample_frame(60).iloc[10:].copy()
+        after['Flowrate'] += 1.5
+        extra = sample_frame(3).assign(**{'Equipment Name': ['X-1', 'X-2', 'P-30']})
+        self.after = pd.concat([after, extra], ignore_index=True)
+
+    def make_dataset(self, storage, frame):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            dataset = Dataset.objects.create(user=self.user, filename=f'{storage}.csv', storage=storage)
+            append_frames(dataset, validated_frames([frame]))
+        return dataset
+
+    def compare(self, storage_a, storage_b):
+        a, b = self.make_dataset(storage_a, self.before), self.make_dataset(storage_b, self.after)
+        url, params, pairs = '/api/datasets/compare/', {'a': a.id, 'b': b.id, 'page_size': 7}, []
+        with override_settings(MEDIA_ROOT=self.media_root):
+            while url:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200, response.content)
+                body = response.json()
+                pairs.extend(body['equipment']['results'])
+                url, params = body['equipment']['next'], None
+            # Record ids depend on the storage; compare positions in a instead
+            first_id = get_store(a).read_page(a, limit=1, fields=['flowrate'])['id'].iloc[0]
+        for pair in pairs:
+            pair['a_id'] -= first_id
+            pair.pop('b_id')
+        for key in ('a', 'b'):
+            body.pop(key)
+        body['equipment']['results'] = pairs
+        return body
+
+    def test_same_result_for_every_storage(self):
+        body = self.compare('database', 'database')
+        for storages in (('columnar', 'columnar'), ('database', 'columnar')):
+            with self.subTest(storages=storages):
+                self.assertEqual(self.compare(*storages), body)
+
+        self.assertEqual(body['types']['Pump']['delta'], -3)
+        self.assertAlmostEqual(body['parameters']['flowrate']['mean']['delta'],
+                               self.after['Flowrate'].mean() - self.before['Flowrate'].mean())
+        equipment = body['equipment']
+        self.assertEqual((equipment['matched'], equipment['only_in_a'], equipment['only_in_b']), (50, 10, 2))
+        self.assertEqual(len(equipment['results']), 50)
+        first = equipment['results'][0]
+        self.assertEqual(first['equipment_name'], 'V-10')
+        self.assertEqual(first['flowrate'], {'a': 110.0, 'b': 111.5, 'delta': 1.5})
+        # P-30 appears twice in b; it is paired with the first one
+        p30 = next(pair for pair in equipment['results'] if pair['equipment_name'] == 'P-30')
+        self.assertEqual(p30['flowrate']['b'], 131.5)
+
+
+class DatasetListTests(TestCase):
+    """The listing takes a constant number of queries and pages by an opaque keyset cursor"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('lister', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        # Pairs share an upload time, so the id has to break the ties
+        for i in range(7):
+            Dataset.objects.create(user=self.user, filename=f'{i}.csv', uploaded_at=now - timedelta(hours=i // 2))
+        Dataset.objects.create(user=User.objects.create_user('other', password='secret'), filename='other.csv')
+        self.newest_first = list(Dataset.objects.filter(user=self.user)
+                                 .order_by('-uploaded_at', '-id').values_list('id', flat=True))
+
+    def get(self, path='/api/datasets/', params=None):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_query_count_does_not_grow_with_datasets(self):
+        for count in (7, 57):
+            while Dataset.objects.filter(user=self.user).count() < count:
+                Dataset.objects.create(user=self.user, filename='more.csv')
+            with self.subTest(datasets=count), self.assertNumQueries(1):
+                self.assertEqual(len(self.get()), count)
+            with self.subTest(datasets=count, paged=True), self.assertNumQueries(1):
+                self.assertEqual(len(self.get(params={'page_size': 5})['results']), 5)
+
+    def test_cursor_walks_every_dataset_once(self):
+        self.assertEqual([d['id'] for d in self.get()], self.newest_first)
+        page = self.get(params={'page_size': 3, 'fields': 'id,username'})
+        seen = [d['id'] for d in page['results']]
+        # An upload between pages does not shift the next ones
+        Dataset.objects.create(user=self.user, filename='new.csv')
+        while page['next']:
+            page = self.get(page['next'])
+            seen += [d['id'] for d in page['results']]
+            self.assertTrue(all(set(d) == {'id', 'username'} for d in page['results']))
+        self.assertEqual(seen, self.newest_first)
+
+    def test_rejects_bad_cursors_and_page_sizes(self):
+        for params in ({'cursor': 'nonsense'}, {'cursor': 'WyJ4IiwxXQ'}, {'page_size': '0'}, {'page_size': 'all'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/datasets/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_page_query_uses_newest_first_index(self):
+        index = next(index.name for index in Dataset._meta.indexes
+                     if index.fields == ['user', '-uploaded_at', '-id'])
+        last = Dataset.objects.get(id=self.newest_first[2])
+        plan = (Dataset.objects.filter(user=self.user, uploaded_at__lte=last.uploaded_at)
+                .filter(Q(uploaded_at__lt=last.uploaded_at) | Q(id__lt=last.id))
+                .order_by('-uploaded_at', '-id')[:4].explain())
+        if connection.vendor == 'sqlite':
+            self.assertIn(index, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_migrations_leave_one_upload_index(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Dataset._meta.db_table)
+        indexes = {name for name, constraint in constraints.items()
+                   if constraint['index'] and constraint['columns'][:2] == ['user_id', 'uploaded_at']}
+        self.assertEqual(indexes, {index.name for index in Dataset._meta.indexes
+                                   if index.fields == ['user', '-uploaded_at', '-id']})
+
+
+class TrendTests(TestCase):
+    """The upload series comes from one indexed query on the dataset table"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('trends', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.frames = [sample_frame(30), sample_frame(90)]
+        now = timezone.now()
+        # Created newest first, to check the series is in upload order
+        for days, frame in zip((1, 2), reversed(self.frames)):
+            dataset = Dataset.objects.create(user=self.user, filename=f'{days}.csv', storage='database',
+                                             uploaded_at=now - timedelta(days=days))
+            append_frames(dataset, validated_frames([frame]))
+
+    def test_series_from_stored_statistics(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/datasets/trends/', {'fields': 'pressure', 'by_type': 'true'})
+        self.assertEqual(response.status_code, 200, response.content)
+        series = response.json()['series']
+        self.assertEqual([point['total_count'] for point in series], [30, 90])
+        for point, frame in zip(series, self.frames):
+            self.assertEqual(list(point['overall']), ['pressure'])
+            self.assertAlmostEqual(point['overall']['pressure']['mean'], frame['Pressure'].mean())
+            self.assertAlmostEqual(point['overall']['pressure']['std'], frame['Pressure'].std())
+            valves = frame[frame['Type'] == 'Valve']
+            self.assertEqual(point['by_type']['Valve']['count'], len(valves))
+            self.assertAlmostEqual(point['by_type']['Valve']['pressure']['max'], valves['Pressure'].max())
+
+    def test_query_uses_upload_index(self):
+        index = next(index.name for index in Dataset._meta.indexes
+                     if index.fields == ['user', '-uploaded_at', '-id'])
+        plan = Dataset.objects.filter(user=self.user).order_by('uploaded_at', 'id').explain()
+        if connection.vendor == 'sqlite':
+            self.assertIn(index, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+class SearchTests(TestCase):
+    """Name and type search goes through the trigram index and covers both storage backends"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user('search', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.frame = sample_frame(6).assign(**{'Equipment Name': [
+            'Pump C30 spare', 'Pump C3', 'Valve A1', 'Valve c3-b', 'Reactor R1', 'Pump B7',
+        ], 'Type': ['Pump', 'Pump', 'Valve', 'Valve', 'Reactor', 'Pump']})
+
+    def make_dataset(self, storage, user=None, frame=None):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            dataset = Dataset.objects.create(user=user or self.user, filename=f'{storage}.csv', storage=storage)
+            append_frames(dataset, validated_frames([self.frame if frame is None else frame]))
+        return dataset
+
+    def search(self, q, **params):
+        response = self.client.get('/api/datasets/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_matches_both_backends_of_the_user_only(self):
+        database, columnar = self.make_dataset('database'), self.make_dataset('columnar')
+        self.make_dataset('database', user=User.objects.create_user('other', password='secret'))
+
+        results = self.search('pump c3')
+        self.assertEqual({(r['dataset_id'], r['equipment_name']) for r in results},
+                         {(d.id, name) for d in (database, columnar) for name in ('Pump C3', 'Pump C30 spare')})
+        # The closer match ranks first
+        self.assertEqual(results[0]['equipment_name'], 'Pump C3')
+        # Record ids point back at the records
+        by_dataset = {r['dataset_id']: r['record_id'] for r in results if r['equipment_name'] == 'Pump C3'}
+        self.assertEqual(EquipmentRecord.objects.get(id=by_dataset[database.id]).equipment_name, 'Pump C3')
+        self.assertEqual(by_dataset[columnar.id], 2)
+
+        self.assertEqual({r['equipment_name'] for r in self.search('c3-')}, {'Valve c3-b'})
+        self.assertEqual({r['equipment_name'] for r in self.search('reactor')}, {'Reactor R1'})
+        self.assertEqual(len(self.search('pump', limit=2)), 2)
+
+    def test_ranks_closer_names_then_type_matches(self):
+        self.make_dataset('columnar', frame=sample_frame(3).assign(**{
+            'Equipment Name': ['Pump C30 spare', 'Booster P2', 'Pump C3'], 'Type': 'Pump'}))
+        names = [r['equipment_name'] for r in self.search('pump')]
+        self.assertEqual(names, ['Pump C3', 'Pump C30 spare', 'Booster P2'])
+
+    def test_index_follows_appends_and_deletes(self):
+        dataset = self.make_dataset('database')
+        append_frames(dataset, validated_frames([self.frame.assign(**{'Equipment Name': 'Mixer M9'})]))
+        self.assertEqual(len(self.search('mixer')), 6)
+        self.client.delete(f'/api/datasets/{dataset.id}/delete/')
+        self.assertEqual(self.search('mixer'), [])
+        self.assertFalse(SearchEntry.objects.exists())
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH '\"mixer\"'")
+                self.assertEqual(cursor.fetchone()[0], 0)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 table')
+    def test_falls_back_to_icontains_without_the_fts_table(self):
+        database, columnar = self.make_dataset('database'), self.make_dataset('columnar')
+        with mock.patch('api.search._has_fts_table', return_value=False):
+            with CaptureQueriesContext(connection) as queries:
+                results = self.search('pump c3')
+        self.assertFalse([q['sql'] for q in queries.captured_queries if FTS_TABLE in q['sql']])
+        self.assertEqual({(r['dataset_id'], r['equipment_name']) for r in results},
+                         {(d.id, name) for d in (database, columnar) for name in ('Pump C3', 'Pump C30 spare')})
+
+    def test_migration_leaves_out_the_fts_table_before_sqlite_3_34(self):
+        for name in ('0014_searchentry', '0013_squashed_0015_dataset_user_newest_index'):
+            with self.subTest(migration=name):
+                migration = importlib.import_module(f'api.migrations.{name}')
+                schema_editor = mock.Mock(connection=mock.Mock(vendor='sqlite'))
+                with mock.patch.object(migration.sqlite3, 'sqlite_version_info', (3, 31, 1)):
+                    migration.build_search_index(django_apps, schema_editor)
+                statements = [c.args[0] for c in schema_editor.execute.call_args_list]
+                self.assertEqual(len(statements), 1)
+                self.assertTrue(statements[0].startswith('INSERT INTO api_searchentry'))
+
+    def test_rejects_short_queries_and_bad_limits(self):
+        for params in ({'q': 'c3'}, {'q': 'pump', 'limit': '0'}, {'q': 'pump', 'limit': 'all'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/datasets/search/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
@@ -0,0 +1,57 @@
+"""
+Series of a user's stored dataset aggregates over upload time.
+
+Each upload contributes one point built from its Dataset row alone (the
+statistics and equipment_types columns, see api.stats), so the cost
+grows with the number of uploads and never with their records. The
+(user, -uploaded_at, -id) index of Dataset, read backwards, returns the
+user's uploads already in time order.
+
+Datasets ingested before statistics were stored only have their rounded
+averages and type counts; their other metrics are null.
+"""
+from .parsing import NUMERIC_FIELDS
+
+TREND_METRICS = ['mean', 'std', 'min', 'max']
+
+# Dataset columns a trend point reads
+TREND_COLUMNS = ['id', 'filename', 'uploaded_at', 'total_count', 'equipment_types', 'statistics'] + [
+    f'avg_{field}' for field in NUMERIC_FIELDS
+]
+
+
+def _metrics(summary, metrics):
+    return {metric: summary[metric] if summary else None for metric in metrics}
+
+
+def trend_point(dataset, fields=NUMERIC_FIELDS, metrics=TREND_METRICS, by_type=False):
+    """
+    One point of the series:
+
+        {'id', 'filename', 'uploaded_at', 'total_count',
+         'overall': {field: {metric: value}},
+         'by_type': {type: {'count': n, field: {metric: value}}}}   (with by_type)
+    """
+    statistics = dataset.statistics or {}
+    overall = statistics.get('overall')
+    point = {
+        'id': dataset.id,
+        'filename': dataset.filename,
+        'uploaded_at': dataset.uploaded_at,
+        'total_count': dataset.total_count,
+    }
+    if overall:
+        point['overall'] = {field: _metrics(overall[field], metrics) for field in fields}
+    else:
+        point['overall'] = {
+            field: {metric: getattr(dataset, f'avg_{field}') if metric == 'mean' else None for metric in metrics}
+            for field in fields
+        }
+    if by_type:
+        summaries = statistics.get('by_type', {})
+        point['by_type'] = {
+            eq_type: {'count': count,
+                      **{field: _metrics(summaries.get(eq_type, {}).get(field), metrics) for field in fields}}
+            for eq_type, count in sorted(dataset.equipment_types.items())
+        }
+    return point
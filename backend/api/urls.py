@@ -10,7 +10,23 @@ urlpatterns = [
     # Dataset operations
     path('datasets/', views.get_datasets, name='datasets'),
     path('datasets/upload/', views.upload_csv, name='upload_csv'),
+    path('datasets/upload/batch/', views.upload_batch, name='upload_batch'),
+    path('datasets/upload/sessions/', views.create_upload_session, name='create_upload_session'),
+    path('datasets/upload/sessions/<int:session_id>/', views.upload_session, name='upload_session'),
+    path('datasets/upload/sessions/<int:session_id>/complete/', views.complete_upload_session, name='complete_upload_session'),
+    path('datasets/aggregate/', views.get_datasets_aggregate, name='datasets_aggregate'),
+    path('datasets/compare/', views.compare_datasets, name='compare_datasets'),
+    path('datasets/trends/', views.get_dataset_trends, name='dataset_trends'),
+    path('datasets/search/', views.search_equipment, name='search_equipment'),
     path('datasets/<int:dataset_id>/', views.get_dataset_detail, name='dataset_detail'),
+    path('datasets/<int:dataset_id>/records/', views.get_dataset_records, name='dataset_records'),
+    path('datasets/<int:dataset_id>/aggregate/', views.get_dataset_aggregate, name='dataset_aggregate'),
+    path('datasets/<int:dataset_id>/histogram/', views.get_dataset_histogram, name='dataset_histogram'),
+    path('datasets/<int:dataset_id>/downsample/', views.get_dataset_downsample, name='dataset_downsample'),
+    path('datasets/<int:dataset_id>/append/', views.append_to_dataset, name='append_to_dataset'),
     path('datasets/<int:dataset_id>/delete/', views.delete_dataset, name='delete_dataset'),
     path('datasets/<int:dataset_id>/report/', views.generate_pdf_report, name='generate_report'),
+    
+    # Background jobs
+    path('jobs/<int:job_id>/', views.get_job_status, name='job_status'),
 ]
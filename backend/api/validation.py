@@ -0,0 +1,208 @@
+"""
+Row-level validation of parsed CSV data.
+
+Each chunk is checked column by column with vectorized pandas/NumPy
+operations, never row by row:
+
+    missing value      empty Equipment Name, Type or measurement
+    not a number       measurement that cannot be read as a number
+    below minimum / above maximum
+                       measurement outside the bounds configured for the
+                       equipment type in INGEST_VALUE_BOUNDS
+
+In 'strict' mode any invalid row rejects the upload; the remaining
+chunks are still checked (but not stored) so the report covers the whole
+file. In 'lenient' mode invalid rows are dropped and reported.
+
+Row numbers count data rows from 1, so a row's line in the file is
+row + 1 when no field spans several lines.
+
+Nothing in this module touches the database.
+"""
+from django.conf import settings
+import numpy as np
+import pandas as pd
+
+from .parsing import (
+    COLUMN_FIELDS, NUMERIC_COLUMNS, IngestError, REQUIRED_COLUMNS, parse_file, to_record_frame, validate_columns,
+)
+
+STRICT = 'strict'
+LENIENT = 'lenient'
+MODES = [STRICT, LENIENT]
+
+
+class ValidationReport:
+    """Counts of invalid values and a capped list of examples"""
+
+    def __init__(self, max_errors=None):
+        self.max_errors = settings.INGEST_MAX_REPORTED_ERRORS if max_errors is None else max_errors
+        self.error_count = 0
+        self.rows_rejected = 0
+        self.counts = {}
+        self.errors = []
+
+    def add(self, rows, column, error, values):
+        """Record `error` for the given row numbers of `column`"""
+        if not len(rows):
+            return
+        self.error_count += len(rows)
+        key = f'{column}: {error}'
+        self.counts[key] = self.counts.get(key, 0) + len(rows)
+        room = self.max_errors - len(self.errors)
+        for row, value in zip(rows[:room], values[:room]):
+            self.errors.append({
+                'row': int(row),
+                'column': column,
+                'error': error,
+                'value': None if pd.isna(value) else str(value),
+            })
+
+    def __bool__(self):
+        return self.error_count > 0
+
+    def message(self):
+        """One-line description, safe to return to the client"""
+        first = min(self.errors, key=lambda e: e['row']) if self.errors else None
+        text = f'{self.error_count} invalid value(s) in {self.rows_rejected} row(s)'
+        if first:
+            text += f"; first at row {first['row']}, {first['column']}: {first['error']}"
+        return text
+
+    def to_json(self):
+        if not self:
+            return {}
+        self.errors.sort(key=lambda e: e['row'])
+        return {
+            'error_count': self.error_count,
+            'rows_rejected': self.rows_rejected,
+            'counts': self.counts,
+            'errors': self.errors,
+        }
+
+
+class ValidationFailed(IngestError):
+    """Strict validation rejected the data; `report` holds the details"""
+
+    def __init__(self, report):
+        super().__init__(report.message())
+        self.report = report
+
+
+def validation_mode(mode=None):
+    """`mode` if given, else INGEST_VALIDATION_MODE; raises IngestError for unknown modes"""
+    mode = mode or settings.INGEST_VALIDATION_MODE
+    if mode not in MODES:
+        raise IngestError(f'Validation mode must be one of: {", ".join(MODES)}')
+    return mode
+
+
+def _to_numbers(series):
+    """(float64 values, mask of present values that are not numbers)"""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype('float64'), np.zeros(len(series), dtype=bool)
+    # The parser fell back to text (or inferred bools/dates): coerce what is numeric
+    present = series.notna()
+    numbers = pd.to_numeric(series.astype(str).where(present), errors='coerce')
+    return numbers.astype('float64'), (present & numbers.isna()).to_numpy()
+
+
+def _bound_arrays(types, column, bounds):
+    """Per-row (min, max) arrays for `column` from the bounds of each row's type"""
+    default = bounds.get('*', {}).get(column, [None, None])
+    categories = types.cat.categories
+    lows = np.full(len(categories) + 1, -np.inf)
+    highs = np.full(len(categories) + 1, np.inf)
+    for i, eq_type in enumerate(categories):
+        low, high = bounds.get(eq_type, {}).get(column, default)
+        if low is not None:
+            lows[i] = low
+        if high is not None:
+            highs[i] = high
+    # Code -1 (no type) indexes the trailing unbounded entry
+    codes = types.cat.codes.to_numpy()
+    return lows[codes], highs[codes]
+
+
+def check_chunk(chunk, report, start_row=0, bounds=None):
+    """
+    Validate a chunk with the CSV column names. Returns the record frame
+    (see to_record_frame) and a boolean array marking its invalid rows.
+    """
+    validate_columns(chunk)
+    bounds = settings.INGEST_VALUE_BOUNDS if bounds is None else bounds
+    rows = np.arange(start_row + 1, start_row + len(chunk) + 1)
+    invalid = np.zeros(len(chunk), dtype=bool)
+
+    chunk = chunk[REQUIRED_COLUMNS].copy()
+    for column in REQUIRED_COLUMNS:
+        values = chunk[column]
+        missing = values.isna().to_numpy()
+        if column in NUMERIC_COLUMNS:
+            numbers, not_number = _to_numbers(values)
+            report.add(rows[not_number], column, 'not a number', values.to_numpy()[not_number])
+            invalid |= not_number
+            chunk[column] = numbers
+        report.add(rows[missing], column, 'missing value', values.to_numpy()[missing])
+        invalid |= missing
+
+    frame = to_record_frame(chunk)
+    if bounds:
+        for column in NUMERIC_COLUMNS:
+            values = frame[COLUMN_FIELDS[column]].to_numpy()
+            low, high = _bound_arrays(frame['equipment_type'], column, bounds)
+            below = values < low
+            above = values > high
+            for mask, limit, error in ((below, low, 'below minimum'), (above, high, 'above maximum')):
+                if mask.any():
+                    # One entry per distinct limit keeps the messages exact
+                    for value in np.unique(limit[mask]):
+                        hit = mask & (limit == value)
+                        report.add(rows[hit], column, f'{error} {value:g}', values[hit])
+            invalid |= below | above
+
+    report.rows_rejected += int(invalid.sum())
+    return frame, invalid
+
+
+def validated_frames(chunks, mode=None, report=None):
+    """
+    Validate raw chunks (CSV column names) and yield their record frames.
+
+    Lenient mode drops invalid rows. Strict mode stops yielding at the
+    first invalid row, checks the remaining chunks for the report, then
+    raises ValidationFailed.
+    """
+    mode = validation_mode(mode)
+    report = report if report is not None else ValidationReport()
+    start_row = 0
+    failed = False
+    for chunk in chunks:
+        frame, invalid = check_chunk(chunk, report, start_row)
+        start_row += len(chunk)
+        if invalid.any():
+            if mode == STRICT:
+                failed = True
+            else:
+                frame = frame[~invalid]
+        if not failed:
+            yield frame
+    if failed:
+        raise ValidationFailed(report)
+
+
+def parse_and_validate(path, engine, mode, bounds, max_errors):
+    """
+    Parse a whole CSV file (see parse_file) and validate it in `mode`.
+
+    Returns (record frame, report); the frame is None when strict mode
+    rejects the file. The settings involved are passed in rather than
+    read, so batch uploads can run this on their worker processes.
+    """
+    report = ValidationReport(max_errors)
+    frame, invalid = check_chunk(parse_file(path, engine), report, bounds=bounds)
+    if invalid.any():
+        if mode == STRICT:
+            return None, report
+        frame = frame[~invalid]
+    return frame, report
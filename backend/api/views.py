@@ -1,14 +1,19 @@
 from rest_framework import status, generics, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.files.base import ContentFile
 from django.http import HttpResponse
-from django.db.models import Count
-import pandas as pd
+from django.db.models import Count, Q
+from django.utils.dateparse import parse_datetime
 import io
+import math
+import re
+import uuid
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -16,15 +21,36 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.units import inch
 from datetime import datetime
 
-from .models import Dataset, EquipmentRecord
+from .models import Dataset, EquipmentRecord, IngestJob, UploadSession
+from .parsing import NUMERIC_FIELDS, IngestError, check_header, frame_from_rows
+from .aggregation import GROUP_BY_FIELDS, METRICS, aggregate_datasets
+from .comparison import compare_records, compare_summaries, pairs_to_json
+from .batch import ARCHIVE_SUFFIXES
+from .filtering import RecordQuery
+from .histogram import dataset_histogram
+from .search import search_records
+from .trends import TREND_COLUMNS, TREND_METRICS, trend_point
+from .downsample import METHODS as DOWNSAMPLE_METHODS, downsample_dataset
+from .conditional import add_cache_headers, datasets_version, make_etag, not_modified
+from .ingest import append_frames, csv_frames
+from .pagination import decode_cursor, encode_cursor
+from .jobs import enqueue_batch, enqueue_ingest, enqueue_stored_ingest
+from .renderers import RECORD_RENDERER_CLASSES
+from .storage import get_store, records_from_rows
+from .validation import ValidationFailed, ValidationReport, validated_frames, validation_mode
 from .serializers import (
     UserSerializer, 
     DatasetSerializer, 
     DatasetSummarySerializer,
-    EquipmentRecordSerializer
+    EquipmentRecordSerializer,
+    IngestJobSerializer,
+    UploadSessionSerializer
 )
 
 
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def register(request):
@@ -86,7 +112,7 @@ def get_user_profile(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def upload_csv(request):
-    """Upload and process CSV file"""
+    """Upload a CSV file and queue it for ingestion"""
     if 'file' not in request.FILES:
         return Response(
             {'error': 'No file provided'}, 
@@ -103,90 +129,810 @@ def upload_csv(request):
         )
     
     try:
-        # Read CSV with pandas
-        df = pd.read_csv(csv_file)
-        
-        # Validate required columns
-        required_columns = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
-        if not all(col in df.columns for col in required_columns):
+        mode = validation_mode(request.data.get('validation'))
+        check_header(csv_file)
+    except IngestError as e:
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return Response(
+            {'error': f'Error processing file: {str(e)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Parsing, inserting and pruning happen in the background
+    job = enqueue_ingest(request.user, csv_file, mode)
+    job.refresh_from_db()
+    serializer = IngestJobSerializer(job)
+    return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_batch(request):
+    """Upload several CSV files, or .zip/.tar.gz archives of them, as one background job"""
+    uploaded_files = request.FILES.getlist('files')
+    if not uploaded_files:
+        return Response(
+            {'error': 'No files provided'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    merge = str(request.data.get('merge', '')).lower() in ('1', 'true', 'yes')
+    
+    try:
+        mode = validation_mode(request.data.get('validation'))
+    except IngestError as e:
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    for uploaded_file in uploaded_files:
+        if not uploaded_file.name.endswith(ARCHIVE_SUFFIXES + ('.csv',)):
             return Response(
-                {'error': f'CSV must contain columns: {", ".join(required_columns)}'}, 
+                {'error': f'Unsupported file type: {uploaded_file.name}'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        # Calculate statistics
-        total_count = len(df)
-        avg_flowrate = df['Flowrate'].mean()
-        avg_pressure = df['Pressure'].mean()
-        avg_temperature = df['Temperature'].mean()
-        
-        # Equipment type distribution
-        equipment_types = df['Type'].value_counts().to_dict()
-        
-        # Create dataset
-        dataset = Dataset.objects.create(
-            user=request.user,
-            filename=csv_file.name,
-            total_count=total_count,
-            avg_flowrate=round(avg_flowrate, 2),
-            avg_pressure=round(avg_pressure, 2),
-            avg_temperature=round(avg_temperature, 2),
-            equipment_types=equipment_types
+    
+    job = enqueue_batch(request.user, uploaded_files, merge, mode)
+    job.refresh_from_db()
+    serializer = IngestJobSerializer(job)
+    return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_upload_session(request):
+    """Start a resumable upload of a CSV file"""
+    serializer = UploadSessionSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    if not serializer.validated_data['filename'].endswith('.csv'):
+        return Response(
+            {'error': 'File must be a CSV'}, 
+            status=status.HTTP_400_BAD_REQUEST
         )
+    if serializer.validated_data['size'] <= 0:
+        return Response(
+            {'error': 'File is empty'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    session = UploadSession(user=request.user, **serializer.validated_data)
+    session.file.save(f'{uuid.uuid4().hex}.part', ContentFile(b''), save=False)
+    session.save()
+    return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_session(request, session_id):
+    """
+    GET: current offset of a resumable upload.
+    PUT: write the byte range given by the Content-Range header.
+    DELETE: abandon the upload.
+    """
+    try:
+        session = UploadSession.objects.get(id=session_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        return Response(
+            {'error': 'Upload session not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    if request.method == 'DELETE':
+        session.file.delete(save=False)
+        session.delete()
+        return Response(
+            {'message': 'Upload session deleted successfully'}, 
+            status=status.HTTP_200_OK
+        )
+    
+    if request.method == 'PUT':
+        match = CONTENT_RANGE_RE.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+        if not match:
+            return Response(
+                {'error': 'Content-Range header required, e.g. "bytes 0-1023/4096"'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        start, end, total = (int(g) for g in match.groups())
+        if total != session.size or end < start or end >= session.size:
+            return Response(
+                {'error': 'Invalid byte range'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Ranges may overlap bytes already received (a retried chunk) but not leave a gap
+        if start > session.offset:
+            return Response(
+                {'error': 'Byte range does not start at the current offset', 'offset': session.offset}, 
+                status=status.HTTP_409_CONFLICT
+            )
         
-        # Create equipment records
-        records = []
-        for _, row in df.iterrows():
-            records.append(EquipmentRecord(
-                dataset=dataset,
-                equipment_name=row['Equipment Name'],
-                equipment_type=row['Type'],
-                flowrate=row['Flowrate'],
-                pressure=row['Pressure'],
-                temperature=row['Temperature']
-            ))
-        
-        EquipmentRecord.objects.bulk_create(records)
-        
-        # Keep only last 5 datasets per user
-        user_datasets = Dataset.objects.filter(user=request.user).order_by('-uploaded_at')
-        if user_datasets.count() > 5:
-            datasets_to_delete = user_datasets[5:]
-            Dataset.objects.filter(id__in=[d.id for d in datasets_to_delete]).delete()
-        
-        # Return dataset with records
-        serializer = DatasetSerializer(dataset)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        remaining = end - start + 1
+        stream = request.stream
+        with open(session.file.path, 'r+b') as f:
+            f.seek(start)
+            while remaining and stream is not None:
+                block = stream.read(min(remaining, 1 << 20))
+                if not block:
+                    break
+                f.write(block)
+                remaining -= len(block)
+        if remaining:
+            return Response(
+                {'error': 'Request body is shorter than the Content-Range', 'offset': session.offset}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
+        UploadSession.objects.filter(id=session.id, offset__lt=end + 1).update(offset=end + 1)
+        session.refresh_from_db()
+    
+    return Response(UploadSessionSerializer(session).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def complete_upload_session(request, session_id):
+    """Hand a fully received resumable upload to the ingest queue"""
+    try:
+        session = UploadSession.objects.get(id=session_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        return Response(
+            {'error': 'Upload session not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    if session.offset < session.size:
+        return Response(
+            {'error': 'Upload is incomplete', 'offset': session.offset}, 
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    try:
+        mode = validation_mode(request.data.get('validation'))
+    except IngestError as e:
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        with session.file.open('rb') as f:
+            check_header(f)
     except Exception as e:
+        session.file.delete(save=False)
+        session.delete()
+        message = str(e) if isinstance(e, IngestError) else f'Error processing file: {str(e)}'
         return Response(
-            {'error': f'Error processing file: {str(e)}'}, 
+            {'error': message}, 
             status=status.HTTP_400_BAD_REQUEST
         )
+    
+    # The job now owns the assembled file
+    job = enqueue_stored_ingest(request.user, session.filename, session.file.name, mode)
+    session.delete()
+    job.refresh_from_db()
+    serializer = IngestJobSerializer(job)
+    return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_job_status(request, job_id):
+    """Get the state of a background ingest job"""
+    try:
+        job = IngestJob.objects.get(id=job_id, user=request.user)
+        serializer = IngestJobSerializer(job)
+        return Response(serializer.data)
+    except IngestJob.DoesNotExist:
+        return Response(
+            {'error': 'Job not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_datasets(request):
-    """Get all datasets for current user"""
-    datasets = Dataset.objects.filter(user=request.user)
-    serializer = DatasetSummarySerializer(datasets, many=True)
-    return Response(serializer.data)
+    """
+    Get all datasets for current user, newest first (?fields= / ?exclude= select the fields).
+    With ?page_size= or ?cursor= one keyset page is returned with the cursor of the next.
+    """
+    try:
+        fields = _projection(DatasetSummarySerializer.Meta.fields,
+                             _query_list(request, 'fields'), _query_list(request, 'exclude'))
+        page = _dataset_page(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    # Served in order by the (user, -uploaded_at, -id) index
+    datasets = Dataset.objects.filter(user=request.user).order_by('-uploaded_at', '-id')
+    if page is None:
+        datasets = list(_only_dataset_fields(datasets, fields))
+    else:
+        page_size, after = page
+        if after is not None:
+            uploaded_at, dataset_id = after
+            # The inclusive bound lets the index seek to the cursor
+            datasets = datasets.filter(uploaded_at__lte=uploaded_at).filter(
+                Q(uploaded_at__lt=uploaded_at) | Q(id__lt=dataset_id))
+        # One extra row tells whether there is a next page
+        datasets = list(_only_dataset_fields(datasets, fields + ['uploaded_at'])[:page_size + 1])
+    # No Last-Modified: removing a dataset leaves no timestamp behind
+    etag = make_etag(request, datasets_version(datasets))
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    if page is None:
+        serializer = DatasetSummarySerializer(datasets, many=True, fields=fields)
+        return add_cache_headers(Response(serializer.data), etag)
+
+    next_url = None
+    if len(datasets) > page_size:
+        last = datasets[page_size - 1]
+        params = request.query_params.copy()
+        params['cursor'] = encode_cursor([last.uploaded_at.isoformat(), last.id])
+        params['page_size'] = page_size
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    serializer = DatasetSummarySerializer(datasets[:page_size], many=True, fields=fields)
+    return add_cache_headers(Response({'next': next_url, 'results': serializer.data}), etag)
+
+
+def _dataset_page(request):
+    """(page_size, (uploaded_at, id) to continue after or None) of a paged listing, None for the full list"""
+    params = request.query_params
+    if 'page_size' not in params and 'cursor' not in params:
+        return None
+    try:
+        page_size = int(params.get('page_size', settings.DATASETS_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('page_size must be an integer')
+    if not 1 <= page_size <= settings.DATASETS_MAX_PAGE_SIZE:
+        raise ValueError(f'page_size must be between 1 and {settings.DATASETS_MAX_PAGE_SIZE}')
+    if 'cursor' not in params:
+        return page_size, None
+    uploaded_at, dataset_id = decode_cursor(params['cursor'], 2)
+    try:
+        uploaded_at = parse_datetime(uploaded_at)
+    except (TypeError, ValueError):
+        uploaded_at = None
+    if uploaded_at is None or not isinstance(dataset_id, int):
+        raise ValueError('Invalid cursor')
+    return page_size, (uploaded_at, dataset_id)
+
+
+def _query_flag(request, name, default):
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _query_list(request, name):
+    """Comma-separated query parameter as a list"""
+    value = request.query_params.get(name, '')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _projection(available, fields, exclude):
+    """The `available` field names kept by ?fields= and ?exclude=, in their usual order"""
+    unknown = [name for name in fields + exclude if name not in available]
+    if unknown:
+        raise ValueError(f'Unknown field(s): {", ".join(unknown)}; available: {", ".join(available)}')
+    return [name for name in available if (not fields or name in fields) and name not in exclude]
+
+
+def _only_dataset_fields(queryset, fields):
+    """Load only the Dataset columns that the serializer fields in `fields` read, and the content version"""
+    columns = ['id', 'version', 'modified_at']
+    for name in fields:
+        if name == 'username':
+            queryset = queryset.select_related('user')
+            columns.append('user__username')
+        elif name == 'records':
+            columns.append('storage')
+        elif name != 'id':
+            columns.append(name)
+    return queryset.only(*columns)
+
+
+def _split_record_fields(names):
+    """Split `records.<field>` names off a ?fields= / ?exclude= list"""
+    prefix = 'records.'
+    return (
+        [name for name in names if not name.startswith(prefix)],
+        [name[len(prefix):] for name in names if name.startswith(prefix)],
+    )
+
+
+def _wants_columns(request):
+    """Whether the negotiated renderer takes the records as a DataFrame"""
+    return getattr(request.accepted_renderer, 'columnar', False)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(RECORD_RENDERER_CLASSES)
 def get_dataset_detail(request, dataset_id):
-    """Get detailed dataset with all records"""
+    """
+    Get detailed dataset with all records (?records=false leaves them out).
+    ?fields= / ?exclude= select dataset fields, and record fields as records.<field>.
+    Columnar formats are negotiated with Accept or ?format=.
+    """
+    fields, record_fields = _split_record_fields(_query_list(request, 'fields'))
+    exclude, record_exclude = _split_record_fields(_query_list(request, 'exclude'))
+    if record_fields and fields and 'records' not in fields:
+        fields.append('records')
+    if not _query_flag(request, 'records', True):
+        exclude.append('records')
+    try:
+        fields = _projection(DatasetSerializer.Meta.fields, fields, exclude)
+        record_fields = _projection(EquipmentRecordSerializer.Meta.fields, record_fields, record_exclude)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        dataset = _only_dataset_fields(Dataset.objects.filter(user=request.user), fields).get(id=dataset_id)
+        etag = make_etag(request, f'{dataset.id}-{dataset.version}')
+        response = not_modified(request, etag, dataset.modified_at)
+        if response is not None:
+            return response
+        context = {'record_fields': record_fields, 'columnar': _wants_columns(request)}
+        serializer = DatasetSerializer(dataset, fields=fields, context=context)
+        return add_cache_headers(Response(serializer.data), etag, dataset.modified_at)
+    except Dataset.DoesNotExist:
+        return Response(
+            {'error': 'Dataset not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes(RECORD_RENDERER_CLASSES)
+def get_dataset_records(request, dataset_id):
+    """
+    Get one page of a dataset's records, after the record id given by ?after=.
+    ?fields= / ?exclude= select the record fields. Filter and ?ordering=
+    parameters are described in api.filtering. Columnar formats are
+    negotiated with Accept or ?format=.
+    """
+    try:
+        dataset = Dataset.objects.get(id=dataset_id, user=request.user)
+    except Dataset.DoesNotExist:
+        return Response(
+            {'error': 'Dataset not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    try:
+        after = int(request.query_params.get('after', 0))
+        page_size = int(request.query_params.get('page_size', settings.RECORDS_PAGE_SIZE))
+    except ValueError:
+        return Response(
+            {'error': 'after and page_size must be integers'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        fields = _projection(EquipmentRecordSerializer.Meta.fields,
+                             _query_list(request, 'fields'), _query_list(request, 'exclude'))
+        query = RecordQuery.from_params(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if after < 0:
+        return Response(
+            {'error': 'after must not be negative'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not 1 <= page_size <= settings.RECORDS_MAX_PAGE_SIZE:
+        return Response(
+            {'error': f'page_size must be between 1 and {settings.RECORDS_MAX_PAGE_SIZE}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    etag = make_etag(request, f'{dataset.id}-{dataset.version}')
+    response = not_modified(request, etag, dataset.modified_at)
+    if response is not None:
+        return response
+    
+    # One extra row tells whether there is a next page
+    # Only the selected columns are read; the page always carries its ids,
+    # and the ordering field goes last so the next cursor can be built
+    record_fields = [f for f in fields if f != 'id']
+    read_fields = list(record_fields or ['flowrate'])
+    if query.keyed and query.order_field not in read_fields:
+        read_fields.append(query.order_field)
+    store = get_store(dataset)
+    cursor = None
+    if _wants_columns(request):
+        frame = store.read_page(dataset, after=after, limit=page_size + 1, fields=read_fields, query=query or None)
+        records = frame.iloc[:page_size][fields]
+        if len(frame) > page_size:
+            last = frame.iloc[page_size - 1]
+            cursor = query.cursor(int(last['id']), last[query.order_field])
+    else:
+        rows = store.read_rows(dataset, read_fields, after=after, limit=page_size + 1, query=query or None)
+        # The names stop before any extra column, which records_from_rows then leaves out
+        records = records_from_rows(rows[:page_size], record_fields, include_id='id' in fields)
+        if len(rows) > page_size:
+            last = rows[page_size - 1]
+            cursor = query.cursor(last[0], last[read_fields.index(query.order_field) + 1] if query.keyed else None)
+    next_url = None
+    if cursor is not None:
+        params = request.query_params.copy()
+        for name, value in cursor.items():
+            params[name] = value
+        params['page_size'] = page_size
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    return add_cache_headers(Response({
+        'count': store.count(dataset, query) if query.filters else dataset.total_count,
+        'next': next_url,
+        'results': records,
+    }), etag, dataset.modified_at)
+
+
+def _aggregate(request, dataset_ids):
+    """Aggregate response for the user's datasets with these ids"""
+    group_by = list(dict.fromkeys(_query_list(request, 'group_by')))
+    unknown = [key for key in group_by if key not in GROUP_BY_FIELDS]
+    if unknown:
+        return Response(
+            {'error': f'Cannot group by: {", ".join(unknown)}; available: {", ".join(GROUP_BY_FIELDS)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        metrics = _projection(METRICS, _query_list(request, 'metrics'), [])
+        fields = _projection(NUMERIC_FIELDS, _query_list(request, 'fields'), [])
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    datasets = list(Dataset.objects.filter(user=request.user, id__in=dataset_ids).only(
+        'id', 'storage', 'version', 'modified_at'
+    ).order_by('id'))
+    if len(datasets) != len(set(dataset_ids)):
+        return Response(
+            {'error': 'Dataset not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    etag = make_etag(request, datasets_version(datasets))
+    last_modified = max(dataset.modified_at for dataset in datasets)
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    return add_cache_headers(Response({
+        'datasets': [dataset.id for dataset in datasets],
+        'group_by': group_by,
+        'metrics': metrics,
+        'fields': fields,
+        'results': aggregate_datasets(datasets, group_by, metrics, fields),
+    }), etag, last_modified)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_dataset_aggregate(request, dataset_id):
+    """Group-by aggregates of a dataset's records (?group_by=, ?metrics=, ?fields=)"""
+    return _aggregate(request, [dataset_id])
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_datasets_aggregate(request):
+    """Group-by aggregates over the records of several datasets (?ids=1,2,3)"""
+    try:
+        dataset_ids = [int(value) for value in _query_list(request, 'ids')]
+    except ValueError:
+        return Response(
+            {'error': 'ids must be a comma-separated list of dataset ids'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not dataset_ids:
+        return Response(
+            {'error': 'ids is required'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return _aggregate(request, dataset_ids)
+
+
+def _per_axis(values, axes, parse):
+    """One parsed value per axis from a comma-separated list of one value or one per axis"""
+    if not values:
+        return None
+    if len(values) == 1:
+        values = values * axes
+    if len(values) != axes:
+        raise ValueError(f'Give one value or {axes}')
+    return [parse(value) for value in values]
+
+
+def _bin_count(value):
+    if value == 'auto':
+        return value
+    if not value.isdigit() or int(value) < 1:
+        raise ValueError(f'bins must be auto or a positive integer, got {value!r}')
+    return int(value)
+
+
+def _bin_width(value):
+    try:
+        width = float(value)
+    except ValueError:
+        width = None
+    if width is None or not math.isfinite(width) or width <= 0:
+        raise ValueError(f'bin_width must be a positive number, got {value!r}')
+    return width
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_dataset_histogram(request, dataset_id):
+    """
+    Binned counts of a numeric field (?x=), or 2D counts of two (?x=&y=),
+    optionally split by equipment type (?group_by=equipment_type).
+    ?bins= and ?bin_width= choose the bins; see api.histogram.
+    """
+    try:
+        dataset = Dataset.objects.get(id=dataset_id, user=request.user)
+    except Dataset.DoesNotExist:
+        return Response(
+            {'error': 'Dataset not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    fields = [request.query_params.get(name) for name in ('x', 'y') if request.query_params.get(name)]
+    if not request.query_params.get('x'):
+        return Response(
+            {'error': f'x is required: one of {", ".join(NUMERIC_FIELDS)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    unknown = [field for field in fields if field not in NUMERIC_FIELDS]
+    if unknown:
+        return Response(
+            {'error': f'Unknown field(s): {", ".join(unknown)}; available: {", ".join(NUMERIC_FIELDS)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    group_by = _query_list(request, 'group_by')
+    if group_by not in ([], ['equipment_type']):
+        return Response(
+            {'error': 'Histograms can only be grouped by equipment_type'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        bins = _per_axis(_query_list(request, 'bins'), len(fields), _bin_count)
+        widths = _per_axis(_query_list(request, 'bin_width'), len(fields), _bin_width)
+        if bins and widths:
+            raise ValueError('Give bins or bin_width, not both')
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    etag = make_etag(request, f'{dataset.id}-{dataset.version}')
+    response = not_modified(request, etag, dataset.modified_at)
+    if response is not None:
+        return response
+    try:
+        histogram = dataset_histogram(dataset, fields, bins, widths, group_by_type=bool(group_by))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return add_cache_headers(Response(histogram), etag, dataset.modified_at)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_dataset_downsample(request, dataset_id):
+    """
+    At most ?points= points of each numeric field over record order
+    (?fields=, default all), chosen by ?method=lttb or minmax; see api.downsample.
+    """
+    try:
+        dataset = Dataset.objects.get(id=dataset_id, user=request.user)
+    except Dataset.DoesNotExist:
+        return Response(
+            {'error': 'Dataset not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    try:
+        fields = _projection(NUMERIC_FIELDS, _query_list(request, 'fields'), [])
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    method = request.query_params.get('method', 'lttb')
+    if method not in DOWNSAMPLE_METHODS:
+        return Response(
+            {'error': f'Unknown method: {method}; available: {", ".join(DOWNSAMPLE_METHODS)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        points = int(request.query_params.get('points', 1000))
+    except ValueError:
+        points = 0
+    if not 3 <= points <= settings.DOWNSAMPLE_MAX_POINTS:
+        return Response(
+            {'error': f'points must be an integer between 3 and {settings.DOWNSAMPLE_MAX_POINTS}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    etag = make_etag(request, f'{dataset.id}-{dataset.version}')
+    response = not_modified(request, etag, dataset.modified_at)
+    if response is not None:
+        return response
+    return add_cache_headers(Response(downsample_dataset(dataset, fields, points, method)),
+                             etag, dataset.modified_at)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def compare_datasets(request):
+    """
+    Compare dataset ?b= with dataset ?a=: type count and parameter deltas,
+    and one page (?after=, ?page_size=) of records paired by equipment name;
+    see api.comparison.
+    """
+    try:
+        dataset_ids = [int(request.query_params[name]) for name in ('a', 'b')]
+        after = int(request.query_params.get('after', 0))
+        page_size = int(request.query_params.get('page_size', settings.RECORDS_PAGE_SIZE))
+    except KeyError:
+        return Response(
+            {'error': 'a and b (dataset ids) are required'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except ValueError:
+        return Response(
+            {'error': 'a, b, after and page_size must be integers'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if after < 0 or not 1 <= page_size <= settings.RECORDS_MAX_PAGE_SIZE:
+        return Response(
+            {'error': f'after must not be negative and page_size must be between 1 and '
+                      f'{settings.RECORDS_MAX_PAGE_SIZE}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    datasets = {dataset.id: dataset for dataset in Dataset.objects.filter(user=request.user, id__in=dataset_ids)}
+    if len(datasets) != len(set(dataset_ids)):
+        return Response(
+            {'error': 'Dataset not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    a, b = (datasets[dataset_id] for dataset_id in dataset_ids)
+    
+    etag = make_etag(request, datasets_version([a, b]))
+    last_modified = max(a.modified_at, b.modified_at)
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    
+    # One extra pair tells whether there is a next page
+    pairs, counts = compare_records(a, b, after, page_size + 1)
+    next_url = None
+    if len(pairs) > page_size:
+        params = request.query_params.copy()
+        params['after'] = int(pairs['a_id'].iloc[page_size - 1])
+        params['page_size'] = page_size
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    return add_cache_headers(Response({
+        'a': {'id': a.id, 'filename': a.filename, 'total_count': a.total_count},
+        'b': {'id': b.id, 'filename': b.filename, 'total_count': b.total_count},
+        **compare_summaries(a, b),
+        'equipment': {
+            **counts,
+            'next': next_url,
+            'results': pairs_to_json(pairs.iloc[:page_size]),
+        },
+    }), etag, last_modified)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_dataset_trends(request):
+    """
+    The stored aggregates of each of the user's datasets, oldest upload first
+    (?fields=, ?metrics=, ?by_type=true for per-type aggregates); see api.trends.
+    """
+    try:
+        fields = _projection(NUMERIC_FIELDS, _query_list(request, 'fields'), [])
+        metrics = _projection(TREND_METRICS, _query_list(request, 'metrics'), [])
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    by_type = _query_flag(request, 'by_type', False)
+    
+    # Served by the (user, -uploaded_at, -id) index read backwards; no record is read
+    datasets = list(Dataset.objects.filter(user=request.user).order_by('uploaded_at', 'id').only(
+        *TREND_COLUMNS, 'version', 'modified_at'
+    ))
+    # No Last-Modified: removing a dataset leaves no timestamp behind
+    etag = make_etag(request, datasets_version(datasets))
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    return add_cache_headers(Response({
+        'fields': fields,
+        'metrics': metrics,
+        'series': [trend_point(dataset, fields, metrics, by_type) for dataset in datasets],
+    }), etag)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_equipment(request):
+    """Records of all the user's datasets whose name or type contains ?q=, best first (?limit=); see api.search"""
+    try:
+        limit = int(request.query_params.get('limit', 20))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= settings.SEARCH_MAX_RESULTS:
+        return Response(
+            {'error': f'limit must be an integer between 1 and {settings.SEARCH_MAX_RESULTS}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    query = request.query_params.get('q', '')
+    try:
+        results = search_records(request.user, query, limit)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'query': query.strip(), 'results': results})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def append_to_dataset(request, dataset_id):
+    """Append rows (a CSV file or a JSON list of rows) to an existing dataset"""
     try:
         dataset = Dataset.objects.get(id=dataset_id, user=request.user)
-        serializer = DatasetSerializer(dataset)
-        return Response(serializer.data)
     except Dataset.DoesNotExist:
         return Response(
             {'error': 'Dataset not found'}, 
             status=status.HTTP_404_NOT_FOUND
         )
+    
+    if 'file' in request.FILES:
+        csv_file = request.FILES['file']
+        if not csv_file.name.endswith('.csv'):
+            return Response(
+                {'error': 'File must be a CSV'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        rows = None
+    else:
+        rows = request.data if isinstance(request.data, list) else request.data.get('rows')
+        if not rows:
+            return Response(
+                {'error': 'No file or rows provided'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    report = ValidationReport()
+    try:
+        mode = validation_mode(None if isinstance(request.data, list) else request.data.get('validation'))
+        if rows is None:
+            frames = csv_frames(csv_file, mode=mode, report=report)
+        else:
+            frames = validated_frames([frame_from_rows(rows)], mode, report)
+        rows_appended = append_frames(dataset, frames)
+    except ValidationFailed as e:
+        return Response(
+            {'error': str(e), 'validation': e.report.to_json()}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except IngestError as e:
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return Response(
+            {'error': f'Error processing file: {str(e)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    dataset.refresh_from_db()
+    return Response({
+        'rows_appended': rows_appended,
+        'validation': report.to_json(),
+        'dataset': DatasetSummarySerializer(dataset).data,
+    })
 
 
 @api_view(['DELETE'])
@@ -213,7 +959,11 @@ def generate_pdf_report(request, dataset_id):
     """Generate PDF report for a dataset"""
     try:
         dataset = Dataset.objects.get(id=dataset_id, user=request.user)
-        records = dataset.records.all()
+        etag = make_etag(request, f'{dataset.id}-{dataset.version}')
+        response = not_modified(request, etag, dataset.modified_at)
+        if response is not None:
+            return response
+        records = get_store(dataset).read_frame(dataset)
         
         # Create PDF buffer
         buffer = io.BytesIO()
@@ -316,13 +1066,16 @@ def generate_pdf_report(request, dataset_id):
         elements.append(Paragraph("Detailed Equipment Records", heading_style))
         
         record_data = [['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temp']]
-        for record in records:
+        for name, eq_type, flowrate, pressure, temperature in zip(
+            records['equipment_name'], records['equipment_type'],
+            records['flowrate'], records['pressure'], records['temperature']
+        ):
             record_data.append([
-                record.equipment_name,
-                record.equipment_type,
-                f"{record.flowrate:.1f}",
-                f"{record.pressure:.1f}",
-                f"{record.temperature:.1f}"
+                name,
+                eq_type,
+                f"{flowrate:.1f}",
+                f"{pressure:.1f}",
+                f"{temperature:.1f}"
             ])
         
         record_table = Table(record_data, colWidths=[2*inch, 1.5*inch, 1*inch, 1*inch, 1*inch])
@@ -346,7 +1099,7 @@ def generate_pdf_report(request, dataset_id):
         # Return response
         response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="report_{dataset.filename}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-        return response
+        return add_cache_headers(response, etag, dataset.modified_at)
         
     except Dataset.DoesNotExist:
         return Response(
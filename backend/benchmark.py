@@ -0,0 +1,1216 @@
+"""
+Benchmarks for Chemical Equipment Parameter Visualizer
+
+Runs against a throwaway SQLite database (or BENCH_DATABASE_URL when set),
+never against the configured application database.
+
+Usage:
+    python benchmark.py ingest --rows 1000000 10000000
+    python benchmark.py bulkload --rows 100000 1000000
+    python benchmark.py batch --files 64 --rows 50000
+    python benchmark.py storage --rows 100000 1000000
+    python benchmark.py append --rows 100000 1000000 5000000
+    python benchmark.py parse --rows 1000000 --extra-columns 40
+    python benchmark.py records --rows 1000000
+    python benchmark.py projection --rows 100000
+    python benchmark.py serialize --rows 10000 100000 1000000
+    python benchmark.py formats --rows 100000 1000000
+    python benchmark.py conditional --rows 20000
+    python benchmark.py aggregate --rows 100000 1000000
+    python benchmark.py filter --rows 100000 1000000
+    python benchmark.py histogram --rows 100000 1000000
+    python benchmark.py downsample --rows 100000 1000000
+    python benchmark.py compare --rows 100000 1000000
+    python benchmark.py trends --uploads 50 --rows 1000 20000
+    python benchmark.py search --rows 1000000 10000000
+    python benchmark.py datasets --datasets 1000 10000
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+EQUIPMENT_TYPES = ['Reactor', 'Heat Exchanger', 'Pump', 'Compressor', 'Distillation Column', 'Valve']
+
+
+def print_section(title):
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def setup_django(db_path):
+    """Configure Django against a scratch database and migrate it"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chemical_equipment.settings')
+    bench_url = os.environ.get('BENCH_DATABASE_URL')
+    if bench_url:
+        os.environ['DATABASE_URL'] = bench_url
+    else:
+        os.environ.pop('DATABASE_URL', None)
+
+    import django
+    from django.conf import settings
+    if not bench_url:
+        settings.DATABASES['default']['NAME'] = db_path
+    # DEBUG keeps every executed SQL string in memory
+    settings.DEBUG = False
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def sample_frame(rng, start, n):
+    """Synthetic equipment rows with the CSV column names"""
+    return pd.DataFrame({
+        'Equipment Name': [f'Unit {i}' for i in range(start, start + n)],
+        'Type': rng.choice(EQUIPMENT_TYPES, n),
+        'Flowrate': rng.normal(180, 30, n).round(1),
+        'Pressure': rng.normal(6, 1.5, n).round(1),
+        'Temperature': rng.normal(85, 20, n).round(1),
+    })
+
+
+def write_sample_csv(path, rows, chunk_rows=200_000):
+    """Write a synthetic equipment CSV without holding it all in memory"""
+    rng = np.random.default_rng(42)
+    written = 0
+    with open(path, 'w', newline='') as f:
+        while written < rows:
+            n = min(chunk_rows, rows - written)
+            sample_frame(rng, written, n).to_csv(f, index=False, header=(written == 0))
+            written += n
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    # VmHWM is reset on exec; ru_maxrss can inherit the parent's peak on Linux
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_ingest(csv_path, db_path):
+    """Child process: ingest one file and report time and peak RSS"""
+    setup_django(db_path)
+    from django.contrib.auth.models import User
+    from api.models import Dataset
+    from api.ingest import ingest_csv
+
+    user, _ = User.objects.get_or_create(username='benchmark')
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    dataset = Dataset.objects.create(user=user, filename=os.path.basename(csv_path))
+    with open(csv_path, 'rb') as f:
+        ingest_csv(f, dataset)
+    elapsed = time.perf_counter() - start
+    print(f"{dataset.total_count}\t{elapsed:.2f}\t{baseline:.1f}\t{peak_rss_mb():.1f}")
+
+
+def bench_ingest(rows_list):
+    print_section("Streaming ingest: time and peak RSS")
+    print(f"   {'rows':>12} {'seconds':>9} {'rows/s':>10} {'base MB':>9} {'peak MB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in rows_list:
+            csv_path = os.path.join(tmp, f'equipment_{rows}.csv')
+            db_path = os.path.join(tmp, f'bench_{rows}.sqlite3')
+            write_sample_csv(csv_path, rows)
+            # Fresh interpreter per size so the peak RSS is not carried over
+            out = subprocess.run(
+                [sys.executable, __file__, '_ingest-child', csv_path, db_path],
+                check=True, capture_output=True, text=True,
+            ).stdout.strip().splitlines()[-1]
+            count, seconds, base, peak = out.split('\t')
+            rate = int(count) / float(seconds)
+            print(f"   {int(count):>12,} {float(seconds):>9.2f} {rate:>10,.0f} {float(base):>9.1f} {float(peak):>9.1f}")
+            os.remove(csv_path)
+
+
+def bench_bulkload(rows_list, batch_sizes):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_bulkload.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection, transaction
+        from api.bulkload import load_method, load_records
+        from api.parsing import to_record_frame
+        from api.models import Dataset, EquipmentRecord
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        native = load_method()
+        print_section(f"Bulk load throughput on {connection.vendor} (native path: {native})")
+        print(f"   {'rows':>10} {'method':>22} {'batch':>7} {'seconds':>9} {'rows/s':>10}")
+
+        def iterrows_bulk_create(dataset_id, df):
+            # The pre-bulkload upload path, for reference
+            EquipmentRecord.objects.bulk_create([
+                EquipmentRecord(
+                    dataset_id=dataset_id,
+                    equipment_name=row['Equipment Name'],
+                    equipment_type=row['Type'],
+                    flowrate=row['Flowrate'],
+                    pressure=row['Pressure'],
+                    temperature=row['Temperature'],
+                )
+                for _, row in df.iterrows()
+            ])
+
+        for rows in rows_list:
+            df = sample_frame(np.random.default_rng(42), 0, rows)
+            runs = [('iterrows+bulk_create', None), ('bulk_create', settings.BULK_LOAD_BATCH_SIZE)]
+            if native == 'copy':
+                runs.append(('copy', None))
+            if native != 'bulk_create':
+                runs += [('executemany', size) for size in batch_sizes]
+
+            for method, batch_size in runs:
+                dataset = Dataset.objects.create(user=user, filename='bench.csv')
+                if batch_size:
+                    settings.BULK_LOAD_BATCH_SIZE = batch_size
+                start = time.perf_counter()
+                with transaction.atomic():
+                    if method == 'iterrows+bulk_create':
+                        iterrows_bulk_create(dataset.id, df)
+                    else:
+                        load_records(dataset.id, to_record_frame(df), method=method)
+                elapsed = time.perf_counter() - start
+                print(f"   {rows:>10,} {method:>22} {batch_size or '-':>7} {elapsed:>9.2f} {rows / elapsed:>10,.0f}")
+                dataset.delete()
+
+
+def bench_batch(files, rows, worker_counts):
+    """Parse throughput of the batch-upload process pool (no database work)"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chemical_equipment.settings')
+    from api.parsing import parse_file
+
+    print_section(f"Batch parse: {files} files x {rows:,} rows")
+    print(f"   {'workers':>8} {'seconds':>9} {'files/s':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(files):
+            path = os.path.join(tmp, f'unit_{i}.csv')
+            write_sample_csv(path, rows)
+            paths.append(path)
+
+        baseline = None
+        for workers in worker_counts:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                # Warm the workers up so interpreter start-up is not timed
+                list(pool.map(parse_file, paths[:workers]))
+                start = time.perf_counter()
+                list(pool.map(parse_file, paths))
+                elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"   {workers:>8} {elapsed:>9.2f} {files / elapsed:>9.1f} {baseline / elapsed:>7.2f}x")
+
+
+def record_table_bytes(connection):
+    """On-disk size of the EquipmentRecord table and its indexes"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT pg_total_relation_size('api_equipmentrecord')")
+        else:
+            cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'api_equipmentrecord%%'")
+        return cursor.fetchone()[0] or 0
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def bench_storage(rows_list, repeat=3):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_storage.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from api.ingest import iter_ingest
+        from api.models import Dataset
+        from api.storage import ColumnarRecordStore, get_store
+        settings.MEDIA_ROOT = tmp
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        print_section(f"Record storage backends ({connection.vendor})")
+        print(f"   {'rows':>10} {'backend':>9} {'disk MB':>8} {'read all s':>11} {'read 1 col s':>13}")
+        for rows in rows_list:
+            csv_path = os.path.join(tmp, 'storage.csv')
+            write_sample_csv(csv_path, rows)
+            for backend in ('database', 'columnar'):
+                before = record_table_bytes(connection)
+                dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=backend)
+                with open(csv_path, 'rb') as f:
+                    for _ in iter_ingest(f, dataset):
+                        pass
+                if backend == 'database':
+                    size = record_table_bytes(connection) - before
+                else:
+                    size = directory_bytes(ColumnarRecordStore().directory(dataset))
+
+                store = get_store(dataset)
+                timings = []
+                for fields in (None, ['flowrate']):
+                    best = float('inf')
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        store.read_frame(dataset, fields)
+                        best = min(best, time.perf_counter() - start)
+                    timings.append(best)
+                print(f"   {rows:>10,} {backend:>9} {size / 2**20:>8.1f} {timings[0]:>11.3f} {timings[1]:>13.3f}")
+                dataset.delete()
+            os.remove(csv_path)
+
+
+def bench_append(rows_list, append_rows=1_000, repeat=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_append.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from api.ingest import append_frames
+        from api.models import Dataset
+        from api.parsing import to_record_frame
+        settings.MEDIA_ROOT = tmp
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        rng = np.random.default_rng(42)
+        print_section(f"Appending {append_rows:,} rows to a dataset ({connection.vendor})")
+        print(f"   {'existing rows':>14} {'backend':>9} {'append ms':>10}")
+        for rows in rows_list:
+            for backend in ('database', 'columnar'):
+                dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=backend)
+                chunk = 200_000
+                append_frames(dataset, (
+                    to_record_frame(sample_frame(rng, start, min(chunk, rows - start)))
+                    for start in range(0, rows, chunk)
+                ))
+                best = float('inf')
+                for i in range(repeat):
+                    frame = to_record_frame(sample_frame(rng, rows + i * append_rows, append_rows))
+                    start = time.perf_counter()
+                    append_frames(dataset, [frame])
+                    best = min(best, time.perf_counter() - start)
+                print(f"   {rows:>14,} {backend:>9} {best * 1000:>10.1f}")
+                dataset.delete()
+
+
+def write_wide_csv(path, rows, extra_columns, chunk_rows=100_000):
+    """Synthetic export with `extra_columns` unused columns around the required ones"""
+    rng = np.random.default_rng(42)
+    written = 0
+    with open(path, 'w', newline='') as f:
+        while written < rows:
+            n = min(chunk_rows, rows - written)
+            frame = sample_frame(rng, written, n)
+            for i in range(extra_columns):
+                if i % 2:
+                    frame[f'Note {i}'] = rng.choice(['ok', 'check', 'replace', 'n/a'], n)
+                else:
+                    frame[f'Reading {i}'] = rng.normal(0, 1, n).round(3)
+            frame.to_csv(f, index=False, header=(written == 0))
+            written += n
+
+
+def bench_parse(rows, extra_columns, repeat=3):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chemical_equipment.settings')
+    import django
+    django.setup()
+    from api.parsing import pa_csv, parse_file, read_csv_chunks, validate_columns
+    from api.validation import validated_frames
+
+    def legacy_chunks(path):
+        # The parse before the schema: every column, types sniffed per chunk
+        for chunk in pd.read_csv(path, chunksize=50_000):
+            validate_columns(chunk)
+            frame = chunk[['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']].copy()
+            frame['Equipment Name'] = frame['Equipment Name'].astype(str)
+            frame['Type'] = frame['Type'].astype(str)
+
+    # Parse plus row validation, as ingest runs them
+    def chunks(engine):
+        return lambda path: list(validated_frames(read_csv_chunks(path, 50_000, engine)))
+
+    def whole(engine):
+        return lambda path: list(validated_frames([parse_file(path, engine)]))
+
+    cases = [('legacy (sniffed, all columns)', 'chunks', legacy_chunks),
+             ('c', 'chunks', chunks('c')), ('c', 'whole', whole('c'))]
+    if pa_csv is not None:
+        cases += [('pyarrow', 'chunks', chunks('pyarrow')), ('pyarrow', 'whole', whole('pyarrow'))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'wide.csv')
+        write_wide_csv(path, rows, extra_columns)
+        size_mb = os.path.getsize(path) / 2**20
+        print_section(f"Parsing {rows:,} rows x {5 + extra_columns} columns ({size_mb:.0f} MB)")
+        if pa_csv is None:
+            print("   pyarrow is not installed; skipping its engine")
+        print(f"   {'engine':<30} {'read':>7} {'seconds':>8} {'rows/s':>12}")
+        for name, mode, parse in cases:
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                parse(path)
+                best = min(best, time.perf_counter() - start)
+            print(f"   {name:<30} {mode:>7} {best:>8.2f} {rows / best:>12,.0f}")
+
+
+def bench_records(rows_list, page_size=1000, repeat=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_records.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from api.ingest import append_frames
+        from api.models import Dataset
+        from api.storage import get_store, records_from_frame
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        rng = np.random.default_rng(42)
+        print_section(f"Records page latency, {page_size:,} per page ({connection.vendor})")
+        print(f"   {'rows':>10} {'backend':>9} {'first ms':>9} {'middle ms':>10} {'last ms':>8} {'all records s':>14}")
+        for rows in rows_list:
+            for backend in ('database', 'columnar'):
+                dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=backend)
+                chunk = 50_000
+                append_frames(dataset, validated_frames(
+                    sample_frame(rng, start, min(chunk, rows - start)) for start in range(0, rows, chunk)
+                ))
+                store = get_store(dataset)
+                timings = []
+                for after in (0, rows // 2, rows - page_size):
+                    best = float('inf')
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        records_from_frame(store.read_page(dataset, after=after, limit=page_size + 1))
+                        best = min(best, time.perf_counter() - start)
+                    timings.append(best * 1000)
+                # What the detail endpoint did for every request before pagination
+                start = time.perf_counter()
+                records_from_frame(store.read_frame(dataset))
+                everything = time.perf_counter() - start
+                print(f"   {rows:>10,} {backend:>9} {timings[0]:>9.1f} {timings[1]:>10.1f} {timings[2]:>8.1f} {everything:>14.2f}")
+                dataset.delete()
+
+
+PROJECTIONS = [
+    ('all fields', ''),
+    ('id,flowrate', 'fields=id,flowrate'),
+    ('exclude name', 'exclude=equipment_name'),
+]
+
+
+def bench_projection(rows, page_size=10_000, repeat=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_projection.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from rest_framework.test import APIClient
+        from api.ingest import append_frames
+        from api.models import Dataset
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+        settings.ALLOWED_HOSTS = ['testserver']
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = np.random.default_rng(42)
+        print_section(f"Payload and latency of sparse fieldsets, {rows:,} rows ({connection.vendor})")
+        print(f"   {'endpoint':>16} {'backend':>9} {'fields':>13} {'payload KB':>11} {'ms':>8}")
+        for backend in ('database', 'columnar'):
+            dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=backend)
+            append_frames(dataset, validated_frames(
+                sample_frame(rng, start, min(50_000, rows - start)) for start in range(0, rows, 50_000)
+            ))
+            endpoints = [
+                ('records page', f'/api/datasets/{dataset.id}/records/?page_size={page_size}&', ''),
+                ('detail', f'/api/datasets/{dataset.id}/?', 'records.'),
+            ]
+            for endpoint, url, prefix in endpoints:
+                for label, query in PROJECTIONS:
+                    if prefix and query:
+                        name, _, value = query.partition('=')
+                        query = f"{name}={','.join(prefix + field for field in value.split(','))}"
+                    best = float('inf')
+                    for _ in range(repeat if endpoint != 'detail' else 1):
+                        start = time.perf_counter()
+                        response = client.get(url + query)
+                        body = response.content
+                        best = min(best, time.perf_counter() - start)
+                    assert response.status_code == 200, body[:200]
+                    print(f"   {endpoint:>16} {backend:>9} {label:>13} {len(body) / 1024:>11,.0f} {best * 1000:>8.0f}")
+            dataset.delete()
+
+
+def bench_serialize(rows_list):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_serialize.sqlite3'))
+        import json
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from rest_framework.renderers import JSONRenderer
+        from api.ingest import append_frames
+        from api.models import Dataset, EquipmentRecord
+        from api.renderers import FastJSONRenderer, orjson
+        from api.serializers import EquipmentRecordSerializer
+        from api.storage import get_store, records_from_frame, records_from_rows
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+
+        def model_serializer(dataset, store):
+            records = EquipmentRecord.objects.filter(dataset_id=dataset.id).order_by('id')
+            return JSONRenderer().render(EquipmentRecordSerializer(records, many=True).data)
+
+        def frame_to_dict(dataset, store):
+            return JSONRenderer().render(records_from_frame(store.read_frame(dataset)))
+
+        def fast_path(dataset, store):
+            return FastJSONRenderer().render(records_from_rows(store.read_rows(dataset)))
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        rng = np.random.default_rng(42)
+        print_section(f"Serializing all records of a dataset ({connection.vendor}, "
+                      f"{'orjson' if orjson else 'json'})")
+        print(f"   {'rows':>10} {'backend':>9} {'ModelSerializer s':>18} {'to_dict s':>10} {'fast path s':>12} {'speedup':>8}")
+        for rows in rows_list:
+            for backend in ('database', 'columnar'):
+                dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=backend)
+                append_frames(dataset, validated_frames(
+                    sample_frame(rng, start, min(50_000, rows - start)) for start in range(0, rows, 50_000)
+                ))
+                store = get_store(dataset)
+                timings = {}
+                outputs = {}
+                methods = [frame_to_dict, fast_path]
+                if backend == 'database':
+                    methods.insert(0, model_serializer)
+                for method in methods:
+                    start = time.perf_counter()
+                    outputs[method.__name__] = method(dataset, store)
+                    timings[method.__name__] = time.perf_counter() - start
+                # Same records, same field names, whatever the path
+                expected = json.loads(outputs['frame_to_dict'])
+                assert all(json.loads(body) == expected for body in outputs.values())
+                baseline = timings.get('model_serializer', timings['frame_to_dict'])
+                model = f"{timings['model_serializer']:.2f}" if 'model_serializer' in timings else '-'
+                print(f"   {rows:>10,} {backend:>9} {model:>18} {timings['frame_to_dict']:>10.2f} "
+                      f"{timings['fast_path']:>12.2f} {baseline / timings['fast_path']:>7.1f}x")
+                del outputs
+                dataset.delete()
+
+
+RESPONSE_FORMATS = [
+    ('json', 'application/json'),
+    ('columnar', 'application/vnd.equipment.columnar+json'),
+    ('msgpack', 'application/msgpack'),
+    ('arrow', 'application/vnd.apache.arrow.stream'),
+]
+
+
+def decode_columns(name, body):
+    """Records of a detail response as {field: NumPy array}, as a client would decode them"""
+    import json
+    if name == 'json':
+        records = json.loads(body)['records']
+        return {field: np.array([record[field] for record in records]) for field in records[0]}
+    if name == 'columnar':
+        return {field: np.asarray(values) for field, values in json.loads(body)['records'].items()}
+    if name == 'msgpack':
+        import msgpack
+        return {field: np.asarray(values) for field, values in msgpack.unpackb(body)['records'].items()}
+    import pyarrow as pa
+    table = pa.ipc.open_stream(body).read_all()
+    return {field: table.column(field).to_numpy() for field in table.column_names}
+
+
+def bench_formats(rows_list):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_formats.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from rest_framework.test import APIClient
+        from api.ingest import append_frames
+        from api.models import Dataset
+        from api.renderers import RECORD_RENDERER_CLASSES
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+        settings.ALLOWED_HOSTS = ['testserver']
+
+        offered = {renderer.media_type for renderer in RECORD_RENDERER_CLASSES}
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = np.random.default_rng(42)
+        print_section(f"Dataset detail by response format ({connection.vendor})")
+        print(f"   {'rows':>10} {'backend':>9} {'format':>9} {'payload MB':>11} {'server s':>9} {'client decode s':>16}")
+        for rows in rows_list:
+            for backend in ('database', 'columnar'):
+                dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=backend)
+                append_frames(dataset, validated_frames(
+                    sample_frame(rng, start, min(50_000, rows - start)) for start in range(0, rows, 50_000)
+                ))
+                for name, media_type in RESPONSE_FORMATS:
+                    if media_type not in offered:
+                        print(f"   {rows:>10,} {backend:>9} {name:>9}   (not installed)")
+                        continue
+                    start = time.perf_counter()
+                    response = client.get(f'/api/datasets/{dataset.id}/', HTTP_ACCEPT=media_type)
+                    body = response.content
+                    server = time.perf_counter() - start
+                    assert response.status_code == 200, body[:200]
+                    start = time.perf_counter()
+                    columns = decode_columns(name, body)
+                    decode = time.perf_counter() - start
+                    assert len(columns['flowrate']) == rows
+                    print(f"   {rows:>10,} {backend:>9} {name:>9} {len(body) / 1e6:>11.1f} "
+                          f"{server:>9.2f} {decode:>16.3f}")
+                dataset.delete()
+
+
+def bench_conditional(rows, repeat=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_conditional.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from rest_framework.test import APIClient
+        from api.ingest import append_frames
+        from api.models import Dataset
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+        settings.ALLOWED_HOSTS = ['testserver']
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = np.random.default_rng(42)
+        print_section(f"Full response vs 304 Not Modified, {rows:,} rows ({connection.vendor})")
+        print(f"   {'endpoint':>10} {'backend':>9} {'200 ms':>9} {'200 KB':>9} {'304 ms':>8}")
+        for backend in ('database', 'columnar'):
+            dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=backend)
+            append_frames(dataset, validated_frames(
+                sample_frame(rng, start, min(50_000, rows - start)) for start in range(0, rows, 50_000)
+            ))
+            for endpoint, url in [('list', '/api/datasets/'), ('detail', f'/api/datasets/{dataset.id}/'),
+                                  ('report', f'/api/datasets/{dataset.id}/report/')]:
+                start = time.perf_counter()
+                response = client.get(url)
+                full = time.perf_counter() - start
+                assert response.status_code == 200
+                best = float('inf')
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    cached = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                    best = min(best, time.perf_counter() - start)
+                    assert cached.status_code == 304
+                print(f"   {endpoint:>10} {backend:>9} {full * 1000:>9.0f} {len(response.content) / 1024:>9,.0f} "
+                      f"{best * 1000:>8.1f}")
+            dataset.delete()
+
+
+def bench_aggregate(rows_list, repeat=3):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_aggregate.sqlite3'))
+        import json
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from rest_framework.test import APIClient
+        from api.ingest import append_frames
+        from api.models import Dataset
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+        settings.ALLOWED_HOSTS = ['testserver']
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = np.random.default_rng(42)
+        print_section(f"Per-type aggregates: aggregate endpoint vs download + pandas ({connection.vendor})")
+        print(f"   {'rows':>10} {'backend':>9} {'aggregate ms':>13} {'bytes':>7} {'download s':>11} {'MB':>7}")
+        for rows in rows_list:
+            for backend in ('database', 'columnar'):
+                dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=backend)
+                append_frames(dataset, validated_frames(
+                    sample_frame(rng, start, min(50_000, rows - start)) for start in range(0, rows, 50_000)
+                ))
+                url = f'/api/datasets/{dataset.id}/aggregate/?group_by=equipment_type'
+                best = float('inf')
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    best = min(best, time.perf_counter() - start)
+                assert response.status_code == 200
+                # What a client had to do before: fetch every record and group locally
+                start = time.perf_counter()
+                detail = client.get(f'/api/datasets/{dataset.id}/')
+                frame = pd.DataFrame(json.loads(detail.content)['records'])
+                frame.groupby('equipment_type')[['flowrate', 'pressure', 'temperature']].agg(
+                    ['count', 'mean', 'min', 'max', 'std', 'sum'])
+                download = time.perf_counter() - start
+                print(f"   {rows:>10,} {backend:>9} {best * 1000:>13.0f} {len(response.content):>7,} "
+                      f"{download:>11.2f} {len(detail.content) / 1e6:>7.1f}")
+                dataset.delete()
+
+
+def bench_filter(rows_list, repeat=3):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_filter.sqlite3'))
+        import json
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from rest_framework.test import APIClient
+        from api.ingest import append_frames
+        from api.models import Dataset, EquipmentRecord
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+        settings.ALLOWED_HOSTS = ['testserver']
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = np.random.default_rng(42)
+        filter_indexes = [index for index in EquipmentRecord._meta.indexes if index.fields != ['dataset', 'id']]
+        queries = [
+            ('type=Pump', 'equipment_type=Pump'),
+            ('pressure>9', 'pressure__gt=9'),
+            ('by -temperature', 'ordering=-temperature'),
+            ('all three', 'equipment_type=Pump&pressure__gt=9&ordering=-temperature'),
+        ]
+
+        def page_ms(dataset, params):
+            """Best time of the first 200-record page and of the page after it"""
+            times = []
+            url = f'/api/datasets/{dataset.id}/records/?{params}&page_size=200'
+            for _ in range(2):
+                best = float('inf')
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    best = min(best, time.perf_counter() - start)
+                assert response.status_code == 200, response.content
+                times.append(best * 1000)
+                url = json.loads(response.content)['next']
+            return times
+
+        print_section(f"Filtered, ordered record pages: ms for pages 1 / 2 ({connection.vendor})")
+        for rows in rows_list:
+            datasets = {}
+            for backend in ('database', 'columnar'):
+                datasets[backend] = Dataset.objects.create(user=user, filename='bench.csv', storage=backend)
+                append_frames(datasets[backend], validated_frames(
+                    sample_frame(rng, start, min(50_000, rows - start)) for start in range(0, rows, 50_000)
+                ))
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            results = {label: [page_ms(datasets['database'], params)] for label, params in queries}
+            with connection.schema_editor() as editor:
+                for index in filter_indexes:
+                    editor.remove_index(EquipmentRecord, index)
+            for label, params in queries:
+                results[label].append(page_ms(datasets['database'], params))
+            with connection.schema_editor() as editor:
+                for index in filter_indexes:
+                    editor.add_index(EquipmentRecord, index)
+            for label, params in queries:
+                results[label].append(page_ms(datasets['columnar'], params))
+
+            print(f"   {rows:,} rows")
+            print(f"   {'query':>17} {'indexed':>13} {'no indexes':>13} {'columnar':>13}")
+            for label, _ in queries:
+                cells = ' '.join(f"{f'{first:.0f} / {second:.0f}':>13}" for first, second in results[label])
+                print(f"   {label:>17} {cells}")
+
+            # What a client had to do before: fetch every record and filter locally
+            start = time.perf_counter()
+            detail = client.get(f"/api/datasets/{datasets['database'].id}/")
+            frame = pd.DataFrame(json.loads(detail.content)['records'])
+            frame = frame[(frame['equipment_type'] == 'Pump') & (frame['pressure'] > 9)]
+            frame.sort_values('temperature', ascending=False)
+            print(f"   {'download + pandas':>17} {(time.perf_counter() - start) * 1000:>13.0f}  (all three)")
+            for dataset in datasets.values():
+                dataset.delete()
+
+
+def bench_histogram(rows_list):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_histogram.sqlite3'))
+        import json
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from django.db import connection
+        from rest_framework.test import APIClient
+        from api.ingest import append_frames
+        from api.models import Dataset
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+        settings.ALLOWED_HOSTS = ['testserver']
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = np.random.default_rng(42)
+        charts = [
+            ('flowrate by type', {'x': 'flowrate', 'group_by': 'equipment_type'}),
+            ('pressure x temp', {'x': 'pressure', 'y': 'temperature'}),
+        ]
+        print_section(f"Chart data: histogram endpoint vs download + NumPy ({connection.vendor})")
+        print(f"   {'rows':>10} {'backend':>9} {'chart':>17} {'cold ms':>8} {'cached ms':>10} {'bytes':>7}")
+        for rows in rows_list:
+            for backend in ('database', 'columnar'):
+                dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=backend)
+                append_frames(dataset, validated_frames(
+                    sample_frame(rng, start, min(50_000, rows - start)) for start in range(0, rows, 50_000)
+                ))
+                for label, params in charts:
+                    cache.clear()
+                    url = f'/api/datasets/{dataset.id}/histogram/'
+                    start = time.perf_counter()
+                    response = client.get(url, params)
+                    cold = time.perf_counter() - start
+                    start = time.perf_counter()
+                    client.get(url, params)
+                    cached = time.perf_counter() - start
+                    assert response.status_code == 200, response.content
+                    print(f"   {rows:>10,} {backend:>9} {label:>17} {cold * 1000:>8.0f} {cached * 1000:>10.1f} "
+                          f"{len(response.content):>7,}")
+                if backend == 'database':
+                    # What a chart had to do before: fetch every record and bin locally
+                    start = time.perf_counter()
+                    detail = client.get(f'/api/datasets/{dataset.id}/')
+                    records = json.loads(detail.content)['records']
+                    np.histogram2d([r['pressure'] for r in records], [r['temperature'] for r in records], bins=40)
+                    print(f"   {rows:>10,} {'download + NumPy':>27} {(time.perf_counter() - start) * 1000:>8.0f} "
+                          f"{'':>10} {len(detail.content):>7,}")
+                dataset.delete()
+
+
+def bench_downsample(rows_list, points=1000):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_downsample.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from django.db import connection
+        from rest_framework.test import APIClient
+        from api.ingest import append_frames
+        from api.models import Dataset
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+        settings.ALLOWED_HOSTS = ['testserver']
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = np.random.default_rng(42)
+        print_section(f"Flowrate trend: {points} downsampled points vs every record ({connection.vendor})")
+        print(f"   {'rows':>10} {'backend':>9} {'method':>7} {'cold ms':>8} {'cached ms':>10} {'bytes':>7} "
+              f"{'records MB':>11}")
+        for rows in rows_list:
+            for backend in ('database', 'columnar'):
+                dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=backend)
+                append_frames(dataset, validated_frames(
+                    sample_frame(rng, start, min(50_000, rows - start)) for start in range(0, rows, 50_000)
+                ))
+                # The flowrate column alone, as the chart used to download it
+                full = client.get(f'/api/datasets/{dataset.id}/', {'fields': 'records.flowrate'})
+                for method in ('lttb', 'minmax'):
+                    cache.clear()
+                    params = {'fields': 'flowrate', 'points': points, 'method': method}
+                    url = f'/api/datasets/{dataset.id}/downsample/'
+                    start = time.perf_counter()
+                    response = client.get(url, params)
+                    cold = time.perf_counter() - start
+                    start = time.perf_counter()
+                    client.get(url, params)
+                    cached = time.perf_counter() - start
+                    assert response.status_code == 200, response.content
+                    print(f"   {rows:>10,} {backend:>9} {method:>7} {cold * 1000:>8.0f} {cached * 1000:>10.1f} "
+                          f"{len(response.content):>7,} {len(full.content) / 1e6:>11.1f}")
+                dataset.delete()
+
+
+def bench_compare(rows_list):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_compare.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from django.db import connection
+        from rest_framework.test import APIClient
+        from api.ingest import append_frames
+        from api.models import Dataset
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+        settings.ALLOWED_HOSTS = ['testserver']
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = np.random.default_rng(42)
+
+        def load(storage, rows, first_unit):
+            dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=storage)
+            append_frames(dataset, validated_frames(
+                sample_frame(rng, first_unit + start, min(50_000, rows - start)) for start in range(0, rows, 50_000)
+            ))
+            return dataset
+
+        print_section(f"Dataset comparison, 90% of names shared ({connection.vendor})")
+        print(f"   {'rows/side':>10} {'storage':>9} {'first page ms':>14} {'next page ms':>13} {'matched':>10}")
+        for rows in rows_list:
+            for storage in ('database', 'columnar'):
+                # b drops the first tenth of a's units and adds as many new ones
+                a, b = load(storage, rows, 0), load(storage, rows, rows // 10)
+                cache.clear()
+                url = '/api/datasets/compare/'
+                start = time.perf_counter()
+                response = client.get(url, {'a': a.id, 'b': b.id, 'page_size': 200})
+                first = time.perf_counter() - start
+                assert response.status_code == 200, response.content
+                start = time.perf_counter()
+                client.get(response.json()['equipment']['next'])
+                second = time.perf_counter() - start
+                print(f"   {rows:>10,} {storage:>9} {first * 1000:>14.0f} {second * 1000:>13.0f} "
+                      f"{response.json()['equipment']['matched']:>10,}")
+                a.delete()
+                b.delete()
+
+
+def bench_trends(uploads, rows_list):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_trends.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from rest_framework.test import APIClient
+        from api.ingest import append_frames
+        from api.models import Dataset
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+        settings.ALLOWED_HOSTS = ['testserver']
+
+        client = APIClient()
+        rng = np.random.default_rng(42)
+        print_section(f"Upload trends over {uploads} uploads ({connection.vendor})")
+        print(f"   {'rows/upload':>12} {'trends ms':>10} {'by type ms':>11} {'detail calls ms':>16}")
+        for rows in rows_list:
+            user = User.objects.create(username=f'benchmark-{rows}')
+            client.force_authenticate(user)
+            datasets = []
+            for _ in range(uploads):
+                dataset = Dataset.objects.create(user=user, filename='bench.csv', storage='database')
+                append_frames(dataset, validated_frames([sample_frame(rng, 0, rows)]))
+                datasets.append(dataset)
+
+            # The first request of the process pays for one-off setup
+            client.get('/api/datasets/trends/')
+            timings = []
+            for params in ({}, {'by_type': 'true'}):
+                start = time.perf_counter()
+                response = client.get('/api/datasets/trends/', params)
+                timings.append(time.perf_counter() - start)
+                assert response.status_code == 200 and len(response.json()['series']) == uploads
+            # What a client does without the endpoint: one detail call per upload
+            start = time.perf_counter()
+            for dataset in datasets:
+                client.get(f'/api/datasets/{dataset.id}/')
+            details = time.perf_counter() - start
+            print(f"   {rows:>12,} {timings[0] * 1000:>10.1f} {timings[1] * 1000:>11.1f} {details * 1000:>16.0f}")
+
+
+def bench_datasets(counts, page_size=100):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_datasets.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from rest_framework.test import APIClient
+        from api.ingest import append_frames
+        from api.models import Dataset
+        from api.serializers import DatasetSummarySerializer
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+        settings.ALLOWED_HOSTS = ['testserver']
+
+        # Every listed dataset carries the statistics of a real upload
+        rng = np.random.default_rng(42)
+        template = Dataset.objects.create(user=User.objects.create(username='template'), filename='t.csv')
+        append_frames(template, validated_frames([sample_frame(rng, 0, 1_000)]))
+        template.refresh_from_db()
+        copied = {name: getattr(template, name) for name in (
+            'total_count', 'avg_flowrate', 'avg_pressure', 'avg_temperature', 'equipment_types', 'statistics')}
+
+        def create(user, n):
+            Dataset.objects.bulk_create(
+                [Dataset(user=user, filename=f'{i}.csv', **copied) for i in range(n)], batch_size=1_000)
+
+        # Other users' datasets around the listed ones
+        for i in range(100):
+            create(User.objects.create(username=f'other-{i}'), 200)
+
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        client = APIClient()
+        client.get('/api/datasets/')
+        print_section(f"Dataset listing, full and keyset pages of {page_size} ({connection.vendor})")
+        print(f"   {'datasets':>9} {'listing':>18} {'first page':>14} {'last page':>14} {'no select_related':>22}")
+        for count in counts:
+            user = User.objects.create(username=f'benchmark-{count}')
+            create(user, count)
+            client.force_authenticate(user)
+
+            def timed(path, params=None):
+                queries.clear()
+                with connection.execute_wrapper(count_query):
+                    start = time.perf_counter()
+                    response = client.get(path, params)
+                    elapsed = time.perf_counter() - start
+                assert response.status_code == 200, response.content
+                return response.json(), elapsed, len(queries)
+
+            full, full_time, full_queries = timed('/api/datasets/')
+            assert len(full) == count
+            page, first_time, first_queries = timed('/api/datasets/', {'page_size': page_size})
+            # Walk to the last page; its cost should not grow with its depth
+            while page['next']:
+                page, last_time, last_queries = timed(page['next'])
+            # The username lookup without the join: one user query per dataset
+            queries.clear()
+            with connection.execute_wrapper(count_query):
+                start = time.perf_counter()
+                DatasetSummarySerializer(Dataset.objects.filter(user=user), many=True).data
+                naive_time = time.perf_counter() - start
+            print(f"   {count:>9,} {full_time * 1000:>9.0f} ms {full_queries:>2} q "
+                  f"{first_time * 1000:>5.1f} ms {first_queries:>2} q {last_time * 1000:>5.1f} ms {last_queries:>2} q "
+                  f"{naive_time * 1000:>10.0f} ms {len(queries):>6} q")
+
+
+def _search_ingest_overhead(rows):
+    """Ingest time of one dataset with and without search indexing, in the current benchmark database"""
+    from django.contrib.auth.models import User
+    from api import storage
+    from api.ingest import append_frames
+    from api.models import Dataset
+    from api.validation import validated_frames
+
+    # A user of its own, so these datasets stay out of the search timings
+    user, _ = User.objects.get_or_create(username='benchmark-ingest')
+    rng = np.random.default_rng(7)
+    frames = [sample_frame(rng, start, min(50_000, rows - start)) for start in range(0, rows, 50_000)]
+    print_section(f"Ingest of {rows:,} records with and without search indexing")
+    for storage_name in ('database', 'columnar'):
+        timings = {}
+        for indexed in (False, True):
+            saved = storage.index_database_records, storage.index_frame
+            if not indexed:
+                storage.index_database_records = storage.index_frame = lambda *args, **kwargs: None
+            try:
+                dataset = Dataset.objects.create(user=user, filename='bench.csv', storage=storage_name)
+                start = time.perf_counter()
+                append_frames(dataset, validated_frames(frame.copy() for frame in frames))
+                timings[indexed] = time.perf_counter() - start
+            finally:
+                storage.index_database_records, storage.index_frame = saved
+        print(f"   {storage_name:>9}: {timings[False]:.1f} s without, {timings[True]:.1f} s with the index")
+
+
+def bench_search(rows_list, dataset_rows=1_000_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench_search.sqlite3'))
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from django.db.models import Q
+        from rest_framework.test import APIClient
+        from api.ingest import append_frames
+        from api.models import Dataset, EquipmentRecord
+        from api.validation import validated_frames
+        settings.MEDIA_ROOT = tmp
+        settings.ALLOWED_HOSTS = ['testserver']
+        _search_ingest_overhead(min(rows_list))
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = np.random.default_rng(42)
+        queries = ['Unit 4242421', 'Unit 42424', 'Unit 424', 'Unit', 'Reactor']
+        loaded = 0
+        print_section(f"Equipment search, indexed vs icontains scan ({connection.vendor})")
+        for rows in rows_list:
+            # Datasets of up to dataset_rows records each, half of them columnar
+            start = time.perf_counter()
+            while loaded < rows:
+                n = min(dataset_rows, rows - loaded)
+                storage = 'database' if loaded // dataset_rows % 2 == 0 else 'columnar'
+                dataset = Dataset.objects.create(user=user, filename=f'part{loaded}.csv', storage=storage)
+                append_frames(dataset, validated_frames(
+                    sample_frame(rng, loaded + first, min(50_000, n - first)) for first in range(0, n, 50_000)
+                ))
+                loaded += n
+            print(f"   {rows:,} records (loaded in {time.perf_counter() - start:.0f} s)")
+            print(f"   {'query':>16} {'search ms':>10} {'matches':>8} {'icontains scan ms':>18}")
+            client.get('/api/datasets/search/', {'q': 'warm up'})
+            for q in queries:
+                start = time.perf_counter()
+                response = client.get('/api/datasets/search/', {'q': q, 'limit': 20})
+                indexed = time.perf_counter() - start
+                assert response.status_code == 200, response.content
+                # The table scan the admin did before, over database-stored records only
+                start = time.perf_counter()
+                list(EquipmentRecord.objects.filter(dataset__user=user).filter(
+                    Q(equipment_name__icontains=q) | Q(equipment_type__icontains=q))[:20])
+                scan = time.perf_counter() - start
+                print(f"   {q:>16} {indexed * 1000:>10.1f} {len(response.json()['results']):>8} {scan * 1000:>18.1f}")
+
+
+def main():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    ingest = sub.add_parser('ingest', help='Peak memory and time of streaming CSV ingest')
+    ingest.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+
+    bulkload = sub.add_parser('bulkload', help='Rows/sec of each record load path')
+    bulkload.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    bulkload.add_argument('--batch-sizes', type=int, nargs='+', default=[1_000, 10_000, 50_000])
+
+    batch = sub.add_parser('batch', help='Scaling of batch-upload parsing with worker processes')
+    batch.add_argument('--files', type=int, default=64)
+    batch.add_argument('--rows', type=int, default=50_000)
+    cores = os.cpu_count() or 1
+    batch.add_argument('--workers', type=int, nargs='+',
+                       default=sorted({1, cores} | {n for n in (2, 4, 8, 16, 32) if n < cores}))
+
+    storage = sub.add_parser('storage', help='Disk footprint and read latency of each record store')
+    storage.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+
+    append = sub.add_parser('append', help='Latency of appending rows to datasets of growing size')
+    append.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000, 5_000_000])
+    append.add_argument('--append-rows', type=int, default=1_000)
+
+    parse = sub.add_parser('parse', help='CSV parse time of each engine on a wide export')
+    parse.add_argument('--rows', type=int, default=1_000_000)
+    parse.add_argument('--extra-columns', type=int, default=40)
+
+    records = sub.add_parser('records', help='Latency of record pages at the start, middle and end of a dataset')
+    records.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    records.add_argument('--page-size', type=int, default=1_000)
+
+    projection = sub.add_parser('projection', help='Payload size and latency of ?fields= / ?exclude= projections')
+    projection.add_argument('--rows', type=int, default=100_000)
+    projection.add_argument('--page-size', type=int, default=10_000)
+
+    serialize = sub.add_parser('serialize', help='Time to serialize every record of a dataset, per code path')
+    serialize.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+
+    formats = sub.add_parser('formats', help='Payload size, server time and client decode time of each response format')
+    formats.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+
+    conditional = sub.add_parser('conditional', help='Latency of full responses against 304 revalidations')
+    conditional.add_argument('--rows', type=int, default=20_000)
+
+    aggregate = sub.add_parser('aggregate', help='Latency of the aggregate endpoint against grouping downloaded records')
+    aggregate.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+
+    filtering = sub.add_parser('filter', help='Latency of filtered, ordered record pages with and without the indexes')
+    filtering.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+
+    histogram = sub.add_parser('histogram', help='Latency and size of histogram responses, cold and cached')
+    histogram.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+
+    downsample = sub.add_parser('downsample', help='Latency and size of downsampled trend lines, cold and cached')
+    downsample.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    downsample.add_argument('--points', type=int, default=1000)
+
+    compare = sub.add_parser('compare', help='Latency of comparing two datasets, first and next page')
+    compare.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+
+    trends = sub.add_parser('trends', help='Latency of the upload trend series against per-dataset detail calls')
+    trends.add_argument('--uploads', type=int, default=50)
+    trends.add_argument('--rows', type=int, nargs='+', default=[1_000, 20_000], help='Records per upload')
+
+    search = sub.add_parser('search', help='Latency of equipment search against an icontains scan')
+    search.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000],
+                        help='Total records across datasets; each size adds to the previous')
+
+    datasets = sub.add_parser('datasets', help='Latency and query count of the dataset listing, full and paged')
+    datasets.add_argument('--datasets', type=int, nargs='+', default=[1_000, 10_000])
+    datasets.add_argument('--page-size', type=int, default=100)
+
+    child = sub.add_parser('_ingest-child')
+    child.add_argument('csv_path')
+    child.add_argument('db_path')
+
+    args = parser.parse_args()
+    if args.command == 'ingest':
+        bench_ingest(args.rows)
+    elif args.command == 'bulkload':
+        bench_bulkload(args.rows, args.batch_sizes)
+    elif args.command == 'batch':
+        bench_batch(args.files, args.rows, args.workers)
+    elif args.command == 'storage':
+        bench_storage(args.rows)
+    elif args.command == 'append':
+        bench_append(args.rows, args.append_rows)
+    elif args.command == 'parse':
+        bench_parse(args.rows, args.extra_columns)
+    elif args.command == 'records':
+        bench_records(args.rows, args.page_size)
+    elif args.command == 'projection':
+        bench_projection(args.rows, args.page_size)
+    elif args.command == 'serialize':
+        bench_serialize(args.rows)
+    elif args.command == 'formats':
+        bench_formats(args.rows)
+    elif args.command == 'conditional':
+        bench_conditional(args.rows)
+    elif args.command == 'aggregate':
+        bench_aggregate(args.rows)
+    elif args.command == 'filter':
+        bench_filter(args.rows)
+    elif args.command == 'histogram':
+        bench_histogram(args.rows)
+    elif args.command == 'downsample':
+        bench_downsample(args.rows, args.points)
+    elif args.command == 'compare':
+        bench_compare(args.rows)
+    elif args.command == 'trends':
+        bench_trends(args.uploads, args.rows)
+    elif args.command == 'search':
+        bench_search(args.rows)
+    elif args.command == 'datasets':
+        bench_datasets(args.datasets, args.page_size)
+    elif args.command == '_ingest-child':
+        run_ingest(args.csv_path, args.db_path)
+
+
+if __name__ == "__main__":
+    main()
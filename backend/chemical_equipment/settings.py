@@ -4,6 +4,7 @@ Django settings for chemical_equipment project.
 
 from pathlib import Path
 from datetime import timedelta
+import json
 import os
 import dj_database_url
 
@@ -118,6 +119,78 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# CSV ingestion
+# Uploads are streamed in chunks of this many rows to keep memory flat
+INGEST_CHUNK_SIZE = int(os.environ.get('INGEST_CHUNK_SIZE', '50000'))
+# CSV parser: 'pyarrow' (multithreaded, needs the optional pyarrow package),
+# pandas' 'c' engine, or 'auto' (pyarrow when installed, else 'c')
+CSV_PARSE_ENGINE = os.environ.get('CSV_PARSE_ENGINE', 'auto')
+# Row validation (see api/validation.py): 'strict' rejects a file with any
+# invalid row, 'lenient' drops invalid rows. Uploads may override it.
+INGEST_VALIDATION_MODE = os.environ.get('INGEST_VALIDATION_MODE', 'strict')
+# Allowed ranges per equipment type, '*' for all types; null leaves a side open, e.g.
+# {"*": {"Pressure": [0, null]}, "Pump": {"Flowrate": [0, 500]}}
+INGEST_VALUE_BOUNDS = json.loads(os.environ.get('INGEST_VALUE_BOUNDS', '{}'))
+# Invalid values listed individually in a validation report
+INGEST_MAX_REPORTED_ERRORS = int(os.environ.get('INGEST_MAX_REPORTED_ERRORS', '100'))
+# Threads per web process that run ingest jobs; 0 runs jobs inline in the request.
+# Jobs can also be processed by `python manage.py run_ingest_worker`.
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', '2'))
+# Minutes without progress after which a running job is taken to have lost its worker and failed
+INGEST_JOB_TIMEOUT_MINUTES = int(os.environ.get('INGEST_JOB_TIMEOUT_MINUTES', '60'))
+# Batch uploads: processes parsing archive members, and the most CSVs per batch
+BATCH_PARSE_WORKERS = int(os.environ.get('BATCH_PARSE_WORKERS', os.cpu_count() or 1))
+BATCH_UPLOAD_MAX_FILES = int(os.environ.get('BATCH_UPLOAD_MAX_FILES', '500'))
+# Archive limits against zip bombs: entries of any kind per archive, uncompressed
+# bytes per CSV and uncompressed bytes per batch
+BATCH_UPLOAD_MAX_ENTRIES = int(os.environ.get('BATCH_UPLOAD_MAX_ENTRIES', '10000'))
+BATCH_UPLOAD_MAX_FILE_BYTES = int(os.environ.get('BATCH_UPLOAD_MAX_FILE_BYTES', str(512 * 1024 * 1024)))
+BATCH_UPLOAD_MAX_TOTAL_BYTES = int(os.environ.get('BATCH_UPLOAD_MAX_TOTAL_BYTES', str(2 * 1024 * 1024 * 1024)))
+# Where new datasets keep their records: 'database' (EquipmentRecord rows)
+# or 'columnar' (packed NumPy column files under MEDIA_ROOT/columnar/)
+RECORD_STORAGE_BACKEND = os.environ.get('RECORD_STORAGE_BACKEND', 'database')
+# Rows per executemany()/bulk_create() batch when COPY is not available
+BULK_LOAD_BATCH_SIZE = int(os.environ.get('BULK_LOAD_BATCH_SIZE', '10000'))
+
+# Records endpoint: default and largest page size
+RECORDS_PAGE_SIZE = int(os.environ.get('RECORDS_PAGE_SIZE', '1000'))
+RECORDS_MAX_PAGE_SIZE = int(os.environ.get('RECORDS_MAX_PAGE_SIZE', '10000'))
+
+# Dataset listing: default and largest keyset page size (pages are opt-in)
+DATASETS_PAGE_SIZE = int(os.environ.get('DATASETS_PAGE_SIZE', '100'))
+DATASETS_MAX_PAGE_SIZE = int(os.environ.get('DATASETS_MAX_PAGE_SIZE', '1000'))
+
+# Search endpoint (see api/search.py): most results a client may ask for
+SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', '200'))
+
+# Chart data (see api/histogram.py, api/downsample.py): most histogram bins
+# per axis and downsampled points per series a client may ask for, and
+# seconds a computed result stays cached
+HISTOGRAM_MAX_BINS = int(os.environ.get('HISTOGRAM_MAX_BINS', '1000'))
+DOWNSAMPLE_MAX_POINTS = int(os.environ.get('DOWNSAMPLE_MAX_POINTS', '10000'))
+CHART_CACHE_TIMEOUT = int(os.environ.get('CHART_CACHE_TIMEOUT', '86400'))
+
+# Cache for computed chart data. Per process by default; point it at a
+# shared cache (e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache,
+# CACHE_LOCATION=redis://...) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Dataset retention (see api/retention.py); 0 disables a limit.
+# Users may have their own RetentionPolicy overriding these.
+RETENTION_MAX_DATASETS = int(os.environ.get('RETENTION_MAX_DATASETS', '5'))
+RETENTION_MAX_AGE_DAYS = int(os.environ.get('RETENTION_MAX_AGE_DAYS', '0'))
+RETENTION_MAX_ROWS = int(os.environ.get('RETENTION_MAX_ROWS', '0'))
+# Records deleted per statement when pruning
+RETENTION_DELETE_BATCH_SIZE = int(os.environ.get('RETENTION_DELETE_BATCH_SIZE', '10000'))
+# Prune in the background after each upload; when False only
+# `python manage.py prune_datasets` (e.g. from cron) removes datasets
+RETENTION_ON_UPLOAD = os.environ.get('RETENTION_ON_UPLOAD', 'True') == 'True'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -129,6 +202,11 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # JSON encoded with orjson when it is installed (see api/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 # JWT Settings
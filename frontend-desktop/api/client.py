@@ -1,6 +1,45 @@
+import json
+import os
+import time
+from collections import OrderedDict
+import numpy as np
 import requests
 from typing import Optional, Dict, List
 
+try:
+    import pyarrow as pa
+except ImportError:  # optional: records are fetched as columnar JSON instead
+    pa = None
+
+# Files larger than this are sent through a resumable upload session
+RESUMABLE_UPLOAD_THRESHOLD = 16 * 1024 * 1024
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024
+RESUMABLE_MAX_RETRIES = 5
+
+# Responses kept for If-None-Match revalidation, least recently used dropped first
+RESPONSE_CACHE_SIZE = 64
+
+# Record formats the server can send one array per column
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.equipment.columnar+json"
+
+
+def _decode_arrow(content: bytes, records_key: str) -> Dict:
+    """Response dict from an Arrow stream; the records become NumPy arrays"""
+    table = pa.ipc.open_stream(content).read_all()
+    result = json.loads(table.schema.metadata[b"json"])
+    if table.num_columns:
+        result[records_key] = {name: table.column(name).to_numpy() for name in table.column_names}
+    return result
+
+
+def _decode_columnar_json(content: bytes, records_key: str) -> Dict:
+    """Response dict from columnar JSON; the records become NumPy arrays"""
+    result = json.loads(content)
+    if records_key in result:
+        result[records_key] = {name: np.asarray(values) for name, values in result[records_key].items()}
+    return result
+
 
 class APIClient:
     def __init__(self, base_url: str = "http://localhost:8000/api"):
@@ -8,6 +47,13 @@ class APIClient:
         self.access_token: Optional[str] = None
         self.refresh_token: Optional[str] = None
         self.user: Optional[Dict] = None
+        # Arrow when pyarrow is installed; dropped if the server cannot send it
+        self.record_formats = [COLUMNAR_JSON_MEDIA_TYPE]
+        if pa is not None:
+            self.record_formats.insert(0, ARROW_MEDIA_TYPE)
+        # (url, params, Accept) -> (ETag, decoded body), revalidated with If-None-Match;
+        # record payloads are never kept, only the small summaries around them
+        self._response_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
     
     def _get_headers(self) -> Dict[str, str]:
         headers = {"Content-Type": "application/json"}
@@ -57,33 +103,203 @@ class APIClient:
         response.raise_for_status()
         return response.json()
     
-    def upload_csv(self, file_path: str) -> Dict:
-        """Upload CSV file"""
-        url = f"{self.base_url}/datasets/upload/"
-        headers = {}
+    def upload_csv(self, file_path: str, wait: bool = True) -> Dict:
+        """Upload CSV file; returns the ingest job, finished unless wait is False"""
+        if os.path.getsize(file_path) > RESUMABLE_UPLOAD_THRESHOLD:
+            job = self.upload_csv_resumable(file_path)
+        else:
+            url = f"{self.base_url}/datasets/upload/"
+            headers = {}
+            if self.access_token:
+                headers["Authorization"] = f"Bearer {self.access_token}"
+            
+            with open(file_path, 'rb') as f:
+                files = {'file': f}
+                response = requests.post(url, files=files, headers=headers)
+            
+            response.raise_for_status()
+            job = response.json()
+        if wait:
+            job = self.wait_for_job(job["id"])
+        return job
+    
+    def upload_csv_resumable(self, file_path: str,
+                             chunk_size: int = RESUMABLE_CHUNK_SIZE) -> Dict:
+        """Upload CSV file in byte ranges, resuming after dropped connections; returns the ingest job"""
+        url = f"{self.base_url}/datasets/upload/sessions/"
+        size = os.path.getsize(file_path)
+        data = {"filename": os.path.basename(file_path), "size": size}
+        response = requests.post(url, json=data, headers=self._get_headers())
+        response.raise_for_status()
+        session_url = f"{url}{response.json()['id']}/"
+        
+        headers = {"Content-Type": "application/octet-stream"}
         if self.access_token:
             headers["Authorization"] = f"Bearer {self.access_token}"
         
+        offset = 0
+        retries = 0
+        resync = False
         with open(file_path, 'rb') as f:
-            files = {'file': f}
-            response = requests.post(url, files=files, headers=headers)
+            while offset < size:
+                try:
+                    if resync:
+                        # Ask the server how much it actually received
+                        response = requests.get(session_url, headers=self._get_headers())
+                        response.raise_for_status()
+                        offset = response.json()["offset"]
+                        resync = False
+                        continue
+                    f.seek(offset)
+                    chunk = f.read(chunk_size)
+                    end = offset + len(chunk) - 1
+                    headers["Content-Range"] = f"bytes {offset}-{end}/{size}"
+                    response = requests.put(session_url, data=chunk, headers=headers)
+                    response.raise_for_status()
+                    offset = response.json()["offset"]
+                    retries = 0
+                except (requests.ConnectionError, requests.Timeout):
+                    retries += 1
+                    if retries > RESUMABLE_MAX_RETRIES:
+                        raise
+                    time.sleep(min(2 ** retries, 30))
+                    resync = True
         
+        response = requests.post(f"{session_url}complete/", headers=self._get_headers())
+        response.raise_for_status()
+        return response.json()
+    
+    def get_job(self, job_id: int) -> Dict:
+        """Get ingest job status"""
+        url = f"{self.base_url}/jobs/{job_id}/"
+        response = requests.get(url, headers=self._get_headers())
         response.raise_for_status()
         return response.json()
     
+    def wait_for_job(self, job_id: int, timeout: Optional[float] = None,
+                     poll_interval: float = 1.0) -> Dict:
+        """Poll an ingest job until it finishes; raises if it fails or times out"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            job = self.get_job(job_id)
+            if job["state"] == "succeeded":
+                return job
+            if job["state"] == "failed":
+                raise RuntimeError(job["error"] or "Ingest job failed")
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Ingest job {job_id} still {job['state']} after {timeout}s")
+            time.sleep(poll_interval)
+    
+    def _cached_get(self, url: str, headers: Dict[str, str], decode,
+                    params: Optional[Dict] = None):
+        """GET that reuses the cached decoded body when the server answers 304; returns (response, body)"""
+        key = (url, tuple(sorted((params or {}).items())), headers.get("Accept"))
+        cached = self._response_cache.get(key)
+        if cached is not None:
+            self._response_cache.move_to_end(key)
+            headers = dict(headers, **{"If-None-Match": cached[0]})
+        response = requests.get(url, headers=headers, params=params)
+        if response.status_code == 304 and cached is not None:
+            return response, cached[1]
+        if not response.ok:
+            return response, None
+        body = decode(response)
+        if response.headers.get("ETag"):
+            self._response_cache[key] = (response.headers["ETag"], body)
+            self._response_cache.move_to_end(key)
+            while len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+        return response, body
+    
     def get_datasets(self) -> List[Dict]:
         """Get all datasets"""
         url = f"{self.base_url}/datasets/"
-        response = requests.get(url, headers=self._get_headers())
+        response, datasets = self._cached_get(url, self._get_headers(), lambda r: r.json())
         response.raise_for_status()
-        return response.json()
+        return datasets
+    
+    def get_trends(self, fields: Optional[List[str]] = None, metrics: Optional[List[str]] = None,
+                   by_type: bool = False) -> Dict:
+        """Get the stored aggregates of every dataset, oldest upload first"""
+        url = f"{self.base_url}/datasets/trends/"
+        params = {}
+        if fields:
+            params["fields"] = ",".join(fields)
+        if metrics:
+            params["metrics"] = ",".join(metrics)
+        if by_type:
+            params["by_type"] = "true"
+        response, trends = self._cached_get(url, self._get_headers(), lambda r: r.json(), params)
+        response.raise_for_status()
+        return trends
     
     def get_dataset_detail(self, dataset_id: int) -> Dict:
         """Get dataset details"""
         url = f"{self.base_url}/datasets/{dataset_id}/"
-        response = requests.get(url, headers=self._get_headers())
+        response, dataset = self._cached_get(url, self._get_headers(), lambda r: r.json())
         response.raise_for_status()
-        return response.json()
+        return dataset
+    
+    def _get_columns(self, url: str, records_key: str, params: Optional[Dict] = None) -> Dict:
+        """GET a records response in the first columnar format the server accepts"""
+        while True:
+            media_type = self.record_formats[0]
+            headers = self._get_headers()
+            headers["Accept"] = media_type
+            if media_type == ARROW_MEDIA_TYPE:
+                decode = lambda r: _decode_arrow(r.content, records_key)
+            else:
+                decode = lambda r: _decode_columnar_json(r.content, records_key)
+            # Record arrays can be large, so they are fetched whole every time
+            response = requests.get(url, headers=headers, params=params)
+            if response.status_code == 406 and len(self.record_formats) > 1:
+                self.record_formats.pop(0)
+                continue
+            response.raise_for_status()
+            return decode(response)
+    
+    def get_dataset_columns(self, dataset_id: int) -> Dict:
+        """Get dataset details with 'records' as one NumPy array per field"""
+        url = f"{self.base_url}/datasets/{dataset_id}/"
+        return self._get_columns(url, "records")
+    
+    def get_record_page_columns(self, dataset_id: int, after: int = 0,
+                                page_size: Optional[int] = None,
+                                fields: Optional[List[str]] = None) -> Dict:
+        """Get one page of records with 'results' as one NumPy array per field"""
+        url = f"{self.base_url}/datasets/{dataset_id}/records/"
+        params = {"after": after}
+        if page_size:
+            params["page_size"] = page_size
+        if fields:
+            params["fields"] = ",".join(fields)
+        return self._get_columns(url, "results", params)
+    
+    def get_histogram(self, dataset_id: int, x: str, y: Optional[str] = None,
+                      bins: Optional[str] = None, group_by: Optional[str] = None) -> Dict:
+        """Get binned counts of a field, or 2D counts of x against y, computed by the server"""
+        url = f"{self.base_url}/datasets/{dataset_id}/histogram/"
+        params = {"x": x}
+        if y:
+            params["y"] = y
+        if bins:
+            params["bins"] = bins
+        if group_by:
+            params["group_by"] = group_by
+        response, histogram = self._cached_get(url, self._get_headers(), lambda r: r.json(), params)
+        response.raise_for_status()
+        return histogram
+    
+    def get_downsampled(self, dataset_id: int, fields: Optional[List[str]] = None,
+                        points: int = 1000, method: str = "lttb") -> Dict:
+        """Get at most `points` points of each field over record order, chosen by the server"""
+        url = f"{self.base_url}/datasets/{dataset_id}/downsample/"
+        params = {"points": points, "method": method}
+        if fields:
+            params["fields"] = ",".join(fields)
+        response, downsampled = self._cached_get(url, self._get_headers(), lambda r: r.json(), params)
+        response.raise_for_status()
+        return downsampled
     
     def delete_dataset(self, dataset_id: int) -> Dict:
         """Delete dataset"""
@@ -2,11 +2,47 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                              QPushButton, QComboBox, QTableWidget, QTableWidgetItem,
                              QFileDialog, QMessageBox, QFrame, QScrollArea, QGridLayout,
                              QHeaderView)
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QFont
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
+import numpy as np
+
+
+# Points of the flowrate trend line; about the chart's width in pixels
+TREND_POINTS = 1000
+
+# Milliseconds between polls of a running ingest job
+JOB_POLL_INTERVAL = 1000
+
+
+class UploadWorker(QThread):
+    """Uploads a CSV file and follows its ingest job off the UI thread"""
+    
+    progress = pyqtSignal(int)
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, api_client, file_path):
+        super().__init__()
+        self.api_client = api_client
+        self.file_path = file_path
+    
+    def run(self):
+        try:
+            job = self.api_client.upload_csv(self.file_path, wait=False)
+            while job["state"] not in ("succeeded", "failed"):
+                self.progress.emit(job["rows_processed"])
+                self.msleep(JOB_POLL_INTERVAL)
+                job = self.api_client.get_job(job["id"])
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        if job["state"] == "failed":
+            self.failed.emit(job["error"] or "Ingest job failed")
+        else:
+            self.succeeded.emit(job)
 
 
 class DashboardWidget(QWidget):
@@ -19,6 +55,7 @@ class DashboardWidget(QWidget):
         self.api_client = api_client
         self.datasets = []
         self.current_dataset = None
+        self.upload_worker = None
         self.init_ui()
     
     def init_ui(self):
@@ -49,6 +86,13 @@ class DashboardWidget(QWidget):
         self.dataset_selector = self.create_dataset_selector()
         self.content_layout.addWidget(self.dataset_selector)
         
+        # Averages across uploads (shown from two datasets on)
+        self.trends_widget = QWidget()
+        self.trends_layout = QVBoxLayout(self.trends_widget)
+        self.trends_layout.setContentsMargins(0, 0, 0, 0)
+        self.trends_widget.hide()
+        self.content_layout.addWidget(self.trends_widget)
+        
         # Visualization area (initially hidden)
         self.viz_widget = QWidget()
         self.viz_layout = QVBoxLayout(self.viz_widget)
@@ -278,9 +322,59 @@ class DashboardWidget(QWidget):
                         f"{dataset['filename']} ({dataset['total_count']} items)",
                         dataset['id']
                     )
+            self.load_upload_trends()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to load datasets: {str(e)}")
     
+    def load_upload_trends(self):
+        """Chart average pressure and temperature across uploads"""
+        while self.trends_layout.count():
+            child = self.trends_layout.takeAt(0)
+            if child.widget():
+                child.widget().deleteLater()
+        if len(self.datasets) < 2:
+            self.trends_widget.hide()
+            return
+        
+        # One point per upload from the stored statistics; no records are read
+        series = self.api_client.get_trends(["pressure", "temperature"], ["mean"])["series"]
+        
+        card = QFrame()
+        card.setStyleSheet("""
+            QFrame {
+                background-color: white;
+                border-radius: 12px;
+                padding: 20px;
+            }
+        """)
+        layout = QVBoxLayout(card)
+        
+        title = QLabel("Drift Across Uploads")
+        title.setFont(QFont("Arial", 16, QFont.Bold))
+        layout.addWidget(title)
+        
+        fig = Figure(figsize=(14, 4))
+        ax = fig.add_subplot(1, 1, 1)
+        x = range(len(series))
+        ax.plot(x, [point['overall']['pressure']['mean'] for point in series],
+                marker='o', color='#764ba2', linewidth=2, label='Avg Pressure')
+        ax.set_ylabel('Pressure', fontweight='bold')
+        ax.set_xticks(list(x))
+        ax.set_xticklabels([point['filename'] for point in series], rotation=30, ha='right', fontsize=8)
+        ax.grid(True, alpha=0.3)
+        # Temperature on its own scale
+        ax2 = ax.twinx()
+        ax2.plot(x, [point['overall']['temperature']['mean'] for point in series],
+                 marker='s', color='#ef4444', linewidth=2, label='Avg Temperature')
+        ax2.set_ylabel('Temperature', fontweight='bold')
+        lines = ax.get_lines() + ax2.get_lines()
+        ax.legend(lines, [line.get_label() for line in lines], loc='upper left')
+        fig.tight_layout()
+        
+        layout.addWidget(FigureCanvas(fig))
+        self.trends_layout.addWidget(card)
+        self.trends_widget.show()
+    
     def handle_dataset_selection(self, index):
         """Handle dataset selection"""
         if index >= 0 and self.datasets:
@@ -299,20 +393,34 @@ class DashboardWidget(QWidget):
         )
         
         if file_path:
-            try:
-                self.upload_btn.setEnabled(False)
-                self.upload_btn.setText("Uploading...")
-                
-                self.api_client.upload_csv(file_path)
-                
-                QMessageBox.information(self, "Success", "File uploaded successfully!")
-                self.load_datasets()
-                
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Upload failed: {str(e)}")
-            finally:
-                self.upload_btn.setEnabled(True)
-                self.upload_btn.setText("Select & Upload CSV File")
+            self.upload_btn.setEnabled(False)
+            self.upload_btn.setText("Uploading...")
+            
+            # The transfer and the ingest job can take minutes: keep the UI responsive
+            self.upload_worker = UploadWorker(self.api_client, file_path)
+            self.upload_worker.progress.connect(self.handle_upload_progress)
+            self.upload_worker.succeeded.connect(self.handle_upload_succeeded)
+            self.upload_worker.failed.connect(self.handle_upload_failed)
+            self.upload_worker.finished.connect(self.handle_upload_finished)
+            self.upload_worker.start()
+    
+    def handle_upload_progress(self, rows_processed):
+        """Show how far the ingest job has got"""
+        self.upload_btn.setText(f"Processing... {rows_processed:,} rows")
+    
+    def handle_upload_succeeded(self, job):
+        """Handle a finished ingest job"""
+        QMessageBox.information(self, "Success", "File uploaded successfully!")
+        self.load_datasets()
+    
+    def handle_upload_failed(self, error):
+        """Handle a failed upload or ingest job"""
+        QMessageBox.critical(self, "Error", f"Upload failed: {error}")
+    
+    def handle_upload_finished(self):
+        """Re-enable the upload button"""
+        self.upload_btn.setEnabled(True)
+        self.upload_btn.setText("Select & Upload CSV File")
     
     def load_dataset_details(self):
         """Load and display dataset details"""
@@ -321,7 +429,13 @@ class DashboardWidget(QWidget):
             return
         
         try:
-            self.current_dataset = self.api_client.get_dataset_detail(dataset_id)
+            # Records arrive as NumPy arrays, one per field
+            self.current_dataset = self.api_client.get_dataset_columns(dataset_id)
+            # Binned on the server: a few KB whatever the dataset size
+            self.current_dataset['pressure_temperature'] = self.api_client.get_histogram(
+                dataset_id, 'pressure', y='temperature')
+            self.current_dataset['flowrate_trend'] = self.api_client.get_downsampled(
+                dataset_id, ['flowrate'], points=TREND_POINTS)['series']['flowrate']
             self.display_dataset_details()
             self.viz_widget.show()
         except Exception as e:
@@ -433,11 +547,12 @@ class DashboardWidget(QWidget):
         
         # Parameter Comparison (Bar Chart)
         ax2 = fig.add_subplot(2, 2, 2)
-        records = dataset['records'][:10]  # Show first 10 for readability
-        names = [r['equipment_name'] for r in records]
-        flowrates = [r['flowrate'] for r in records]
-        pressures = [r['pressure'] for r in records]
-        temperatures = [r['temperature'] for r in records]
+        records = dataset['records']
+        # Show first 10 for readability
+        names = records['equipment_name'][:10]
+        flowrates = records['flowrate'][:10]
+        pressures = records['pressure'][:10]
+        temperatures = records['temperature'][:10]
         
         x = range(len(names))
         width = 0.25
@@ -454,28 +569,30 @@ class DashboardWidget(QWidget):
         ax2.legend()
         ax2.grid(axis='y', alpha=0.3)
         
-        # Flowrate Trend (Line Chart)
+        # Flowrate Trend (Line Chart), downsampled by the server (LTTB)
         ax3 = fig.add_subplot(2, 2, 3)
-        all_names = [r['equipment_name'] for r in dataset['records']]
-        all_flowrates = [r['flowrate'] for r in dataset['records']]
-        ax3.plot(all_flowrates, marker='o', color='#667eea', linewidth=2, markersize=4)
+        trend = dataset['flowrate_trend']
+        # Markers only while every record is shown
+        marker = 'o' if len(trend['index']) == dataset['total_count'] else None
+        ax3.plot(trend['index'], trend['values'], marker=marker, color='#667eea', linewidth=2, markersize=4)
         ax3.set_xlabel('Equipment Index', fontweight='bold')
         ax3.set_ylabel('Flowrate', fontweight='bold')
         ax3.set_title('Flowrate Trend', fontweight='bold', fontsize=12)
         ax3.grid(True, alpha=0.3)
-        ax3.fill_between(range(len(all_flowrates)), all_flowrates, alpha=0.3, color='#667eea')
+        ax3.fill_between(trend['index'], trend['values'], alpha=0.3, color='#667eea')
         
-        # Pressure vs Temperature Scatter
+        # Pressure vs Temperature density (2D histogram)
         ax4 = fig.add_subplot(2, 2, 4)
-        all_pressures = [r['pressure'] for r in dataset['records']]
-        all_temperatures = [r['temperature'] for r in dataset['records']]
-        scatter = ax4.scatter(all_pressures, all_temperatures, c=all_flowrates, 
-                            cmap='viridis', s=100, alpha=0.6, edgecolors='black')
+        histogram = dataset['pressure_temperature']
+        if histogram['counts']:
+            # counts are indexed [pressure bin][temperature bin]; pcolormesh wants rows along y
+            counts = np.ma.masked_equal(np.asarray(histogram['counts']).T, 0)
+            mesh = ax4.pcolormesh(histogram['x']['edges'], histogram['y']['edges'], counts, cmap='viridis')
+            plt.colorbar(mesh, ax=ax4, label='Equipment count')
         ax4.set_xlabel('Pressure', fontweight='bold')
         ax4.set_ylabel('Temperature', fontweight='bold')
-        ax4.set_title('Pressure vs Temperature (colored by Flowrate)', fontweight='bold', fontsize=12)
+        ax4.set_title('Pressure vs Temperature (density)', fontweight='bold', fontsize=12)
         ax4.grid(True, alpha=0.3)
-        plt.colorbar(scatter, ax=ax4, label='Flowrate')
         
         fig.tight_layout()
         
@@ -510,14 +627,16 @@ class DashboardWidget(QWidget):
         table.setAlternatingRowColors(True)
         
         records = dataset['records']
-        table.setRowCount(len(records))
-        
-        for i, record in enumerate(records):
-            table.setItem(i, 0, QTableWidgetItem(record['equipment_name']))
-            table.setItem(i, 1, QTableWidgetItem(record['equipment_type']))
-            table.setItem(i, 2, QTableWidgetItem(f"{record['flowrate']:.2f}"))
-            table.setItem(i, 3, QTableWidgetItem(f"{record['pressure']:.2f}"))
-            table.setItem(i, 4, QTableWidgetItem(f"{record['temperature']:.2f}"))
+        table.setRowCount(len(records['flowrate']))
+        
+        rows = zip(records['equipment_name'], records['equipment_type'],
+                   records['flowrate'], records['pressure'], records['temperature'])
+        for i, (name, eq_type, flowrate, pressure, temperature) in enumerate(rows):
+            table.setItem(i, 0, QTableWidgetItem(str(name)))
+            table.setItem(i, 1, QTableWidgetItem(str(eq_type)))
+            table.setItem(i, 2, QTableWidgetItem(f"{flowrate:.2f}"))
+            table.setItem(i, 3, QTableWidgetItem(f"{pressure:.2f}"))
+            table.setItem(i, 4, QTableWidgetItem(f"{temperature:.2f}"))
         
         layout.addWidget(table)
         
@@ -5,6 +5,7 @@ import { datasetAPI } from '../../services/api';
 import UploadSection from './UploadSection';
 import DatasetList from './DatasetList';
 import DatasetDetail from './DatasetDetail';
+import UploadTrends from './UploadTrends';
 import './Dashboard.css';
 
 const Dashboard = () => {
@@ -154,6 +155,9 @@ const Dashboard = () => {
                 selectedDatasetId={selectedDataset?.id}
               />
 
+              {/* Averages across uploads */}
+              <UploadTrends datasets={datasets} />
+
               {/* Dataset Detail */}
               {selectedDataset && (
                 <DatasetDetail dataset={selectedDataset} />
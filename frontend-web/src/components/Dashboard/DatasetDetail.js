@@ -1,4 +1,4 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import {
   Chart as ChartJS,
   CategoryScale,
@@ -12,6 +12,7 @@ import {
   Legend,
 } from 'chart.js';
 import { Bar, Line, Pie } from 'react-chartjs-2';
+import { datasetAPI } from '../../services/api';
 
 ChartJS.register(
   CategoryScale,
@@ -25,7 +26,51 @@ ChartJS.register(
   Legend
 );
 
+const TYPE_COLORS = [
+  'rgba(102, 126, 234, 0.8)',
+  'rgba(118, 75, 162, 0.8)',
+  'rgba(16, 185, 129, 0.8)',
+  'rgba(245, 158, 11, 0.8)',
+  'rgba(239, 68, 68, 0.8)',
+  'rgba(59, 130, 246, 0.8)',
+];
+
+// Points per trend line; about the chart's width in pixels
+const TREND_POINTS = 800;
+
+const TREND_SERIES = [
+  { field: 'flowrate', label: 'Flowrate Trend', color: '102, 126, 234' },
+  { field: 'pressure', label: 'Pressure Trend', color: '118, 75, 162' },
+  { field: 'temperature', label: 'Temperature Trend', color: '16, 185, 129' },
+];
+
 const DatasetDetail = ({ dataset }) => {
+  // Chart data reduced by the server, so it stays small for any dataset size:
+  // the flowrate distribution as bins and the trends as LTTB-downsampled lines
+  const [flowrateHistogram, setFlowrateHistogram] = useState(null);
+  const [trends, setTrends] = useState(null);
+
+  useEffect(() => {
+    let cancelled = false;
+    setFlowrateHistogram(null);
+    setTrends(null);
+    datasetAPI
+      .getHistogram(dataset.id, { x: 'flowrate', group_by: 'equipment_type' })
+      .then((response) => {
+        if (!cancelled) setFlowrateHistogram(response.data);
+      })
+      .catch((err) => console.error(err));
+    datasetAPI
+      .getDownsampled(dataset.id, { points: TREND_POINTS })
+      .then((response) => {
+        if (!cancelled) setTrends(response.data);
+      })
+      .catch((err) => console.error(err));
+    return () => {
+      cancelled = true;
+    };
+  }, [dataset.id, dataset.total_count]);
+
   // Equipment Type Distribution Chart
   const typeLabels = Object.keys(dataset.equipment_types);
   const typeValues = Object.values(dataset.equipment_types);
@@ -90,34 +135,31 @@ const DatasetDetail = ({ dataset }) => {
     ],
   };
 
-  const lineChartData = {
-    labels: equipmentNames,
-    datasets: [
-      {
-        label: 'Flowrate Trend',
-        data: flowrates,
-        borderColor: 'rgba(102, 126, 234, 1)',
-        backgroundColor: 'rgba(102, 126, 234, 0.1)',
-        tension: 0.4,
-        fill: true,
-      },
-      {
-        label: 'Pressure Trend',
-        data: pressures,
-        borderColor: 'rgba(118, 75, 162, 1)',
-        backgroundColor: 'rgba(118, 75, 162, 0.1)',
-        tension: 0.4,
-        fill: true,
-      },
-      {
-        label: 'Temperature Trend',
-        data: temperatures,
-        borderColor: 'rgba(16, 185, 129, 1)',
-        backgroundColor: 'rgba(16, 185, 129, 0.1)',
-        tension: 0.4,
-        fill: true,
-      },
-    ],
+  // Points are (record position, value); each series keeps its own positions
+  const lineChartData = trends && {
+    datasets: TREND_SERIES.map(({ field, label, color }) => ({
+      label,
+      data: trends.series[field].index.map((x, i) => ({ x, y: trends.series[field].values[i] })),
+      borderColor: `rgba(${color}, 1)`,
+      backgroundColor: `rgba(${color}, 0.1)`,
+      pointRadius: trends.series[field].index.length < trends.total ? 0 : 3,
+      tension: 0.4,
+      fill: true,
+    })),
+  };
+
+  const histogramChartData = flowrateHistogram && {
+    labels: flowrateHistogram.x.edges.slice(0, -1).map(
+      (edge, i) => `${edge.toFixed(1)}–${flowrateHistogram.x.edges[i + 1].toFixed(1)}`
+    ),
+    datasets: Object.entries(flowrateHistogram.counts).map(([type, counts], i) => ({
+      label: type,
+      data: counts,
+      backgroundColor: TYPE_COLORS[i % TYPE_COLORS.length],
+      borderWidth: 0,
+      barPercentage: 1,
+      categoryPercentage: 1,
+    })),
   };
 
   const chartOptions = {
@@ -157,6 +199,22 @@ const DatasetDetail = ({ dataset }) => {
     },
   };
 
+  const trendOptions = {
+    ...chartOptions,
+    scales: {
+      ...chartOptions.scales,
+      x: { type: 'linear', grid: { display: false }, title: { display: true, text: 'Equipment Index' } },
+    },
+  };
+
+  const histogramOptions = {
+    ...chartOptions,
+    scales: {
+      x: { ...chartOptions.scales.x, stacked: true, title: { display: true, text: 'Flowrate' } },
+      y: { ...chartOptions.scales.y, stacked: true, title: { display: true, text: 'Equipment count' } },
+    },
+  };
+
   const pieOptions = {
     responsive: true,
     maintainAspectRatio: false,
@@ -243,10 +301,29 @@ const DatasetDetail = ({ dataset }) => {
           </div>
         </div>
 
+        <div className="card chart-card full-width">
+          <div className="card-header">Flowrate Distribution by Type</div>
+          <div className="chart-container">
+            {histogramChartData ? (
+              <Bar data={histogramChartData} options={histogramOptions} />
+            ) : (
+              <div className="loading-container">
+                <div className="spinner"></div>
+              </div>
+            )}
+          </div>
+        </div>
+
         <div className="card chart-card full-width">
           <div className="card-header">Parameter Trends (Line Chart)</div>
           <div className="chart-container">
-            <Line data={lineChartData} options={chartOptions} />
+            {lineChartData ? (
+              <Line data={lineChartData} options={trendOptions} />
+            ) : (
+              <div className="loading-container">
+                <div className="spinner"></div>
+              </div>
+            )}
           </div>
         </div>
       </div>
@@ -35,7 +35,8 @@ const UploadSection = ({ onUploadSuccess }) => {
     formData.append('file', file);
 
     try {
-      await datasetAPI.uploadCSV(formData);
+      const response = await datasetAPI.uploadCSV(formData);
+      await datasetAPI.waitForJob(response.data.id);
       setSuccess('File uploaded successfully!');
       setFile(null);
       // Reset file input
@@ -44,6 +45,7 @@ const UploadSection = ({ onUploadSuccess }) => {
     } catch (err) {
       setError(
         err.response?.data?.error || 
+        err.job?.error ||
         'Failed to upload file. Please check the format and try again.'
       );
     } finally {
@@ -0,0 +1,92 @@
+import React, { useEffect, useState } from 'react';
+import {
+  Chart as ChartJS,
+  CategoryScale,
+  LinearScale,
+  LineElement,
+  PointElement,
+  Tooltip,
+  Legend,
+} from 'chart.js';
+import { Line } from 'react-chartjs-2';
+import { datasetAPI } from '../../services/api';
+
+ChartJS.register(CategoryScale, LinearScale, LineElement, PointElement, Tooltip, Legend);
+
+const UPLOAD_TREND_SERIES = [
+  { field: 'pressure', label: 'Avg Pressure', color: '118, 75, 162', axis: 'y' },
+  { field: 'temperature', label: 'Avg Temperature', color: '239, 68, 68', axis: 'y1' },
+];
+
+const UploadTrends = ({ datasets }) => {
+  // One point per upload, built by the server from each dataset's stored statistics
+  const [series, setSeries] = useState(null);
+
+  // Refetch when an upload is added, removed or appended to
+  const uploadCount = datasets.length;
+  const versionKey = datasets.map((d) => `${d.id}:${d.total_count}`).join(',');
+
+  useEffect(() => {
+    let cancelled = false;
+    if (uploadCount < 2) return undefined;
+    datasetAPI
+      .getTrends({ fields: 'pressure,temperature', metrics: 'mean' })
+      .then((response) => {
+        if (!cancelled) setSeries(response.data.series);
+      })
+      .catch((err) => console.error(err));
+    return () => {
+      cancelled = true;
+    };
+  }, [uploadCount, versionKey]);
+
+  if (uploadCount < 2) return null;
+
+  const chartData = series && {
+    labels: series.map((point) => new Date(point.uploaded_at).toLocaleDateString()),
+    datasets: UPLOAD_TREND_SERIES.map(({ field, label, color, axis }) => ({
+      label,
+      data: series.map((point) => point.overall[field].mean),
+      borderColor: `rgba(${color}, 1)`,
+      backgroundColor: `rgba(${color}, 0.1)`,
+      yAxisID: axis,
+      pointRadius: 4,
+      tension: 0.3,
+    })),
+  };
+
+  const options = {
+    responsive: true,
+    maintainAspectRatio: false,
+    plugins: {
+      legend: { position: 'top' },
+      tooltip: {
+        callbacks: {
+          title: (items) => series[items[0].dataIndex].filename,
+        },
+      },
+    },
+    scales: {
+      x: { grid: { display: false } },
+      y: { position: 'left', title: { display: true, text: 'Pressure' } },
+      y1: { position: 'right', grid: { display: false }, title: { display: true, text: 'Temperature' } },
+    },
+  };
+
+  return (
+    <div className="card chart-card fade-in">
+      <div className="card-header">Drift Across Uploads</div>
+      <div className="chart-container">
+        {chartData ? (
+          <Line data={chartData} options={options} />
+        ) : (
+          <div className="loading-container">
+            <div className="spinner"></div>
+          </div>
+        )}
+      </div>
+    </div>
+  );
+};
+
+export default UploadTrends;
@@ -71,8 +71,24 @@ export const datasetAPI = {
       },
     });
   },
+  getJob: (jobId) => api.get(`/jobs/${jobId}/`),
+  waitForJob: async (jobId, pollInterval = 1000) => {
+    // Poll an ingest job until it succeeds or fails
+    for (;;) {
+      const { data: job } = await api.get(`/jobs/${jobId}/`);
+      if (job.state === 'succeeded') return job;
+      if (job.state === 'failed') throw Object.assign(new Error(job.error), { job });
+      await new Promise((resolve) => setTimeout(resolve, pollInterval));
+    }
+  },
   getDatasets: () => api.get('/datasets/'),
+  // Stored aggregates of every upload, oldest first, e.g. { fields: 'pressure', metrics: 'mean' }
+  getTrends: (params) => api.get('/datasets/trends/', { params }),
   getDatasetDetail: (id) => api.get(`/datasets/${id}/`),
+  // Binned counts computed by the server, e.g. { x: 'flowrate', group_by: 'equipment_type' }
+  getHistogram: (id, params) => api.get(`/datasets/${id}/histogram/`, { params }),
+  // At most `points` points per numeric field over record order (LTTB), e.g. { points: 500 }
+  getDownsampled: (id, params) => api.get(`/datasets/${id}/downsample/`, { params }),
   deleteDataset: (id) => api.delete(`/datasets/${id}/delete/`),
   downloadReport: (id) => {
     return api.get(`/datasets/${id}/report/`, {